@@ -27,6 +27,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+	"apps.analytics.middleware.MetricsMiddleware",
+	# Answers beacon (and async collect) requests ahead of the session/CSRF/auth stack
+	"apps.analytics.middleware.IngestMiddleware",
 	"django.middleware.security.SecurityMiddleware",
 	"whitenoise.middleware.WhiteNoiseMiddleware",
 	"corsheaders.middleware.CorsMiddleware",
@@ -37,6 +40,14 @@ MIDDLEWARE = [
 	"django.contrib.messages.middleware.MessageMiddleware",
 	"django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
+# WhiteNoise is sync-only, so under ASGI it would push every request through
+# the sync thread; turn it off there and serve static files elsewhere
+if os.getenv("SERVE_STATIC", "true").lower() != "true":
+	MIDDLEWARE.remove("whitenoise.middleware.WhiteNoiseMiddleware")
+# Per-route latency, query and cache metrics, served at /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+if not METRICS_ENABLED:
+	MIDDLEWARE.remove("apps.analytics.middleware.MetricsMiddleware")
 
 ROOT_URLCONF = "analytic_api.urls"
 
@@ -63,7 +74,7 @@ if DB_VENDOR == "sqlite":
 	DATABASES = {
 		"default": {
 			"ENGINE": "django.db.backends.sqlite3",
-			"NAME": BASE_DIR / "db.sqlite3",
+			"NAME": os.getenv("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
 		}
 	}
 else:
@@ -78,12 +89,12 @@ else:
 		}
 	}
 
-redis_url = os.getenv("REDIS_URL")
-if redis_url:
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
 	CACHES = {
 		"default": {
 			"BACKEND": "django_redis.cache.RedisCache",
-			"LOCATION": redis_url,
+			"LOCATION": REDIS_URL,
 			"OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
 			"KEY_PREFIX": "analytics",
 		}
@@ -135,6 +146,95 @@ REST_FRAMEWORK = {
 	},
 }
 
+# API key -> ClientApp resolution cache (seconds). Revoking or regenerating a key
+# clears the shared cache once the change commits. The per-process layer is off
+# by default; a positive API_KEY_CACHE_LOCAL_TTL saves the shared cache round trip
+# but lets other workers accept a revoked key for up to that many seconds.
+API_KEY_CACHE_TTL = int(os.getenv("API_KEY_CACHE_TTL", "300"))
+API_KEY_CACHE_NEGATIVE_TTL = int(os.getenv("API_KEY_CACHE_NEGATIVE_TTL", "30"))
+API_KEY_CACHE_LOCAL_TTL = float(os.getenv("API_KEY_CACHE_LOCAL_TTL", "0"))
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", "10000"))
+# Per-process cache of event name / device / URL dimension rows, in entries per
+# table; ingestion only queries the dimension tables for values not cached here
+EVENT_DICTIONARY_CACHE_SIZE = int(os.getenv("EVENT_DICTIONARY_CACHE_SIZE", "20000"))
+
+# Upper bound on events accepted by /api/analytics/collect/batch in one request
+COLLECT_BATCH_MAX_EVENTS = int(os.getenv("COLLECT_BATCH_MAX_EVENTS", "500"))
+# Validate plain JSON collect payloads with the cached EventValidator instead of
+# building an EventSerializer per event (same accept/reject decisions)
+COLLECT_FAST_VALIDATION = os.getenv("COLLECT_FAST_VALIDATION", "true").lower() == "true"
+# Route /api/analytics/collect to the native async view. Enable only when
+# serving through ASGI (uvicorn), together with SERVE_STATIC=false.
+COLLECT_ASYNC = os.getenv("COLLECT_ASYNC", "false").lower() == "true"
+
+# "sync" writes events inside the request; "queue" appends them to a write-behind
+# buffer (Redis list when REDIS_URL is set, on-disk spool otherwise) that
+# `python manage.py drain_events` flushes to the database in batches.
+INGEST_MODE = os.getenv("INGEST_MODE", "sync").lower()
+INGEST_QUEUE_KEY = os.getenv("INGEST_QUEUE_KEY", "analytics:ingest")
+INGEST_SPOOL_DIR = Path(os.getenv("INGEST_SPOOL_DIR", BASE_DIR / "spool"))
+INGEST_SPOOL_FSYNC = os.getenv("INGEST_SPOOL_FSYNC", "false").lower() == "true"
+# "inline" maintains the rollups, sketches, user profiles and activity bitmaps
+# in the collect request. "deferred" (opt-in; needs a drain_events worker) only
+# stores the events in the request and queues them (INGEST_AGGREGATE_QUEUE_KEY in
+# Redis, or a spool under INGEST_SPOOL_DIR) for drain_events to fold in batches;
+# those reads then trail ingestion by about one drain interval.
+INGEST_AGGREGATES = os.getenv("INGEST_AGGREGATES", "inline").lower()
+INGEST_AGGREGATE_QUEUE_KEY = os.getenv("INGEST_AGGREGATE_QUEUE_KEY", "analytics:aggregate")
+# Events with an event_id are deduplicated at ingest: a rotating Bloom filter
+# (in Redis when REDIS_URL is set, per process otherwise) remembers the ids of
+# the last one to two windows, so only possible repeats are looked up in the
+# database. Turning the filter off looks up every event_id instead.
+INGEST_DEDUP_FILTER = os.getenv("INGEST_DEDUP_FILTER", "true").lower() == "true"
+INGEST_DEDUP_WINDOW = int(os.getenv("INGEST_DEDUP_WINDOW", "86400"))
+INGEST_DEDUP_CAPACITY = int(os.getenv("INGEST_DEDUP_CAPACITY", "1000000"))
+INGEST_DEDUP_ERROR_RATE = float(os.getenv("INGEST_DEDUP_ERROR_RATE", "0.001"))
+INGEST_DEDUP_KEY = os.getenv("INGEST_DEDUP_KEY", "analytics:dedup")
+
+# Maintain hourly/daily EventRollup rows at ingest and answer event-summary from
+# them. Run `python manage.py rollup_events` once to backfill existing events.
+ANALYTICS_USE_ROLLUPS = os.getenv("ANALYTICS_USE_ROLLUPS", "true").lower() == "true"
+# event-summary switches uniqueUsers to the HyperLogLog estimate above this many
+# events unless the request passes approx=true/false explicitly
+ANALYTICS_APPROX_UNIQUE_THRESHOLD = int(os.getenv("ANALYTICS_APPROX_UNIQUE_THRESHOLD", "1000000"))
+# Keep Space-Saving/Count-Min sketches of url, referrer, browser and os per
+# rollup bucket; /api/analytics/top merges them for ranges above the threshold
+ANALYTICS_USE_TOP_SKETCHES = os.getenv("ANALYTICS_USE_TOP_SKETCHES", "true").lower() == "true"
+ANALYTICS_TOP_EXACT_THRESHOLD = int(os.getenv("ANALYTICS_TOP_EXACT_THRESHOLD", "100000"))
+
+# Serve user-stats from UserProfile rows upserted at ingest. Run
+# `python manage.py backfill_user_profiles` once to build them for existing events.
+ANALYTICS_USE_USER_PROFILES = os.getenv("ANALYTICS_USE_USER_PROFILES", "true").lower() == "true"
+# Maintain per-user daily activity bitmaps for /api/analytics/retention (from
+# drain_events unless INGEST_AGGREGATES=inline).
+# Run `python manage.py backfill_user_activity` once to build them for existing events.
+ANALYTICS_USE_USER_ACTIVITY = os.getenv("ANALYTICS_USE_USER_ACTIVITY", "true").lower() == "true"
+
+# Upper bound on buckets a bounded /api/analytics/timeseries request may span
+TIMESERIES_MAX_BUCKETS = int(os.getenv("TIMESERIES_MAX_BUCKETS", "50000"))
+
+# Default days of raw events kept by `prune_events` for apps without their own
+# ClientApp.retention_days; unset keeps events forever. On PostgreSQL the event
+# table is partitioned by month and `manage_partitions` creates partitions ahead.
+EVENT_RETENTION_DAYS = int(os.environ["EVENT_RETENTION_DAYS"]) if os.getenv("EVENT_RETENTION_DAYS") else None
+EVENT_PARTITIONS_AHEAD = int(os.getenv("EVENT_PARTITIONS_AHEAD", "3"))
+
+# event-summary / user-stats response cache (seconds). Entries are invalidated
+# by ingestion; after the TTL they are served stale for up to the stale TTL while
+# a single worker recomputes them.
+ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", "60"))
+ANALYTICS_CACHE_STALE_TTL = int(os.getenv("ANALYTICS_CACHE_STALE_TTL", "300"))
+ANALYTICS_CACHE_LOCK_TTL = int(os.getenv("ANALYTICS_CACHE_LOCK_TTL", "30"))
+
+# Bearer token required by /metrics; the endpoint answers 404 while it is unset
+# so the counters are never public by default. Multi-process aggregation for
+# gunicorn workers is enabled by PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py).
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Log requests slower than this many milliseconds, with their slowest SQL
+# statements. Unset disables the log and the per-query SQL capture.
+SLOW_REQUEST_MS = float(os.environ["SLOW_REQUEST_MS"]) if os.getenv("SLOW_REQUEST_MS") else None
+SLOW_REQUEST_LOG_QUERIES = int(os.getenv("SLOW_REQUEST_LOG_QUERIES", "20"))
+
 SPECTACULAR_SETTINGS = {
 	"TITLE": "Website Analytics API",
 	"DESCRIPTION": "Scalable analytics ingestion and aggregation API.",
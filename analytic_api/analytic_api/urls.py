@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from apps.analytics.metrics import metrics_view
 
 urlpatterns = [
 	path("admin/", admin.site.urls),
@@ -10,4 +12,5 @@ urlpatterns = [
 	path("api/analytics/", include("apps.analytics.urls")),
 ]
 
-
+if settings.METRICS_ENABLED:
+	urlpatterns.append(path("metrics", metrics_view, name="metrics"))
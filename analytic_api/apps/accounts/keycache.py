@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+
+# Stored in the shared cache for keys that do not resolve to an app
+INVALID = "invalid"
+
+
+class LocalLRU:
+	def __init__(self, maxsize, ttl):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key, default=None):
+		with self._lock:
+			entry = self._data.get(key)
+			if entry is None:
+				return default
+			expires, value = entry
+			if expires < time.monotonic():
+				del self._data[key]
+				return default
+			self._data.move_to_end(key)
+			return value
+
+	def set(self, key, value):
+		if self.ttl <= 0 or self.maxsize <= 0:
+			return
+		with self._lock:
+			self._data[key] = (time.monotonic() + self.ttl, value)
+			self._data.move_to_end(key)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+
+	def delete(self, key):
+		with self._lock:
+			self._data.pop(key, None)
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+
+
+_local = LocalLRU(
+	maxsize=getattr(settings, "API_KEY_CACHE_SIZE", 10000),
+	ttl=getattr(settings, "API_KEY_CACHE_LOCAL_TTL", 0),
+)
+
+
+def _cache_key(api_key):
+	return f"api-key:{api_key}"
+
+
+# Lookups go through a per-process LRU, then the shared Django cache, then the
+# database. Unknown keys are cached too so random keys cannot hammer the DB.
+# Invalidation (after the change commits) clears this process and the shared
+# cache; with API_KEY_CACHE_LOCAL_TTL > 0 other workers may serve their local
+# copy for up to that many seconds, so the local layer is off by default.
+def get_app_for_key(api_key):
+	from .models import ClientApp
+
+	app = _local.get(api_key)
+	if app is not None:
+		return None if app == INVALID else app
+	key = _cache_key(api_key)
+	app = cache.get(key)
+	if app is None:
+		try:
+			app = ClientApp.objects.get(api_key=api_key)
+			cache.set(key, app, timeout=getattr(settings, "API_KEY_CACHE_TTL", 300))
+		except ClientApp.DoesNotExist:
+			app = INVALID
+			cache.set(key, app, timeout=getattr(settings, "API_KEY_CACHE_NEGATIVE_TTL", 30))
+	_local.set(api_key, app)
+	return None if app == INVALID else app
+
+
+async def aget_app_for_key(api_key):
+	# Async twin of get_app_for_key for the ASGI collect view. With the default
+	# API_KEY_CACHE_LOCAL_TTL=0 every lookup reaches the shared cache (cache.aget,
+	# which Django's built-in backends run in a thread); a positive local TTL lets
+	# repeat keys be answered on the event loop, at the cost described above.
+	from .models import ClientApp
+
+	app = _local.get(api_key)
+	if app is not None:
+		return None if app == INVALID else app
+	key = _cache_key(api_key)
+	app = await cache.aget(key)
+	if app is None:
+		try:
+			app = await ClientApp.objects.aget(api_key=api_key)
+			await cache.aset(key, app, timeout=getattr(settings, "API_KEY_CACHE_TTL", 300))
+		except ClientApp.DoesNotExist:
+			app = INVALID
+			await cache.aset(key, app, timeout=getattr(settings, "API_KEY_CACHE_NEGATIVE_TTL", 30))
+	_local.set(api_key, app)
+	return None if app == INVALID else app
+
+
+def invalidate_api_key(api_key):
+	if not api_key:
+		return
+	_local.delete(api_key)
+	cache.delete(_cache_key(api_key))
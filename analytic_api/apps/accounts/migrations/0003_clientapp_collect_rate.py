@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:03
+
+import apps.accounts.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_clientapp_retention_days'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientapp',
+            name='collect_rate',
+            field=models.CharField(blank=True, default='', max_length=32, validators=[apps.accounts.models.validate_rate]),
+        ),
+    ]
@@ -1,8 +1,22 @@
 import secrets
+from functools import partial
 from datetime import timedelta
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
+from .keycache import invalidate_api_key
+
+
+def invalidate_on_commit(api_key):
+	# Dropped once the change is visible, so a concurrent lookup cannot cache the old row again
+	transaction.on_commit(partial(invalidate_api_key, api_key))
+
+
+def validate_rate(value):
+	num, _, period = value.partition("/")
+	if not num.isdigit() or int(num) < 1 or not period or period[0] not in "smhd":
+		raise ValidationError("Use <requests>/<second|minute|hour|day>, e.g. 100/second.")
 
 
 class ClientApp(models.Model):
@@ -11,6 +25,10 @@ class ClientApp(models.Model):
 	api_key = models.CharField(max_length=64, unique=True, db_index=True)
 	is_revoked = models.BooleanField(default=False)
 	expires_at = models.DateTimeField(null=True, blank=True)
+	# Days of raw events to keep; falls back to settings.EVENT_RETENTION_DAYS
+	retention_days = models.PositiveIntegerField(null=True, blank=True)
+	# Collect rate limit, e.g. "500/second"; blank uses COLLECT_THROTTLE_RATE
+	collect_rate = models.CharField(max_length=32, blank=True, default="", validators=[validate_rate])
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
@@ -18,6 +36,13 @@ class ClientApp(models.Model):
 		if not self.api_key:
 			self.api_key = secrets.token_hex(24)
 		super().save(*args, **kwargs)
+		invalidate_on_commit(self.api_key)
+
+	def delete(self, *args, **kwargs):
+		api_key = self.api_key
+		result = super().delete(*args, **kwargs)
+		invalidate_on_commit(api_key)
+		return result
 
 	def is_active(self) -> bool:
 		if self.is_revoked:
@@ -27,7 +52,9 @@ class ClientApp(models.Model):
 		return True
 
 	def regenerate_api_key(self):
+		old_key = self.api_key
 		self.api_key = secrets.token_hex(24)
 		self.save(update_fields=["api_key", "updated_at"])
+		invalidate_on_commit(old_key)
 
 
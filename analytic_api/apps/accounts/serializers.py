@@ -5,13 +5,15 @@ from .models import ClientApp
 class ClientAppSerializer(serializers.ModelSerializer):
 	class Meta:
 		model = ClientApp
-		fields = ["id", "name", "api_key", "is_revoked", "expires_at", "created_at", "updated_at"]
-		read_only_fields = ["id", "api_key", "created_at", "updated_at"]
+		fields = ["id", "name", "api_key", "is_revoked", "expires_at", "retention_days", "collect_rate", "created_at", "updated_at"]
+		# collect_rate is set by operators, not by app owners
+		read_only_fields = ["id", "api_key", "collect_rate", "created_at", "updated_at"]
 
 
 class RegisterAppSerializer(serializers.Serializer):
 	name = serializers.CharField(max_length=255)
 	expires_in_days = serializers.IntegerField(required=False, min_value=1, max_value=365)
+	retention_days = serializers.IntegerField(required=False, min_value=1)
 
 
 class RevokeSerializer(serializers.Serializer):
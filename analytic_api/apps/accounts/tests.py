@@ -1,6 +1,8 @@
 import pytest
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
+from apps.accounts.keycache import get_app_for_key
+from apps.accounts.models import ClientApp
 
 
 @pytest.mark.django_db
@@ -15,3 +17,29 @@ def test_register_and_get_api_key():
 	assert len(resp2.json()) == 1
 
 
+@pytest.mark.django_db
+def test_api_key_cache_is_invalidated_on_revoke_and_regenerate(
+	django_assert_num_queries, django_capture_on_commit_callbacks
+):
+	user = User.objects.create_user(username="u1", password="p1")
+	app = ClientApp.objects.create(owner=user, name="My App")
+	assert get_app_for_key(app.api_key).id == app.id
+	assert get_app_for_key("missing-key") is None
+	with django_assert_num_queries(0):
+		assert get_app_for_key(app.api_key).id == app.id
+		assert get_app_for_key("missing-key") is None
+
+	client = APIClient()
+	client.login(username="u1", password="p1")
+	old_key = app.api_key
+	with django_capture_on_commit_callbacks(execute=True) as callbacks:
+		resp = client.post("/api/auth/regenerate", {"app_id": app.id}, format="json")
+	# Invalidation waits for the commit, so a concurrent lookup cannot re-cache the old row
+	assert callbacks
+	new_key = resp.json()["api_key"]
+	assert get_app_for_key(old_key) is None
+	assert get_app_for_key(new_key).id == app.id
+
+	with django_capture_on_commit_callbacks(execute=True):
+		client.post("/api/auth/revoke", {"app_id": app.id}, format="json")
+	assert get_app_for_key(new_key).is_active() is False
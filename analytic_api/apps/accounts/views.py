@@ -24,7 +24,12 @@ class RegisterView(APIView):
 		expires_at = None
 		if expires_in_days:
 			expires_at = timezone.now() + timedelta(days=expires_in_days)
-		app = ClientApp.objects.create(owner=request.user, name=name, expires_at=expires_at)
+		app = ClientApp.objects.create(
+			owner=request.user,
+			name=name,
+			expires_at=expires_at,
+			retention_days=serializer.validated_data.get("retention_days"),
+		)
 		return Response(ClientAppSerializer(app).data, status=status.HTTP_201_CREATED)
 
 
@@ -5,4 +5,10 @@ class AnalyticsConfig(AppConfig):
 	default_auto_field = "django.db.models.BigAutoField"
 	name = "apps.analytics"
 
+	def ready(self):
+		from django.db.backends.signals import connection_created
+		from .metrics import install_query_recorder
+
+		connection_created.connect(install_query_recorder)
+
 
@@ -0,0 +1,54 @@
+import json
+import math
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import serializers
+from apps.accounts.keycache import aget_app_for_key
+from .ingest import aingest_events, apply_idempotency_key, prepare_event
+from .throttles import CollectThrottle
+
+# Native async version of CollectEventView for ASGI deployments (see
+# COLLECT_ASYNC). DRF views are sync, so under ASGI every request would be
+# handed to the sync thread; this view keeps key lookup, throttling,
+# validation and queue writes on the event loop. Responses match the DRF view.
+
+
+def _error(detail, status, headers=None):
+	return JsonResponse({"detail": detail}, status=status, headers=headers)
+
+
+@csrf_exempt
+async def collect_event(request):
+	if request.method != "POST":
+		return _error(f'Method "{request.method}" not allowed.', 405)
+	api_key = request.headers.get("X-API-KEY")
+	if not api_key:
+		return _error("Authentication credentials were not provided.", 403)
+	app = await aget_app_for_key(api_key)
+	if app is None:
+		return _error("Invalid API key.", 403)
+	if not app.is_active():
+		return _error("API key inactive.", 403)
+	request.client_app = app
+	throttle = CollectThrottle()
+	if not await throttle.aallow_request(request):
+		wait = throttle.wait()
+		return _error("Request was throttled.", 429, headers={"Retry-After": str(math.ceil(wait))} if wait else None)
+
+	if request.content_type in ("application/x-www-form-urlencoded", "multipart/form-data"):
+		data = request.POST
+	else:
+		try:
+			data = json.loads(request.body or b"{}")
+		except ValueError:
+			return _error("JSON parse error.", 400)
+		if not isinstance(data, dict):
+			return _error("Expected an object.", 400)
+	try:
+		validated = prepare_event(data, request.META.get("REMOTE_ADDR"))
+		apply_idempotency_key(validated, request.headers.get("Idempotency-Key"))
+	except serializers.ValidationError as exc:
+		return JsonResponse(exc.detail, status=400, safe=False)
+	if await aingest_events(app, [validated]):
+		return JsonResponse({"detail": "Event queued."}, status=202)
+	return JsonResponse({"detail": "Event accepted."}, status=201)
@@ -1,6 +1,6 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework import exceptions
-from apps.accounts.models import ClientApp
+from apps.accounts.keycache import get_app_for_key
 
 
 class ApiKeyAuthentication(BaseAuthentication):
@@ -10,9 +10,8 @@ class ApiKeyAuthentication(BaseAuthentication):
 		api_key = request.headers.get(self.keyword)
 		if not api_key:
 			return None
-		try:
-			app = ClientApp.objects.get(api_key=api_key)
-		except ClientApp.DoesNotExist:
+		app = get_app_for_key(api_key)
+		if app is None:
 			raise exceptions.AuthenticationFailed("Invalid API key.")
 		if not app.is_active():
 			raise exceptions.AuthenticationFailed("API key inactive.")
@@ -0,0 +1,100 @@
+import base64
+import json
+from django.http import HttpResponse, JsonResponse, QueryDict
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import serializers
+from apps.accounts.keycache import get_app_for_key
+from .ingest import get_batch_limit, ingest_events, prepare_batch, prepare_event
+from .throttles import BeaconThrottle
+
+# Collect endpoint for navigator.sendBeacon and <img> pixels. Both are CORS
+# "simple requests" (no custom headers, text/plain or form bodies), so the
+# browser sends them without a preflight. A JSON body is accepted as well,
+# either sent as text/plain or as application/json (which fetch() preflights;
+# the CORS middleware answers the OPTIONS request). The API key travels as
+# `key` in the query string or body. IngestMiddleware serves this path before
+# the rest of the middleware stack, so no session, CSRF, auth or messages work
+# is done.
+
+BEACON_PATH = "/api/analytics/beacon"
+# 1x1 transparent GIF
+PIXEL = base64.b64decode("R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+EVENT_PARAMS = ("event", "url", "referrer", "device", "ip_address", "timestamp", "user_id", "event_id")
+
+
+def _error(detail, status):
+	return JsonResponse({"detail": detail}, status=status)
+
+
+def _from_params(params):
+	item = {name: params[name] for name in EVENT_PARAMS if name in params}
+	if "metadata" in params:
+		try:
+			item["metadata"] = json.loads(params["metadata"])
+		except ValueError:
+			raise serializers.ValidationError({"metadata": ["Invalid JSON."]})
+	return item
+
+
+def parse_beacon(request):
+	# Returns (api_key, items); a JSON body may hold one event or a list
+	params = request.GET.copy()
+	body = request.body if request.method == "POST" else b""
+	payload = None
+	if body:
+		text = body.decode("utf-8", "replace").strip()
+		if request.content_type == "application/json" or text[:1] in ("{", "["):
+			try:
+				payload = json.loads(text)
+			except ValueError:
+				raise serializers.ValidationError({"detail": "Invalid JSON body."})
+			if isinstance(payload, dict) and "key" in payload:
+				params.setdefault("key", payload.pop("key"))
+		else:
+			params.update(QueryDict(text))
+	api_key = params.get("key")
+	if payload is None:
+		item = _from_params(params)
+		# A pixel embedded in a page reports that page unless told otherwise
+		if "url" not in item and request.META.get("HTTP_REFERER"):
+			item["url"] = request.META["HTTP_REFERER"]
+		return api_key, [item]
+	if isinstance(payload, list):
+		return api_key, payload
+	return api_key, [payload]
+
+
+@csrf_exempt
+def beacon(request):
+	if request.method not in ("GET", "POST"):
+		return _error("Method not allowed.", 405)
+	try:
+		api_key, items = parse_beacon(request)
+	except serializers.ValidationError as exc:
+		return _error(exc.detail, 400)
+	app = get_app_for_key(api_key) if api_key else None
+	if app is None or not app.is_active():
+		return _error("Invalid API key.", 403)
+	request.beacon_api_key = api_key
+	request.client_app = app
+	if not BeaconThrottle().allow_request(request, None):
+		return _error("Request was throttled.", 429)
+	if not items or len(items) > get_batch_limit():
+		return _error("Expected between 1 and %d events." % get_batch_limit(), 400)
+
+	remote_addr = request.META.get("REMOTE_ADDR")
+	if len(items) == 1 and isinstance(items[0], dict):
+		try:
+			valid = [prepare_event(items[0], remote_addr)]
+		except serializers.ValidationError as exc:
+			return _error(exc.detail, 400)
+	else:
+		valid, errors = prepare_batch(items, remote_addr)
+		if not valid:
+			return JsonResponse({"accepted": 0, "rejected": len(errors), "errors": errors}, status=400)
+	ingest_events(app, valid)
+	if request.method == "GET":
+		response = HttpResponse(PIXEL, content_type="image/gif")
+		response["Cache-Control"] = "no-store"
+		return response
+	return HttpResponse(status=204)
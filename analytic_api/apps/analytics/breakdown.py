@@ -0,0 +1,52 @@
+from collections import Counter
+from django.conf import settings
+from django.db.models import Count, Sum
+from . import dictionary, rollups
+from .dateranges import filter_range
+from .models import Event, EventRollup, EventTopSketch
+from .topk import merged_sketch, normalize_url
+
+# Top-N values of an event's url, referrer, browser or os. Small ranges are
+# counted exactly; large ones merge the daily TopSketch rows kept by rollups.
+# URLs are compared without their query string (see normalize_url).
+
+COLUMNS = {"url": dictionary.column("url"), "referrer": dictionary.column("referrer"), "browser": "meta_browser", "os": "meta_os"}
+
+
+def exact_top(app_ids, event, dimension, lo=None, hi=None, limit=10):
+	# GROUP BY the raw column, then fold values that normalize to the same key
+	column = COLUMNS[dimension]
+	qs = filter_range(dictionary.filter_value(Event.objects.filter(app_id__in=app_ids), "event", event), lo, hi)
+	counts = Counter()
+	total = 0
+	for value, n in qs.values_list(column).annotate(c=Count("id")).order_by().iterator():
+		total += n
+		key = normalize_url(value) if dimension in ("url", "referrer") else value
+		if key:
+			counts[key] += n
+	items = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+	return total, [{"value": value, "count": n} for value, n in items]
+
+
+def sketch_top(app_ids, event, dimension, lo=None, hi=None, limit=10):
+	sketches = filter_range(EventTopSketch.objects.filter(app_id__in=app_ids, event=event), lo, hi, field="bucket")
+	sketch = merged_sketch(sketches.values_list("sketches", flat=True).iterator(), dimension)
+	return [{"value": value, "count": n, "error": error} for value, n, error in sketch.top(limit)]
+
+
+def top_values(app_ids, event, dimension, lo=None, hi=None, limit=10, approx=None):
+	# approx=None uses the sketches once the range holds more than
+	# ANALYTICS_TOP_EXACT_THRESHOLD events; sketches need whole UTC days.
+	if not app_ids:
+		return {"total": 0, "approx": False, "items": []}
+	sketched = rollups.rollups_enabled() and rollups.top_sketches_enabled() and approx is not False
+	if sketched and rollups.granularity_for(lo, hi) == EventRollup.DAY:
+		counts = filter_range(
+			EventRollup.objects.filter(app_id__in=app_ids, event=event, granularity=EventRollup.DAY), lo, hi, field="bucket"
+		)
+		total = counts.aggregate(n=Sum("count"))["n"] or 0
+		if approx or total > getattr(settings, "ANALYTICS_TOP_EXACT_THRESHOLD", 100000):
+			items = sketch_top(app_ids, event, dimension, lo, hi, limit)
+			return {"total": total, "approx": True, "items": items}
+	total, items = exact_top(app_ids, event, dimension, lo, hi, limit)
+	return {"total": total, "approx": False, "items": items}
@@ -0,0 +1,162 @@
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from itertools import groupby, islice
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Event, UserActivity
+
+# Weekly retention cohorts from per-user activity bitmaps (see UserActivity).
+# Ingestion sets the bit of each event's UTC day; a cohort is every user whose
+# first active week is the same Monday, so their bitmaps line up bit for bit and
+# a whole cohort is unpacked into a users x days array and reduced per week.
+
+CHUNK_SIZE = 20000
+
+
+def activity_enabled():
+	return getattr(settings, "ANALYTICS_USE_USER_ACTIVITY", True)
+
+
+def week_monday(day):
+	return day - timedelta(days=day.weekday())
+
+
+def has_days(week_start, days, new_days):
+	for day in new_days:
+		offset = (day - week_start).days
+		if offset < 0 or offset // 8 >= len(days) or not days[offset // 8] >> (offset % 8) & 1:
+			return False
+	return True
+
+
+def merge_days(week_start, days, new_days):
+	# Returns (week_start, days) with new_days set. A day before the origin
+	# moves it back to that day's Monday and shifts the existing bits.
+	bits = int.from_bytes(days, "little")
+	first = week_monday(min(new_days))
+	if week_start is None or first < week_start:
+		if week_start is not None:
+			bits <<= (week_start - first).days
+		week_start = first
+	for day in new_days:
+		bits |= 1 << (day - week_start).days
+	return week_start, bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+
+
+def _activity_rows(keys):
+	by_app = defaultdict(list)
+	for app_id, user_id in keys:
+		by_app[app_id].append(user_id)
+	condition = Q()
+	for app_id, user_ids in by_app.items():
+		condition |= Q(app_id=app_id, user_id__in=user_ids)
+	return UserActivity.objects.filter(condition)
+
+
+def merge_activity(user_days):
+	# user_days: {(app_id, user_id): {day, ...}}; returns the app ids whose
+	# bitmaps changed. Most events fall on a day that is already set, so rows are
+	# read without a lock first and only the ones that change are locked and written.
+	existing = {(row.app_id, row.user_id): row for row in _activity_rows(user_days)}
+	pending = {
+		key: days
+		for key, days in user_days.items()
+		if key not in existing or not has_days(existing[key].week_start, bytes(existing[key].days), days)
+	}
+	if not pending:
+		return set()
+	UserActivity.objects.bulk_create(
+		[
+			UserActivity(app_id=app_id, user_id=user_id, week_start=week_monday(min(days)))
+			for (app_id, user_id), days in sorted(pending.items())
+			if (app_id, user_id) not in existing
+		],
+		ignore_conflicts=True,
+	)
+	rows = list(_activity_rows(pending).select_for_update().order_by("app_id", "user_id"))
+	for row in rows:
+		row.week_start, row.days = merge_days(row.week_start, bytes(row.days), pending[(row.app_id, row.user_id)])
+	UserActivity.objects.bulk_update(rows, ["week_start", "days"])
+	return {app_id for app_id, _ in pending}
+
+
+def apply_events(events):
+	# Called inside the aggregate transaction (see ingest._apply_aggregates)
+	if not activity_enabled():
+		return set()
+	user_days = defaultdict(set)
+	for e in events:
+		if e.user_id:
+			user_days[(e.app_id, e.user_id)].add(e.timestamp.astimezone(dt_timezone.utc).date())
+	return merge_activity(user_days) if user_days else set()
+
+
+def rebuild(app_ids=None, batch_size=2000):
+	# Recomputes bitmaps from raw events; the database returns each user's
+	# distinct days in (app, user_id) order, so memory stays bounded.
+	events = Event.objects.exclude(user_id="")
+	activity = UserActivity.objects.all()
+	if app_ids is not None:
+		events = events.filter(app_id__in=app_ids)
+		activity = activity.filter(app_id__in=app_ids)
+	rows = (
+		events.annotate(day=TruncDate("timestamp", tzinfo=dt_timezone.utc))
+		.values_list("app_id", "user_id", "day")
+		.distinct()
+		.order_by("app_id", "user_id")
+	)
+	written = 0
+	with transaction.atomic():
+		activity.delete()
+		batch = []
+		for (app_id, user_id), group in groupby(rows.iterator(chunk_size=5000), key=lambda row: row[:2]):
+			week_start, days = merge_days(None, b"", [row[2] for row in group])
+			batch.append(UserActivity(app_id=app_id, user_id=user_id, week_start=week_start, days=days))
+			if len(batch) >= batch_size:
+				UserActivity.objects.bulk_create(batch)
+				written += len(batch)
+				batch = []
+		UserActivity.objects.bulk_create(batch)
+		written += len(batch)
+	return written
+
+
+def active_weeks(bitmaps, weeks):
+	# Users of one cohort active in each of its first `weeks` weeks
+	width = weeks * 7
+	nbytes = (width + 7) // 8
+	packed = np.frombuffer(b"".join(bytes(days[:nbytes]).ljust(nbytes, b"\0") for days in bitmaps), dtype=np.uint8)
+	bits = np.unpackbits(packed.reshape(len(bitmaps), nbytes), axis=1, bitorder="little")[:, :width]
+	return bits.reshape(len(bitmaps), weeks, 7).any(axis=2).sum(axis=0)
+
+
+def retention(app_ids, first_week, last_week, weeks, today=None):
+	# One row per cohort (first active week between the two Mondays) with the
+	# number of its users active in each following week, up to the current week.
+	current = week_monday(today or timezone.now().date())
+	rows = (
+		UserActivity.objects.filter(app_id__in=app_ids, week_start__gte=first_week, week_start__lte=last_week)
+		.order_by("week_start")
+		.values_list("week_start", "days")
+		.iterator(chunk_size=CHUNK_SIZE)
+	)
+	cohorts = []
+	for week_start, group in groupby(rows, key=lambda row: row[0]):
+		span = max(1, min(weeks, (current - week_start).days // 7 + 1))
+		active = np.zeros(span, dtype=np.int64)
+		users = 0
+		bitmaps = (days for _, days in group)
+		while chunk := list(islice(bitmaps, CHUNK_SIZE)):
+			active += active_weeks(chunk, span)
+			users += len(chunk)
+		cohorts.append({
+			"week": week_start.isoformat(),
+			"users": users,
+			"retention": active.tolist(),
+			"rates": [round(n / users, 4) if users else 0.0 for n in active.tolist()],
+		})
+	return cohorts
@@ -0,0 +1,192 @@
+import json
+import uuid
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from pathlib import Path
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import dictionary
+from .dateranges import date_range
+from .models import Event
+
+# Columnar export of Event rows into <dest>/app_id=<id>/date=<YYYY-MM-DD>/
+# part-*.{parquet,arrow} (hive-style partitions, UTC days) plus an offline query
+# layer over those files. pyarrow is an optional dependency, imported lazily.
+
+WATERMARK_FILE = "_watermark.json"
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+COLUMNS = ["id", "event", "url", "referrer", "device", "ip_address", "timestamp", "metadata", "user_id", "created_at"]
+
+
+def require_pyarrow():
+	try:
+		import pyarrow  # noqa: F401
+	except ImportError:
+		raise RuntimeError("Columnar export requires pyarrow: pip install pyarrow")
+
+
+def event_schema():
+	import pyarrow as pa
+
+	return pa.schema(
+		[
+			("id", pa.int64()),
+			("event", pa.string()),
+			("url", pa.string()),
+			("referrer", pa.string()),
+			("device", pa.string()),
+			("ip_address", pa.string()),
+			("timestamp", pa.timestamp("us", tz="UTC")),
+			("metadata", pa.string()),
+			("user_id", pa.string()),
+			("created_at", pa.timestamp("us", tz="UTC")),
+		]
+	)
+
+
+def partitioning():
+	import pyarrow as pa
+	import pyarrow.dataset as ds
+
+	return ds.partitioning(pa.schema([("app_id", pa.int64()), ("date", pa.string())]), flavor="hive")
+
+
+def read_watermark(dest):
+	path = Path(dest) / WATERMARK_FILE
+	if not path.exists():
+		return None, 0
+	data = json.loads(path.read_text())
+	return parse_datetime(data["created_at"]), data["id"]
+
+
+def write_watermark(dest, created_at, last_id):
+	path = Path(dest) / WATERMARK_FILE
+	tmp = path.with_suffix(".tmp")
+	tmp.write_text(json.dumps({"created_at": created_at.isoformat(), "id": last_id}))
+	tmp.replace(path)
+
+
+def _write_part(dest, app_id, day, rows, fmt, run_id, seq):
+	import pyarrow as pa
+	import pyarrow.ipc as ipc
+	import pyarrow.parquet as pq
+
+	directory = Path(dest) / f"app_id={app_id}" / f"date={day.isoformat()}"
+	directory.mkdir(parents=True, exist_ok=True)
+	columns = {name: [row[i] for row in rows] for i, name in enumerate(COLUMNS)}
+	table = pa.Table.from_pydict(columns, schema=event_schema())
+	path = directory / f"part-{run_id}-{seq:05d}{FORMATS[fmt]}"
+	if fmt == "parquet":
+		pq.write_table(table, path, compression="zstd")
+	else:
+		options = ipc.IpcWriteOptions(compression="zstd")
+		with ipc.new_file(path, table.schema, options=options) as writer:
+			writer.write_table(table)
+	return path
+
+
+def export_events(dest, fmt="parquet", chunk_size=10000, max_buffered_rows=200000, lag_seconds=60):
+	# Exports events created after the stored (created_at, id) watermark and at
+	# least lag_seconds ago, so rows from still-open transactions are not skipped.
+	# Rows are fetched by keyset pagination and buffered per (app, day); all
+	# buffers are flushed to new part files once max_buffered_rows is reached,
+	# and the watermark only advances after a flush. A crash between a flush and
+	# the watermark write can export the same rows twice; readers dedupe on id.
+	require_pyarrow()
+	Path(dest).mkdir(parents=True, exist_ok=True)
+	created_at, last_id = read_watermark(dest)
+	run_id = uuid.uuid4().hex[:12]
+	buffers = defaultdict(list)
+	buffered = 0
+	seq = 0
+	exported = 0
+	pending_mark = None
+
+	def flush():
+		nonlocal buffered, seq
+		for (app_id, day), rows in buffers.items():
+			_write_part(dest, app_id, day, rows, fmt, run_id, seq)
+			seq += 1
+		buffers.clear()
+		buffered = 0
+		if pending_mark:
+			write_watermark(dest, *pending_mark)
+
+	fields = ["app_id", *COLUMNS]
+	horizon = timezone.now() - timedelta(seconds=lag_seconds)
+	while True:
+		qs = Event.objects.filter(created_at__lt=horizon).order_by("created_at", "id")
+		if created_at is not None:
+			qs = qs.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=last_id))
+		chunk = list(qs.values_list(*map(dictionary.column, fields))[:chunk_size])
+		if not chunk:
+			break
+		for app_id, *row in chunk:
+			row[COLUMNS.index("metadata")] = json.dumps(row[COLUMNS.index("metadata")] or {})
+			day = row[COLUMNS.index("timestamp")].astimezone(dt_timezone.utc).date()
+			buffers[(app_id, day)].append(row)
+		buffered += len(chunk)
+		exported += len(chunk)
+		last = chunk[-1]
+		created_at, last_id = last[fields.index("created_at")], last[fields.index("id")]
+		pending_mark = (created_at, last_id)
+		if buffered >= max_buffered_rows:
+			flush()
+	if buffered:
+		flush()
+	return exported
+
+
+def dataset(dest, fmt="parquet"):
+	import pyarrow.dataset as ds
+
+	return ds.dataset(
+		dest,
+		format="parquet" if fmt == "parquet" else "ipc",
+		partitioning=partitioning(),
+		exclude_invalid_files=False,
+		ignore_prefixes=["_", "."],
+	)
+
+
+def load_events(dest, app_ids, event=None, lo=None, hi=None, columns=None, fmt="parquet"):
+	import pyarrow.compute as pc
+	import pyarrow.dataset as ds
+
+	expr = ds.field("app_id").isin(list(app_ids))
+	if event is not None:
+		expr &= ds.field("event") == event
+	# Partition pruning on the UTC day directories, then the exact range
+	if lo is not None:
+		expr &= ds.field("date") >= lo.astimezone(dt_timezone.utc).date().isoformat()
+		expr &= ds.field("timestamp") >= lo
+	if hi is not None:
+		expr &= ds.field("date") <= hi.astimezone(dt_timezone.utc).date().isoformat()
+		expr &= ds.field("timestamp") < hi
+	table = dataset(dest, fmt).to_table(filter=expr, columns=columns)
+	if table.num_rows and "id" in table.column_names:
+		# At-least-once export may have written a row twice
+		unique = pc.unique(table["id"])
+		if len(unique) != table.num_rows:
+			table = table.group_by("id").aggregate([(name, "first") for name in table.column_names if name != "id"])
+			table = table.rename_columns([name.removesuffix("_first") for name in table.column_names])
+	return table
+
+
+def event_summary(dest, app_ids, event, start_date=None, end_date=None, tz=None, fmt="parquet"):
+	# Same result as summary.event_summary, computed with Arrow kernels
+	import pyarrow.compute as pc
+
+	lo, hi = date_range(start_date, end_date, tz)
+	table = load_events(dest, app_ids, event, lo, hi, columns=["id", "device", "user_id"], fmt=fmt)
+	users = pc.filter(table["user_id"], pc.not_equal(table["user_id"], ""))
+	device_data = {}
+	for item in pc.value_counts(table["device"]).to_pylist():
+		key = item["values"] or "unknown"
+		device_data[key] = device_data.get(key, 0) + item["counts"]
+	return {
+		"count": table.num_rows,
+		"uniqueUsers": pc.count_distinct(users).as_py() if len(users) else 0,
+		"deviceData": device_data,
+	}
@@ -0,0 +1,40 @@
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.utils import timezone
+
+
+def get_zone(name=None):
+	if not name:
+		return timezone.get_current_timezone()
+	try:
+		return ZoneInfo(name)
+	except (ZoneInfoNotFoundError, ValueError):
+		raise ValueError(f"Unknown timezone: {name}")
+
+
+def local_midnight(day, tz):
+	return datetime.combine(day, time.min).replace(tzinfo=tz)
+
+
+def date_range(start_date=None, end_date=None, tz=None):
+	# Inclusive calendar dates in `tz` -> half-open [lo, hi) instants. Filtering
+	# with timestamp >= lo AND timestamp < hi lets the (app, event, timestamp)
+	# index serve a range scan, unlike timestamp__date which casts the column.
+	tz = tz or timezone.get_current_timezone()
+	lo = local_midnight(start_date, tz) if start_date else None
+	hi = local_midnight(end_date + timedelta(days=1), tz) if end_date else None
+	return lo, hi
+
+
+def filter_range(qs, lo, hi, field="timestamp"):
+	if lo is not None:
+		qs = qs.filter(**{f"{field}__gte": lo})
+	if hi is not None:
+		qs = qs.filter(**{f"{field}__lt": hi})
+	return qs
+
+
+def is_aligned(value, step):
+	if value is None:
+		return True
+	return value.timestamp() % step.total_seconds() == 0
@@ -0,0 +1,205 @@
+import hashlib
+import math
+import threading
+import time
+from functools import lru_cache
+from django.conf import settings
+from .models import Event
+
+# Drops retried events that carry a client event_id (idempotency key). Every key
+# goes through a time-windowed Bloom filter at accept time: a miss proves the key
+# is new, so the common case costs no database read. Only keys the filter may
+# have seen (real retries plus ~INGEST_DEDUP_ERROR_RATE false positives) are
+# looked up in the event table before they are stored. The filter keeps two
+# generations of INGEST_DEDUP_WINDOW seconds, so a key is remembered for at
+# least one window. Older retries are caught by the unique index only when they
+# resend the original timestamp.
+
+# KEYS[1] current generation bitmap, KEYS[2] previous one; ARGV: TTL in
+# milliseconds, bit positions per key, then the positions of every key.
+# Returns 1 per key whose bits were all set in either generation.
+ROTATING_BLOOM_LUA = """
+local hashes = tonumber(ARGV[2])
+local seen = {}
+for i = 0, (#ARGV - 2) / hashes - 1 do
+	local current, previous = 1, 1
+	for j = 1, hashes do
+		local offset = ARGV[2 + i * hashes + j]
+		if redis.call('SETBIT', KEYS[1], offset, 1) == 0 then
+			current = 0
+		end
+		if previous == 1 and redis.call('GETBIT', KEYS[2], offset) == 0 then
+			previous = 0
+		end
+	end
+	seen[i + 1] = math.max(current, previous)
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[1])
+return seen
+"""
+
+
+def filter_enabled():
+	return getattr(settings, "INGEST_DEDUP_FILTER", True)
+
+
+def bloom_size(capacity, error_rate):
+	# (bits, hashes) for `capacity` keys at `error_rate` false positives
+	bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+	return bits, max(1, round(bits / capacity * math.log(2)))
+
+
+def bit_offsets(key, bits, hashes):
+	# Kirsch-Mitzenmacher double hashing over one 128-bit digest
+	digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+	h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+	return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+def dedup_key(app_id, event_id):
+	return f"{app_id}:{event_id}"
+
+
+class LocalRotatingBloom:
+	# Per-process filter for deployments without Redis: retries that land on
+	# another worker are only caught by the database checks in store_events.
+	def __init__(self, window, capacity, error_rate):
+		self.window = window
+		self.bits, self.hashes = bloom_size(capacity, error_rate)
+		self.lock = threading.Lock()
+		self.generation = None
+		self.current = self.previous = None
+
+	def _rotate(self, generation):
+		if generation == self.generation:
+			return
+		size = (self.bits + 7) // 8
+		self.previous = self.current if self.generation == generation - 1 else bytearray(size)
+		self.current = bytearray(size)
+		self.generation = generation
+
+	def check_and_add(self, keys):
+		# Adds every key; returns whether each may have been added before
+		seen = []
+		with self.lock:
+			self._rotate(int(time.time() // self.window))
+			current, previous = self.current, self.previous
+			for key in keys:
+				in_current = in_previous = True
+				for offset in bit_offsets(key, self.bits, self.hashes):
+					byte, mask = offset >> 3, 1 << (offset & 7)
+					if not current[byte] & mask:
+						in_current = False
+						current[byte] |= mask
+					if in_previous and not previous[byte] & mask:
+						in_previous = False
+				seen.append(in_current or in_previous)
+		return seen
+
+	async def acheck_and_add(self, keys):
+		return self.check_and_add(keys)
+
+
+class RedisRotatingBloom:
+	# One bitmap per generation shared by every worker; a generation lives for
+	# two windows, so the previous one is still there while the current fills.
+	def __init__(self, url, prefix, window, capacity, error_rate):
+		import redis
+
+		self.url = url
+		self.prefix = prefix
+		self.window = window
+		self.bits, self.hashes = bloom_size(capacity, error_rate)
+		self.script = redis.Redis.from_url(url).register_script(ROTATING_BLOOM_LUA)
+		self._async = None
+
+	def _call(self, keys):
+		generation = int(time.time() // self.window)
+		redis_keys = [f"{self.prefix}:{generation}", f"{self.prefix}:{generation - 1}"]
+		args = [self.window * 2000, self.hashes]
+		for key in keys:
+			args += bit_offsets(key, self.bits, self.hashes)
+		return redis_keys, args
+
+	def check_and_add(self, keys):
+		redis_keys, args = self._call(keys)
+		return [bool(flag) for flag in self.script(keys=redis_keys, args=args)]
+
+	def _async_script(self):
+		# redis.asyncio connections belong to the loop that opened them
+		import asyncio
+		import redis.asyncio
+
+		loop = asyncio.get_running_loop()
+		if self._async is None or self._async[0] is not loop:
+			self._async = (loop, redis.asyncio.Redis.from_url(self.url).register_script(ROTATING_BLOOM_LUA))
+		return self._async[1]
+
+	async def acheck_and_add(self, keys):
+		redis_keys, args = self._call(keys)
+		return [bool(flag) for flag in await self._async_script()(keys=redis_keys, args=args)]
+
+
+@lru_cache(maxsize=1)
+def get_dedup_filter():
+	window = settings.INGEST_DEDUP_WINDOW
+	capacity = settings.INGEST_DEDUP_CAPACITY
+	error_rate = settings.INGEST_DEDUP_ERROR_RATE
+	if settings.REDIS_URL:
+		return RedisRotatingBloom(settings.REDIS_URL, settings.INGEST_DEDUP_KEY, window, capacity, error_rate)
+	return LocalRotatingBloom(window, capacity, error_rate)
+
+
+def unique_items(items):
+	# Drops repeats of an event_id within one batch, keeping the first
+	kept, ids = [], set()
+	for item in items:
+		event_id = item.get("event_id")
+		if event_id:
+			if event_id in ids:
+				continue
+			ids.add(event_id)
+		kept.append(item)
+	return kept
+
+
+def _keyed(items):
+	return [item["event_id"] for item in items if item.get("event_id")]
+
+
+def _suspects(event_ids, seen):
+	return {event_id for event_id, flag in zip(event_ids, seen) if flag}
+
+
+def screen(app_id, items):
+	# Returns (items, suspects): the batch without in-batch repeats, and the
+	# event_ids that may already be stored and have to be checked. With the
+	# filter off every event_id is checked.
+	items = unique_items(items)
+	event_ids = _keyed(items)
+	if not event_ids or not filter_enabled():
+		return items, set(event_ids)
+	seen = get_dedup_filter().check_and_add([dedup_key(app_id, event_id) for event_id in event_ids])
+	return items, _suspects(event_ids, seen)
+
+
+async def ascreen(app_id, items):
+	items = unique_items(items)
+	event_ids = _keyed(items)
+	if not event_ids or not filter_enabled():
+		return items, set(event_ids)
+	seen = await get_dedup_filter().acheck_and_add([dedup_key(app_id, event_id) for event_id in event_ids])
+	return items, _suspects(event_ids, seen)
+
+
+def stored_ids(app_id, event_ids):
+	if not event_ids:
+		return set()
+	return set(Event.objects.filter(app_id=app_id, event_id__in=list(event_ids)).values_list("event_id", flat=True))
+
+
+def drop_stored(app_id, items, event_ids=None):
+	# Drops items whose event_id is already stored, checking only `event_ids`
+	# (every keyed item when None)
+	stored = stored_ids(app_id, _keyed(items) if event_ids is None else event_ids)
+	return [item for item in items if item.get("event_id") not in stored] if stored else items
@@ -0,0 +1,153 @@
+import threading
+from collections import OrderedDict, defaultdict
+from functools import partial
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Coalesce
+from .models import DeviceName, EventName, Url
+
+# Event stores its repetitive strings (event name, device, url, referrer) as
+# ids into dimension tables. Each process keeps a bounded value -> row cache per
+# table, so a warm ingest resolves a batch without queries; misses cost one
+# SELECT per table, plus an INSERT .. ON CONFLICT DO NOTHING for new values.
+# Rows are never updated or deleted, so a cached row stays valid forever. It is
+# only cached once the transaction that read it commits, so a rolled back
+# insert cannot leave a dangling id in the cache.
+
+
+class Dictionary:
+	def __init__(self, model, maxsize, hashed=False):
+		# hashed: the table is unique on value_hash (model.hash(value)), not value
+		self.model = model
+		self.maxsize = maxsize
+		self.hashed = hashed
+		self._rows = OrderedDict()
+		self._lock = threading.Lock()
+
+	def _cached(self, value):
+		with self._lock:
+			row = self._rows.get(value)
+			if row is not None:
+				self._rows.move_to_end(value)
+			return row
+
+	def _remember(self, rows):
+		with self._lock:
+			for row in rows:
+				self._rows[row.value] = row
+				self._rows.move_to_end(row.value)
+			while len(self._rows) > self.maxsize:
+				self._rows.popitem(last=False)
+
+	def _lookup(self, values):
+		if self.hashed:
+			return self.model.objects.filter(value_hash__in=[self.model.hash(value) for value in values])
+		return self.model.objects.filter(value__in=values)
+
+	def _new(self, value):
+		if self.hashed:
+			return self.model(value=value, value_hash=self.model.hash(value))
+		return self.model(value=value)
+
+	def rows(self, values, create=True):
+		# {value: row} for the non-blank values; unknown ones are inserted unless create=False
+		found, missing = {}, set()
+		for value in values:
+			if not value or value in found:
+				continue
+			row = self._cached(value)
+			if row is None:
+				missing.add(value)
+			else:
+				found[value] = row
+		if missing:
+			fetched = {row.value: row for row in self._lookup(missing)}
+			new = missing - fetched.keys()
+			if new and create:
+				self.model.objects.bulk_create([self._new(value) for value in new], ignore_conflicts=True)
+				fetched.update((row.value, row) for row in self._lookup(new))
+			# Outside an atomic block on_commit runs the callback at once, which is
+			# right: the rows read or inserted above are already committed
+			transaction.on_commit(partial(self._remember, list(fetched.values())))
+			found.update(fetched)
+		return found
+
+	def row(self, value, create=True):
+		return self.rows([value], create).get(value)
+
+	def find(self, value):
+		# Id of a known value, or None; lookups never insert
+		row = self.row(value, create=False)
+		return row.id if row is not None else None
+
+	def clear(self):
+		with self._lock:
+			self._rows.clear()
+
+
+_size = getattr(settings, "EVENT_DICTIONARY_CACHE_SIZE", 20000)
+event_names = Dictionary(EventName, _size)
+devices = Dictionary(DeviceName, _size)
+urls = Dictionary(Url, _size, hashed=True)
+
+
+def clear_caches():
+	for dictionary in (event_names, devices, urls):
+		dictionary.clear()
+
+
+# Event API field -> (foreign key, dictionary)
+FIELDS = {
+	"event": ("event_ref", event_names),
+	"url": ("url_ref", urls),
+	"referrer": ("referrer_ref", urls),
+	"device": ("device_ref", devices),
+}
+
+
+def encode_items(items):
+	# Validated events with their strings swapped for dimension rows, ready for
+	# Event(**item): one query per table at most, none once the cache is warm.
+	# Called before the ingest transaction, so new rows commit (and cache) at once.
+	values = defaultdict(set)
+	for field, (_, dictionary) in FIELDS.items():
+		values[dictionary].update(item.get(field) for item in items)
+	rows = {dictionary: dictionary.rows(batch) for dictionary, batch in values.items()}
+	encoded = []
+	for item in items:
+		item = dict(item)
+		for field, (ref, dictionary) in FIELDS.items():
+			value = item.pop(field, None)
+			item[ref] = rows[dictionary][value] if value else None
+		encoded.append(item)
+	return encoded
+
+
+def column(field):
+	# An Event field for values()/values_list(): encoded fields are read back as
+	# their string (through a join on the dimension table), blank when unset
+	if field not in FIELDS:
+		return field
+	value = F(f"{FIELDS[field][0]}__value")
+	return value if field == "event" else Coalesce(value, Value(""), output_field=CharField())
+
+
+def decoded(*fields):
+	# values() keyword arguments reading encoded fields under their API names
+	return {field: column(field) for field in fields}
+
+
+def filter_value(qs, field, value):
+	# Events whose `field` equals the string `value`; an unknown value matches nothing
+	ref, dictionary = FIELDS[field]
+	if not value:
+		return qs.filter(**{f"{ref}__isnull": True})
+	ref_id = dictionary.find(value)
+	return qs.filter(**{ref: ref_id}) if ref_id is not None else qs.none()
+
+
+def filter_values(qs, field, values):
+	ref, dictionary = FIELDS[field]
+	ids = [row.id for row in dictionary.rows(values, create=False).values()]
+	return qs.filter(**{f"{ref}__in": ids})
@@ -0,0 +1,100 @@
+import base64
+import csv
+import json
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from . import dictionary
+from .models import Event
+
+EXPORT_FIELDS = ["id", "app_id", "event", "url", "referrer", "device", "ip_address", "timestamp", "metadata", "user_id"]
+EXPORT_COLUMNS = [dictionary.column(field) for field in EXPORT_FIELDS]
+
+
+def encode_cursor(timestamp, pk):
+	return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{pk}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+	try:
+		raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+		timestamp, pk = raw.rsplit("|", 1)
+		timestamp = parse_datetime(timestamp)
+		if timestamp is None:
+			raise ValueError
+		return timestamp, int(pk)
+	except (ValueError, UnicodeDecodeError):
+		raise ValueError("Invalid cursor.")
+
+
+def after(qs, cursor, descending=False):
+	# Keyset condition on (timestamp, id); each page is an index range scan
+	# however deep into the export it is.
+	if cursor is None:
+		return qs
+	timestamp, pk = cursor
+	if descending:
+		return qs.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+	return qs.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk))
+
+
+def iter_rows(qs, cursor=None, limit=None, page_size=2000):
+	qs = qs.order_by("timestamp", "id")
+	remaining = limit
+	while remaining is None or remaining > 0:
+		size = page_size if remaining is None else min(page_size, remaining)
+		page = list(after(qs, cursor).values_list(*EXPORT_COLUMNS)[:size])
+		if not page:
+			return
+		for row in page:
+			yield row
+		if remaining is not None:
+			remaining -= len(page)
+		last = page[-1]
+		cursor = (last[EXPORT_FIELDS.index("timestamp")], last[0])
+		if len(page) < size:
+			return
+
+
+def read_page(qs, cursor, limit):
+	# One `limit`-row page, read before the response starts so the key of its
+	# last row can go in the X-Next-Cursor header; one extra row tells whether
+	# there is a next page. Returns (rows, next cursor or None).
+	rows = list(iter_rows(qs, cursor, limit + 1))
+	if len(rows) <= limit:
+		return rows, None
+	last = rows[limit - 1]
+	return rows[:limit], encode_cursor(last[EXPORT_FIELDS.index("timestamp")], last[0])
+
+
+def list_page(qs, cursor=None, limit=100):
+	# Newest first; returns (records, next cursor or None)
+	rows = list(after(qs.order_by("-timestamp", "-id"), cursor, descending=True).values_list(*EXPORT_COLUMNS)[:limit + 1])
+	more = len(rows) > limit
+	rows = rows[:limit]
+	token = encode_cursor(rows[-1][EXPORT_FIELDS.index("timestamp")], rows[-1][0]) if more else None
+	return [_record(row) for row in rows], token
+
+
+def _record(row):
+	record = dict(zip(EXPORT_FIELDS, row))
+	record["timestamp"] = record["timestamp"].isoformat()
+	return record
+
+
+def ndjson_lines(rows):
+	for row in rows:
+		yield json.dumps(_record(row), separators=(",", ":")) + "\n"
+
+
+class _Echo:
+	def write(self, value):
+		return value
+
+
+def csv_lines(rows):
+	writer = csv.writer(_Echo())
+	yield writer.writerow(EXPORT_FIELDS)
+	for row in rows:
+		record = _record(row)
+		record["metadata"] = json.dumps(record["metadata"], separators=(",", ":"))
+		yield writer.writerow([record[field] for field in EXPORT_FIELDS])
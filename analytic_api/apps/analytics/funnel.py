@@ -0,0 +1,125 @@
+from itertools import groupby
+from django.db import connection
+from . import dictionary
+from .dateranges import filter_range
+from .models import Event
+
+# Ordered funnel conversion per (app, user_id), as ClickHouse's windowFunnel:
+# a user reaches step j when they have events for steps 0..j in that order and
+# step j happens at most `window` after the step-0 event that started the chain.
+# Per step only the latest chain start matters (it leaves the most time for the
+# next step) and those starts only move forward, so an ordered pass over each
+# user's events keeping one start per step finds the deepest step reached.
+#
+# PostgreSQL computes it in one query: the start carried into step j is a running
+# MAX over the user's earlier step j-1 rows, i.e. one window column per step,
+# all sharing the same sort. Elsewhere the rows are streamed in (app, user_id,
+# timestamp) order, which the (app, user_id) index serves, and folded in Python.
+# Steps are matched on event name ids (see dictionary.py), so neither path joins
+# the names table; a step naming an unknown event is never reached.
+
+
+def _step_ids(steps):
+	rows = dictionary.event_names.rows(steps, create=False)
+	return [rows[event].id if event in rows else None for event in steps]
+
+
+def _events(app_ids, step_ids, lo, hi):
+	qs = Event.objects.filter(app_id__in=app_ids, event_ref__in={i for i in step_ids if i is not None})
+	return filter_range(qs.exclude(user_id=""), lo, hi).order_by()
+
+
+def _step_positions(step_ids):
+	# event id -> its step indexes, highest first, so one event row cannot
+	# advance a funnel that repeats an event by two steps at once
+	positions = {}
+	for index, event in enumerate(step_ids):
+		positions.setdefault(event, []).insert(0, index)
+	return positions
+
+
+def stream_depths(app_ids, steps, window, lo=None, hi=None):
+	# Yields the number of steps reached by each user with any funnel event
+	step_ids = _step_ids(steps)
+	positions = _step_positions(step_ids)
+	rows = (
+		_events(app_ids, step_ids, lo, hi)
+		.order_by("app_id", "user_id", "timestamp", "id")
+		.values_list("app_id", "user_id", "event_ref", "timestamp")
+		.iterator(chunk_size=5000)
+	)
+	for _, user_rows in groupby(rows, key=lambda row: row[:2]):
+		starts = [None] * len(steps)
+		for _, _, event, ts in user_rows:
+			for index in positions[event]:
+				if index == 0:
+					starts[0] = ts
+				elif starts[index - 1] is not None and ts - starts[index - 1] <= window:
+					starts[index] = starts[index - 1]
+		yield sum(1 for start in starts if start is not None)
+
+
+def _epoch(column):
+	if connection.vendor == "postgresql":
+		return f"EXTRACT(EPOCH FROM {column})"
+	return f"((julianday({column}) - 2440587.5) * 86400.0)"
+
+
+def sql_depth_counts(app_ids, steps, window, lo=None, hi=None):
+	# {steps reached: users}, computed in the database
+	qn = connection.ops.quote_name
+	step_ids = _step_ids(steps)
+	if step_ids[0] is None:
+		return {}
+	base, params = (
+		_events(app_ids, step_ids, lo, hi)
+		.values("app_id", "user_id", "event_ref", "timestamp", "id")
+		.query.sql_with_params()
+	)
+	ts = _epoch(qn("timestamp"))
+	event = qn("event_ref_id")
+	ctes = [f"f0 AS (SELECT e.*, {ts} AS ts, CASE WHEN {event} = %s THEN {ts} END AS c0 FROM ({base}) e)"]
+	params = [step_ids[0], *params]
+	for index in range(1, len(steps)):
+		previous = f"MAX(c{index - 1}) OVER w"
+		ctes.append(
+			f"f{index} AS (SELECT f{index - 1}.*, "
+			f"CASE WHEN {event} = %s AND ts - {previous} <= %s THEN {previous} END AS c{index} "
+			f"FROM f{index - 1} WINDOW w AS (PARTITION BY {qn('app_id')}, {qn('user_id')} "
+			f"ORDER BY {qn('timestamp')}, {qn('id')} ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING))"
+		)
+		params += [step_ids[index], window.total_seconds()]
+	depth = " ".join(f"WHEN c{index} IS NOT NULL THEN {index + 1}" for index in reversed(range(len(steps))))
+	sql = (
+		f"WITH {', '.join(ctes)} SELECT depth, COUNT(*) FROM ("
+		f"SELECT MAX(CASE {depth} ELSE 0 END) AS depth FROM f{len(steps) - 1} "
+		f"GROUP BY {qn('app_id')}, {qn('user_id')}) d GROUP BY depth"
+	)
+	with connection.cursor() as cursor:
+		cursor.execute(sql, params)
+		return dict(cursor.fetchall())
+
+
+def funnel(app_ids, steps, window, lo=None, hi=None):
+	reached = [0] * len(steps)
+	if app_ids:
+		if connection.vendor == "postgresql":
+			depth_counts = sql_depth_counts(app_ids, steps, window, lo, hi)
+		else:
+			depth_counts = {}
+			for depth in stream_depths(app_ids, steps, window, lo, hi):
+				depth_counts[depth] = depth_counts.get(depth, 0) + 1
+		for depth, users in depth_counts.items():
+			for index in range(depth):
+				reached[index] += users
+	result = []
+	for index, event in enumerate(steps):
+		users = reached[index]
+		previous = reached[index - 1] if index else reached[0]
+		result.append({
+			"event": event,
+			"users": users,
+			"conversion": round(users / reached[0], 4) if reached[0] else 0.0,
+			"stepConversion": round(users / previous, 4) if previous else 0.0,
+		})
+	return result
@@ -0,0 +1,77 @@
+import hashlib
+import math
+import zlib
+
+DEFAULT_PRECISION = 12
+
+
+class HyperLogLog:
+	# Dense HyperLogLog over 64-bit blake2b hashes. With the default precision of
+	# 12 (4096 one-byte registers) the relative standard error is ~1.6%.
+	# Sketches with the same precision merge by taking the register-wise max, so
+	# per-bucket/per-app sketches can be combined into any range.
+
+	def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+		if not 4 <= precision <= 16:
+			raise ValueError("precision must be between 4 and 16")
+		self.precision = precision
+		self.m = 1 << precision
+		self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+		if len(self.registers) != self.m:
+			raise ValueError("register count does not match precision")
+
+	@staticmethod
+	def hash(value):
+		return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+	def add(self, value):
+		h = self.hash(value)
+		p = self.precision
+		index = h >> (64 - p)
+		rest = h & ((1 << (64 - p)) - 1)
+		rank = (64 - p) - rest.bit_length() + 1
+		if rank > self.registers[index]:
+			self.registers[index] = rank
+
+	def update(self, values):
+		for value in values:
+			self.add(value)
+		return self
+
+	def merge(self, other):
+		if other.precision != self.precision:
+			raise ValueError("cannot merge sketches with different precision")
+		self.registers = bytearray(map(max, self.registers, other.registers))
+		return self
+
+	def estimate(self):
+		m = self.m
+		alpha = 0.7213 / (1 + 1.079 / m)
+		total = math.fsum(2.0 ** -r for r in self.registers)
+		raw = alpha * m * m / total
+		zeros = self.registers.count(0)
+		if raw <= 2.5 * m and zeros:
+			return m * math.log(m / zeros)
+		return raw
+
+	def __len__(self):
+		return round(self.estimate())
+
+	@property
+	def relative_error(self):
+		return 1.04 / math.sqrt(self.m)
+
+	def to_bytes(self):
+		return bytes([self.precision]) + zlib.compress(bytes(self.registers))
+
+	@classmethod
+	def from_bytes(cls, data):
+		data = bytes(data)
+		return cls(precision=data[0], registers=zlib.decompress(data[1:]))
+
+	@classmethod
+	def merged(cls, blobs, precision=DEFAULT_PRECISION):
+		sketch = cls(precision)
+		for blob in blobs:
+			sketch.merge(cls.from_bytes(blob))
+		return sketch
@@ -0,0 +1,226 @@
+from collections import defaultdict
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+from apps.accounts.models import ClientApp
+from . import cohorts, dedup, dictionary, profiles, responsecache, rollups
+from .models import DrainCheckpoint, Event
+from .metrics import observe_duplicates, observe_ingest
+from .queue import aggregates_deferred, decode_record, get_aggregate_queue, get_ingest_queue, queue_enabled
+from .serializers import EventSerializer
+from .validation import fast_validation_enabled, get_validator
+
+# Event fields the rollups, sketches, profiles and activity bitmaps read, plus
+# the id drain_aggregates recognizes replayed records by
+AGGREGATE_FIELDS = ("id", "event", "timestamp", "user_id", "device", "url", "referrer", "metadata", "ip_address")
+AGGREGATE_CHECKPOINT = "aggregate"
+
+
+def get_batch_limit():
+	return getattr(settings, "COLLECT_BATCH_MAX_EVENTS", 500)
+
+
+def prepare_event(data, remote_addr=None):
+	# Plain JSON objects go through the cached validator; form data and anything
+	# it rejects take the serializer path, which builds the error details
+	if type(data) is dict and fast_validation_enabled():
+		validated = get_validator().validate(data, remote_addr)
+		if validated is not None:
+			return validated
+	return validate_with_serializer(data, remote_addr)
+
+
+def validate_with_serializer(data, remote_addr=None):
+	data = data.copy()
+	# Default timestamp to now if not provided
+	if "timestamp" in data and isinstance(data["timestamp"], str):
+		# Ensure ISO string to datetime
+		try:
+			ts = parse_datetime(data["timestamp"])
+		except Exception:
+			ts = None
+		if ts is None:
+			raise serializers.ValidationError({"detail": "Invalid timestamp."})
+		data["timestamp"] = ts
+	else:
+		data["timestamp"] = timezone.now()
+	# capture IP if not provided
+	if not data.get("ip_address"):
+		data["ip_address"] = remote_addr
+	serializer = EventSerializer(data=data)
+	serializer.is_valid(raise_exception=True)
+	return serializer.validated_data
+
+
+def apply_idempotency_key(validated, key):
+	# Idempotency-Key header of single-event collect; an event_id in the body wins.
+	# Without a timestamp in the body, concurrent retries are not covered by the
+	# unique index (see Event.Meta.constraints).
+	if key and not validated.get("event_id"):
+		if len(key) > Event._meta.get_field("event_id").max_length:
+			raise serializers.ValidationError({"detail": "Idempotency-Key is too long."})
+		validated["event_id"] = key
+	return validated
+
+
+def prepare_batch(items, remote_addr=None):
+	# Each item is validated on its own so one bad event does not reject the whole batch
+	valid, errors = [], []
+	for index, item in enumerate(items):
+		if not isinstance(item, dict):
+			errors.append({"index": index, "errors": {"detail": "Expected an object."}})
+			continue
+		try:
+			valid.append(prepare_event(item, remote_addr))
+		except serializers.ValidationError as exc:
+			errors.append({"index": index, "errors": exc.detail})
+	return valid, errors
+
+
+def _insert(app, items):
+	# A concurrent request may store the same event_id between the dedup check
+	# and this insert; the unique index rejects the batch, so drop what is
+	# stored now and insert the rest once more
+	events = [Event(app=app, **item) for item in items]
+	try:
+		with transaction.atomic():
+			Event.objects.bulk_create(events)
+	except IntegrityError:
+		items = dedup.drop_stored(app.id, items)
+		observe_duplicates(app, len(events) - len(items))
+		events = [Event(app=app, **item) for item in items]
+		Event.objects.bulk_create(events)
+	return events
+
+
+def _apply_aggregates(events):
+	# Rollups, sketches, user profiles and activity bitmaps of stored events;
+	# returns the scopes of the cached responses read from them
+	rollups.apply_events(events)
+	profiles.apply_events(events)
+	active_apps = cohorts.apply_events(events)
+	return (
+		{responsecache.event_scope(e.app_id, e.event) for e in events}
+		| {responsecache.user_scope(e.app_id, e.user_id) for e in events if e.user_id}
+		| {responsecache.activity_scope(app_id) for app_id in active_apps}
+	)
+
+
+def store_events(app, items, defer=False):
+	# defer=True queues the stored events for drain_events to fold into the aggregates
+	if not items:
+		return []
+	items = dictionary.encode_items(items)
+	with transaction.atomic():
+		events = _insert(app, items)
+		if not events:
+			return events
+		# Summaries over ranges the rollups do not cover read the raw events
+		scopes = {responsecache.event_scope(app.id, e.event) for e in events}
+		if defer:
+			records = [aggregate_record(e) for e in events]
+			transaction.on_commit(partial(get_aggregate_queue().push, app.id, records))
+		else:
+			scopes |= _apply_aggregates(events)
+	responsecache.bump_versions(scopes)
+	return events
+
+
+def aggregate_record(event):
+	# What the aggregates read from a stored event, for the aggregate queue
+	return {field: getattr(event, field) for field in AGGREGATE_FIELDS}
+
+
+def _screened(app, items, result):
+	screened, suspects = result
+	observe_duplicates(app, len(items) - len(screened))
+	return screened, suspects
+
+
+def _store_new(app, items, suspects):
+	new = dedup.drop_stored(app.id, items, suspects) if suspects else items
+	observe_duplicates(app, len(items) - len(new))
+	store_events(app, new, defer=aggregates_deferred())
+	return len(new)
+
+
+def ingest_events(app, items):
+	# Returns True when the events were buffered for the drain worker rather than
+	# stored. Retries (a repeated event_id) are dropped and still reported as
+	# accepted; queued ones are checked against the database by the drainer.
+	items, suspects = _screened(app, items, dedup.screen(app.id, items))
+	if queue_enabled():
+		get_ingest_queue().push(app.id, items)
+		observe_ingest(app, len(items), True)
+		return True
+	observe_ingest(app, _store_new(app, items, suspects), False)
+	return False
+
+
+async def aingest_events(app, items):
+	# Queue mode stays on the event loop; direct writes need a transaction,
+	# which the async ORM does not offer, so they run in the sync thread
+	items, suspects = _screened(app, items, await dedup.ascreen(app.id, items))
+	if queue_enabled():
+		await get_ingest_queue().apush(app.id, items)
+		observe_ingest(app, len(items), True)
+		return True
+	observe_ingest(app, await sync_to_async(_store_new)(app, items, suspects), False)
+	return False
+
+
+def _read_by_app(queue, batch_size):
+	# (raw records, {app: [item, ...]}); events of apps deleted since they were
+	# queued are dropped
+	raw = queue.read(batch_size)
+	by_app = defaultdict(list)
+	for line in raw:
+		app_id, item = decode_record(line)
+		by_app[app_id].append(item)
+	apps = ClientApp.objects.in_bulk(list(by_app))
+	return raw, {apps[app_id]: items for app_id, items in by_app.items() if app_id in apps}
+
+
+def drain_queue(queue, batch_size):
+	raw, by_app = _read_by_app(queue, batch_size)
+	if not raw:
+		return 0
+	for app, items in by_app.items():
+		for start in range(0, len(items), batch_size):
+			# Queued retries skipped the database check at accept time
+			batch = dedup.unique_items(items[start:start + batch_size])
+			store_events(app, dedup.drop_stored(app.id, batch))
+	queue.ack(len(raw))
+	return len(raw)
+
+
+def drain_aggregates(queue, batch_size):
+	# Folds events stored with INGEST_AGGREGATES=deferred into the aggregates in
+	# one transaction per read. The queue redelivers records whose ack did not
+	# happen, so the same transaction adds their event ids to the checkpoint,
+	# and they leave it once acked: a record read again after a crash between
+	# the commit and the ack is skipped instead of counted twice. Assumes a
+	# single drainer.
+	raw, by_app = _read_by_app(queue, batch_size)
+	if not raw:
+		return 0
+	read_ids = {item["id"] for items in by_app.values() for item in items if item.get("id")}
+	scopes = set()
+	with transaction.atomic():
+		checkpoint, _ = DrainCheckpoint.objects.select_for_update().get_or_create(name=AGGREGATE_CHECKPOINT)
+		applied = set(checkpoint.event_ids)
+		for app, items in by_app.items():
+			items = [item for item in items if item.get("id") not in applied]
+			for start in range(0, len(items), batch_size):
+				batch = dictionary.encode_items(items[start:start + batch_size])
+				scopes |= _apply_aggregates([Event(app=app, **item) for item in batch])
+		checkpoint.event_ids = sorted(applied | read_ids)
+		checkpoint.save()
+	responsecache.bump_versions(scopes)
+	queue.ack(len(raw))
+	DrainCheckpoint.objects.filter(name=AGGREGATE_CHECKPOINT).update(event_ids=sorted(applied - read_ids))
+	return len(raw)
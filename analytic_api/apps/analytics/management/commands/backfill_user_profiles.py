@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from apps.analytics import profiles
+
+
+class Command(BaseCommand):
+	help = "Rebuild per-user profiles (user-stats) from raw events."
+
+	def add_arguments(self, parser):
+		parser.add_argument("--app-id", type=int, action="append", dest="app_ids")
+		parser.add_argument("--batch-size", type=int, default=2000)
+
+	def handle(self, *args, **options):
+		written = profiles.rebuild(app_ids=options["app_ids"], batch_size=options["batch_size"])
+		self.stdout.write(f"Wrote {written} user profiles.")
@@ -0,0 +1,54 @@
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from apps.analytics.ingest import drain_aggregates, drain_queue
+from apps.analytics.queue import get_aggregate_queue, get_ingest_queue
+
+STATS_CACHE_KEY = "ingest:drain-stats"
+
+
+class Command(BaseCommand):
+	help = (
+		"Flush events buffered by INGEST_MODE=queue into the Event table, and fold events stored with "
+		"INGEST_AGGREGATES=deferred into the aggregates, in batches."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("--batch-size", type=int, default=5000)
+		parser.add_argument("--interval", type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+		parser.add_argument("--once", action="store_true", help="Drain the current backlog and exit.")
+		parser.add_argument("--stats", action="store_true", help="Print the backlog depth and exit.")
+
+	def handle(self, *args, **options):
+		queue = get_ingest_queue()
+		aggregate_queue = get_aggregate_queue()
+		if options["stats"]:
+			self.stdout.write(f"backlog={queue.depth()} aggregate_backlog={aggregate_queue.depth()}")
+			return
+		batch_size = options["batch_size"]
+		while True:
+			started = time.monotonic()
+			flushed = 0
+			while True:
+				n = drain_queue(queue, batch_size) + drain_aggregates(aggregate_queue, batch_size)
+				flushed += n
+				if n == 0:
+					break
+			elapsed = time.monotonic() - started
+			if flushed:
+				stats = {
+					"flushed": flushed,
+					"seconds": round(elapsed, 3),
+					"rate": round(flushed / elapsed, 1) if elapsed else None,
+					"backlog": queue.depth(),
+					"aggregate_backlog": aggregate_queue.depth(),
+					"at": time.time(),
+				}
+				cache.set(STATS_CACHE_KEY, stats, timeout=None)
+				self.stdout.write(
+					f"flushed={stats['flushed']} seconds={stats['seconds']} rate={stats['rate']}/s "
+					f"backlog={stats['backlog']} aggregate_backlog={stats['aggregate_backlog']}"
+				)
+			if options["once"]:
+				return
+			time.sleep(options["interval"])
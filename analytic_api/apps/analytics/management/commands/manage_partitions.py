@@ -0,0 +1,20 @@
+from datetime import date
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.analytics import partitions
+
+
+class Command(BaseCommand):
+	help = "Create monthly Event partitions ahead of time (PostgreSQL only)."
+
+	def add_arguments(self, parser):
+		parser.add_argument("--months-ahead", type=int, default=settings.EVENT_PARTITIONS_AHEAD)
+		parser.add_argument("--start", type=date.fromisoformat, help="First month to ensure; defaults to the current one.")
+
+	def handle(self, *args, **options):
+		if not partitions.is_partitioned():
+			raise CommandError("The event table is not partitioned (partitioning requires PostgreSQL).")
+		start = options["start"] or timezone.now().date()
+		names = partitions.ensure_partitions(start, options["months_ahead"])
+		self.stdout.write(f"Ensured {len(names)} partitions: {', '.join(names)}")
@@ -0,0 +1,35 @@
+import json
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from apps.analytics import columnar
+from apps.analytics.dateranges import get_zone
+
+
+class Command(BaseCommand):
+	help = "Compute an event summary from files written by export_events, without touching the database."
+
+	def add_arguments(self, parser):
+		parser.add_argument("dest")
+		parser.add_argument("--event", required=True)
+		parser.add_argument("--app-id", type=int, action="append", dest="app_ids", required=True)
+		parser.add_argument("--start", type=date.fromisoformat)
+		parser.add_argument("--end", type=date.fromisoformat)
+		parser.add_argument("--tz")
+		parser.add_argument("--format", choices=sorted(columnar.FORMATS), default="parquet")
+
+	def handle(self, *args, **options):
+		try:
+			columnar.require_pyarrow()
+			tz = get_zone(options["tz"])
+		except (RuntimeError, ValueError) as exc:
+			raise CommandError(str(exc))
+		summary = columnar.event_summary(
+			options["dest"],
+			options["app_ids"],
+			options["event"],
+			options["start"],
+			options["end"],
+			tz=tz,
+			fmt=options["format"],
+		)
+		self.stdout.write(json.dumps({"event": options["event"], **summary}))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from apps.analytics.retention import prune
+
+
+class Command(BaseCommand):
+	help = (
+		"Apply per-app event retention. Whole monthly partitions past every app's cutoff are "
+		"dropped on PostgreSQL; the remainder is deleted in primary-key batches."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("--batch-size", type=int, default=5000)
+		parser.add_argument("--dry-run", action="store_true")
+
+	def handle(self, *args, **options):
+		report = prune(batch_size=options["batch_size"], dry_run=options["dry_run"])
+		prefix = "Would drop" if options["dry_run"] else "Dropped"
+		self.stdout.write(f"{prefix} partitions: {', '.join(report['dropped_partitions']) or 'none'}")
+		self.stdout.write(f"Events deleted: {report['deleted_events']}; aggregate rows deleted: {report['deleted_aggregates']}")
@@ -0,0 +1,24 @@
+from datetime import date, timezone as dt_timezone
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from apps.analytics import rollups
+from apps.analytics.models import Event
+
+
+class Command(BaseCommand):
+	help = "Rebuild hourly/daily event rollups from raw events for whole UTC days."
+
+	def add_arguments(self, parser):
+		parser.add_argument("--start", type=date.fromisoformat, help="First day (YYYY-MM-DD); defaults to the oldest event.")
+		parser.add_argument("--end", type=date.fromisoformat, help="Last day (YYYY-MM-DD); defaults to the newest event.")
+		parser.add_argument("--app-id", type=int, action="append", dest="app_ids")
+
+	def handle(self, *args, **options):
+		bounds = Event.objects.aggregate(lo=Min("timestamp"), hi=Max("timestamp"))
+		if bounds["lo"] is None:
+			self.stdout.write("No events to roll up.")
+			return
+		start = options["start"] or bounds["lo"].astimezone(dt_timezone.utc).date()
+		end = options["end"] or bounds["hi"].astimezone(dt_timezone.utc).date()
+		rollups.rebuild(start, end, app_ids=options["app_ids"])
+		self.stdout.write(f"Rebuilt rollups for {start} .. {end}.")
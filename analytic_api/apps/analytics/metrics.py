@@ -0,0 +1,158 @@
+import logging
+import os
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.crypto import constant_time_compare
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+# Prometheus metrics for the API. Under gunicorn set PROMETHEUS_MULTIPROC_DIR
+# (before the workers start, see gunicorn.conf.py): every worker then writes
+# its samples to files there and /metrics aggregates all of them.
+
+logger = logging.getLogger("apps.analytics.slow_requests")
+
+REQUEST_LATENCY = Histogram(
+	"analytics_http_request_duration_seconds",
+	"Request latency by route pattern.",
+	["method", "route", "status"],
+)
+REQUEST_QUERIES = Histogram(
+	"analytics_http_request_db_queries",
+	"Database queries issued per request.",
+	["route"],
+	buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+REQUEST_DB_TIME = Histogram(
+	"analytics_http_request_db_seconds",
+	"Time spent in database queries per request.",
+	["route"],
+)
+SLOW_REQUESTS = Counter(
+	"analytics_slow_requests_total",
+	"Requests slower than SLOW_REQUEST_MS.",
+	["route"],
+)
+RESPONSE_CACHE = Counter(
+	"analytics_response_cache_total",
+	"event-summary / user-stats response cache lookups by outcome (hit, stale, miss).",
+	["cache", "state"],
+)
+INGESTED_EVENTS = Counter(
+	"analytics_ingested_events_total",
+	"Events accepted per app; mode is stored (written in the request) or queued.",
+	["app_id", "mode"],
+)
+DUPLICATE_EVENTS = Counter(
+	"analytics_duplicate_events_total",
+	"Events dropped at ingest because their event_id was already accepted.",
+	["app_id"],
+)
+
+
+class RequestStats:
+	__slots__ = ("queries", "db_seconds", "sql")
+
+	def __init__(self, capture_sql):
+		self.queries = 0
+		self.db_seconds = 0.0
+		# (seconds, sql) per query, only kept when the slow-request log is on
+		self.sql = [] if capture_sql else None
+
+
+# A context variable rather than a thread-local: sync_to_async copies the
+# context into the worker thread, so queries made there still count toward
+# the async request that awaited them.
+_current = ContextVar("analytics_request_stats", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+	stats = _current.get()
+	if stats is None:
+		return execute(sql, params, many, context)
+	started = time.perf_counter()
+	try:
+		return execute(sql, params, many, context)
+	finally:
+		elapsed = time.perf_counter() - started
+		stats.queries += 1
+		stats.db_seconds += elapsed
+		if stats.sql is not None:
+			stats.sql.append((elapsed, sql))
+
+
+def install_query_recorder(sender, connection, **kwargs):
+	# connection_created fires again on reconnect; the wrapper list survives it
+	if record_query not in connection.execute_wrappers:
+		connection.execute_wrappers.append(record_query)
+
+
+def route_label(request):
+	# The URL pattern, not the path, so label cardinality stays bounded.
+	# Beacon and async collect are answered before URL resolution runs.
+	match = request.resolver_match
+	if match is None:
+		try:
+			match = resolve(request.path_info)
+		except Resolver404:
+			return "unmatched"
+	return match.route or "unmatched"
+
+
+def start_request():
+	stats = RequestStats(settings.SLOW_REQUEST_MS is not None)
+	return stats, _current.set(stats), time.perf_counter()
+
+
+def finish_request(request, response, stats, token, started):
+	elapsed = time.perf_counter() - started
+	_current.reset(token)
+	route = route_label(request)
+	REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(elapsed)
+	REQUEST_QUERIES.labels(route).observe(stats.queries)
+	REQUEST_DB_TIME.labels(route).observe(stats.db_seconds)
+	threshold = settings.SLOW_REQUEST_MS
+	if threshold is not None and elapsed * 1000 >= threshold:
+		SLOW_REQUESTS.labels(route).inc()
+		slowest = sorted(stats.sql, key=lambda q: q[0], reverse=True)[:settings.SLOW_REQUEST_LOG_QUERIES]
+		logger.warning(
+			"slow request %s %s (%s) %.1fms status=%s queries=%d db=%.1fms%s",
+			request.method,
+			request.path,
+			route,
+			elapsed * 1000,
+			response.status_code,
+			stats.queries,
+			stats.db_seconds * 1000,
+			"".join(f"\n  {seconds * 1000:.1f}ms {sql}" for seconds, sql in slowest),
+		)
+
+
+def observe_cache(key, state):
+	# Keys look like "event-summary:..." / "user-stats:..."
+	RESPONSE_CACHE.labels(key.split(":", 1)[0], state).inc()
+
+
+def observe_ingest(app, count, queued):
+	INGESTED_EVENTS.labels(str(app.id), "queued" if queued else "stored").inc(count)
+
+
+def observe_duplicates(app, count):
+	if count:
+		DUPLICATE_EVENTS.labels(str(app.id)).inc(count)
+
+
+def metrics_view(request):
+	# Nothing is served until a token is configured
+	token = settings.METRICS_TOKEN
+	if not token:
+		return HttpResponse(status=404)
+	if not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+		return HttpResponse(status=401)
+	registry = REGISTRY
+	if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+		registry = CollectorRegistry()
+		multiprocess.MultiProcessCollector(registry)
+	return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,69 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from corsheaders.middleware import CorsMiddleware
+from .asyncviews import collect_event
+from .beacon import BEACON_PATH, beacon
+from .metrics import finish_request, start_request
+
+COLLECT_PATH = "/api/analytics/collect"
+
+
+class MetricsMiddleware:
+	# Outermost middleware: times every request, including the ones
+	# IngestMiddleware answers, and counts the queries they issue.
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		self.is_async = iscoroutinefunction(get_response)
+		if self.is_async:
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if self.is_async:
+			return self.__acall__(request)
+		stats, token, started = start_request()
+		response = self.get_response(request)
+		finish_request(request, response, stats, token, started)
+		return response
+
+	async def __acall__(self, request):
+		stats, token, started = start_request()
+		response = await self.get_response(request)
+		finish_request(request, response, stats, token, started)
+		return response
+
+
+class IngestMiddleware:
+	# Place first in MIDDLEWARE. Ingestion requests are answered here, before
+	# the session/CSRF/auth/messages middleware they have no use for: beacons
+	# always, and under ASGI with COLLECT_ASYNC also collect. Both views are
+	# wrapped only in the (natively async) CORS middleware, which also answers
+	# their preflight requests.
+	# Django's MiddlewareMixin classes run their hooks via sync_to_async under
+	# ASGI, so skipping them is what keeps collect on the event loop.
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		self.is_async = iscoroutinefunction(get_response)
+		self.beacon = CorsMiddleware(beacon)
+		if self.is_async:
+			markcoroutinefunction(self)
+			self.collect = CorsMiddleware(collect_event) if settings.COLLECT_ASYNC else None
+
+	def __call__(self, request):
+		if self.is_async:
+			return self.__acall__(request)
+		if request.path_info == BEACON_PATH:
+			return self.beacon(request)
+		return self.get_response(request)
+
+	async def __acall__(self, request):
+		if self.collect is not None and request.path_info == COLLECT_PATH:
+			return await self.collect(request)
+		if request.path_info == BEACON_PATH:
+			return await sync_to_async(self.beacon)(request)
+		return await self.get_response(request)
@@ -0,0 +1,99 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:27
+
+from datetime import timezone as dt_timezone
+from itertools import islice
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour
+
+
+def insert_in_batches(model, objs, batch_size):
+    # bulk_create would materialize the whole generator first
+    objs = iter(objs)
+    while batch := list(islice(objs, batch_size)):
+        model.objects.bulk_create(batch)
+
+
+def backfill_rollups(apps, schema_editor):
+    # Existing events are summarized from the rollups from now on, so they have
+    # to be in them: one grouped pass per granularity, streamed into bulk inserts.
+    Event = apps.get_model("analytics", "Event")
+    EventRollup = apps.get_model("analytics", "EventRollup")
+    EventRollupUser = apps.get_model("analytics", "EventRollupUser")
+    for granularity, trunc in (("hour", TruncHour), ("day", TruncDay)):
+        rows = (
+            Event.objects.annotate(b=trunc("timestamp", tzinfo=dt_timezone.utc))
+            .values("app_id", "event", "device", "b")
+            .annotate(c=Count("id"))
+            .order_by()
+        )
+        insert_in_batches(
+            EventRollup,
+            (
+                EventRollup(
+                    app_id=r["app_id"], event=r["event"], granularity=granularity,
+                    bucket=r["b"], device=r["device"], count=r["c"],
+                )
+                for r in rows.iterator(chunk_size=5000)
+            ),
+            1000,
+        )
+    users = (
+        Event.objects.exclude(user_id="")
+        .annotate(b=TruncDay("timestamp", tzinfo=dt_timezone.utc))
+        .values_list("app_id", "event", "b", "user_id")
+        .distinct()
+        .order_by()
+    )
+    insert_in_batches(
+        EventRollupUser,
+        (
+            EventRollupUser(app_id=app_id, event=event, bucket=bucket, user_id=user_id)
+            for app_id, event, bucket, user_id in users.iterator(chunk_size=5000)
+        ),
+        1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(max_length=255)),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=8)),
+                ('bucket', models.DateTimeField()),
+                ('device', models.CharField(blank=True, max_length=50)),
+                ('count', models.BigIntegerField(default=0)),
+                ('app', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_rollups', to='accounts.clientapp')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EventRollupUser',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(max_length=255)),
+                ('bucket', models.DateTimeField()),
+                ('user_id', models.CharField(max_length=255)),
+                ('app', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_rollup_users', to='accounts.clientapp')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='eventrollup',
+            constraint=models.UniqueConstraint(fields=('app', 'event', 'granularity', 'bucket', 'device'), name='uniq_event_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='eventrollupuser',
+            constraint=models.UniqueConstraint(fields=('app', 'event', 'bucket', 'user_id'), name='uniq_event_rollup_user'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:29
+
+from datetime import timezone as dt_timezone
+from itertools import groupby, islice
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncDay, TruncHour
+
+from apps.analytics.hll import HyperLogLog
+
+
+def insert_in_batches(model, objs, batch_size):
+    # bulk_create would materialize the whole generator first
+    objs = iter(objs)
+    while batch := list(islice(objs, batch_size)):
+        model.objects.bulk_create(batch)
+
+
+def backfill_sketches(apps, schema_editor):
+    # Users come back ordered by bucket, so one sketch is held in memory at a time
+    Event = apps.get_model("analytics", "Event")
+    EventUserSketch = apps.get_model("analytics", "EventUserSketch")
+    for granularity, trunc in (("hour", TruncHour), ("day", TruncDay)):
+        rows = (
+            Event.objects.exclude(user_id="")
+            .annotate(b=trunc("timestamp", tzinfo=dt_timezone.utc))
+            .values_list("app_id", "event", "b", "user_id")
+            .order_by("app_id", "event", "b")
+        )
+        insert_in_batches(
+            EventUserSketch,
+            (
+                EventUserSketch(
+                    app_id=app_id, event=event, granularity=granularity, bucket=bucket,
+                    sketch=HyperLogLog().update(row[3] for row in group).to_bytes(),
+                )
+                for (app_id, event, bucket), group in groupby(rows.iterator(chunk_size=5000), key=lambda row: row[:3])
+            ),
+            500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('analytics', '0002_event_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventUserSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(max_length=255)),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=8)),
+                ('bucket', models.DateTimeField()),
+                ('sketch', models.BinaryField()),
+                ('app', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_user_sketches', to='accounts.clientapp')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='eventusersketch',
+            constraint=models.UniqueConstraint(fields=('app', 'event', 'granularity', 'bucket'), name='uniq_event_user_sketch'),
+        ),
+        migrations.RunPython(backfill_sketches, migrations.RunPython.noop),
+    ]
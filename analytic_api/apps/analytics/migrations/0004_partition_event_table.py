@@ -0,0 +1,21 @@
+from django.db import migrations
+
+from apps.analytics.partitions import convert_to_partitioned
+
+
+def partition_events(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        convert_to_partitioned(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_event_user_sketches'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:37
+
+from itertools import groupby, islice
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _text(value):
+    return None if value is None else str(value)[:255]
+
+
+def backfill_profiles(apps, schema_editor):
+    # user-stats reads only the profiles from now on. Events come back in
+    # (app, user_id, timestamp) order, so each profile is folded from its group
+    # and written in batches without holding the table in memory.
+    Event = apps.get_model("analytics", "Event")
+    UserProfile = apps.get_model("analytics", "UserProfile")
+    rows = (
+        Event.objects.exclude(user_id="")
+        .order_by("app_id", "user_id", "timestamp", "id")
+        .values_list("app_id", "user_id", "timestamp", "device", "metadata", "ip_address")
+    )
+
+    def profiles():
+        for (app_id, user_id), group in groupby(rows.iterator(chunk_size=5000), key=lambda row: row[:2]):
+            group = list(group)
+            *_, ts, device, metadata, ip_address = group[-1]
+            metadata = metadata or {}
+            yield UserProfile(
+                app_id=app_id, user_id=user_id, total_events=len(group),
+                first_seen=group[0][2], last_seen=ts, last_device=device,
+                browser=_text(metadata.get("browser")), os=_text(metadata.get("os")), ip_address=ip_address,
+            )
+
+    batches = profiles()
+    while batch := list(islice(batches, 2000)):
+        UserProfile.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_clientapp_retention_days'),
+        ('analytics', '0004_partition_event_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=255)),
+                ('total_events', models.BigIntegerField(default=0)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('last_device', models.CharField(blank=True, max_length=50)),
+                ('browser', models.CharField(blank=True, max_length=255, null=True)),
+                ('os', models.CharField(blank=True, max_length=255, null=True)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('app', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_profiles', to='accounts.clientapp')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='userprofile',
+            constraint=models.UniqueConstraint(fields=('app', 'user_id'), name='uniq_user_profile'),
+        ),
+        migrations.RunPython(backfill_profiles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:40
+
+import django.db.models.fields.json
+from django.db import migrations, models
+
+
+def create_metadata_gin(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS analytics_event_metadata_gin "
+            "ON analytics_event USING gin (metadata jsonb_path_ops)"
+        )
+
+
+def drop_metadata_gin(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS analytics_event_metadata_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_clientapp_retention_days'),
+        ('analytics', '0005_user_profiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='meta_browser',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.fields.json.KeyTextTransform('browser', 'metadata'), output_field=models.CharField(max_length=255, null=True)),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='meta_os',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.fields.json.KeyTextTransform('os', 'metadata'), output_field=models.CharField(max_length=255, null=True)),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['app', 'meta_browser', 'timestamp'], name='analytics_event_browser_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['app', 'meta_os', 'timestamp'], name='analytics_event_os_idx'),
+        ),
+        migrations.RunPython(create_metadata_gin, drop_metadata_gin),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_clientapp_collect_rate'),
+        ('analytics', '0006_event_metadata_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=255)),
+                ('week_start', models.DateField()),
+                ('days', models.BinaryField(default=b'')),
+                ('app', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_activity', to='accounts.clientapp')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['app', 'week_start'], name='analytics_u_app_id_99152d_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='useractivity',
+            constraint=models.UniqueConstraint(fields=('app', 'user_id'), name='uniq_user_activity'),
+        ),
+    ]
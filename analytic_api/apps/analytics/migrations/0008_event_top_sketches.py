@@ -0,0 +1,29 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_clientapp_collect_rate'),
+        ('analytics', '0007_user_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventTopSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(max_length=255)),
+                ('bucket', models.DateTimeField()),
+                ('sketches', models.BinaryField()),
+                ('app', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_top_sketches', to='accounts.clientapp')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='eventtopsketch',
+            constraint=models.UniqueConstraint(fields=('app', 'event', 'bucket'), name='uniq_event_top_sketch'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_clientapp_collect_rate'),
+        ('analytics', '0008_event_top_sketches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='event_id',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='event',
+            constraint=models.UniqueConstraint(condition=models.Q(('event_id', ''), _negated=True), fields=('app', 'event_id', 'timestamp'), name='uniq_event_idempotency'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0009_event_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceName',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('value', models.CharField(max_length=50, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EventName',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('value', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Url',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('value', models.URLField(max_length=1000)),
+                ('value_hash', models.CharField(max_length=32, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='device_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='analytics.devicename'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='event_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='analytics.eventname'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='referrer_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='analytics.url'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='url_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='analytics.url'),
+        ),
+    ]
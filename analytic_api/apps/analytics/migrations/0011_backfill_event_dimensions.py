@@ -0,0 +1,84 @@
+from django.db import migrations, transaction
+
+BATCH_SIZE = 10000
+
+
+def update_in_batches(cursor, event, sql):
+    # One UPDATE per primary-key range, each committed on its own (the migration
+    # is not atomic), so no statement holds locks on more than a batch of rows.
+    # Every batch sets the same values again when rerun.
+    cursor.execute(f"SELECT MIN(id), MAX(id) FROM {event}")
+    lo, hi = cursor.fetchone()
+    if lo is None:
+        return
+    for start in range(lo, hi + 1, BATCH_SIZE):
+        cursor.execute(f"{sql} WHERE id >= %s AND id < %s", [start, start + BATCH_SIZE])
+
+
+def backfill_dimensions(apps, schema_editor):
+    # Fill the dimension tables with the distinct values not there yet (set-based,
+    # they are small; a rerun after a failed batch adds nothing), then point the
+    # events at their rows in primary-key batches. Blank device/url/referrer
+    # values stay NULL. Django registers MD5 on SQLite too.
+    qn = schema_editor.quote_name
+    event = qn(apps.get_model("analytics", "Event")._meta.db_table)
+    names = qn(apps.get_model("analytics", "EventName")._meta.db_table)
+    devices = qn(apps.get_model("analytics", "DeviceName")._meta.db_table)
+    urls = qn(apps.get_model("analytics", "Url")._meta.db_table)
+    connection = schema_editor.connection
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {names} (value) SELECT DISTINCT event FROM {event} e "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {names} d WHERE d.value = e.event)"
+        )
+        cursor.execute(
+            f"INSERT INTO {devices} (value) SELECT DISTINCT device FROM {event} e "
+            f"WHERE device <> '' AND NOT EXISTS (SELECT 1 FROM {devices} d WHERE d.value = e.device)"
+        )
+        cursor.execute(
+            f"INSERT INTO {urls} (value, value_hash) SELECT v, MD5(v) FROM ("
+            f"SELECT url AS v FROM {event} WHERE url <> '' "
+            f"UNION SELECT referrer FROM {event} WHERE referrer <> '') u "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {urls} d WHERE d.value_hash = MD5(u.v))"
+        )
+    with connection.cursor() as cursor:
+        update_in_batches(
+            cursor,
+            event,
+            f"UPDATE {event} SET "
+            f"event_ref_id = (SELECT d.id FROM {names} d WHERE d.value = {event}.event), "
+            f"device_ref_id = (SELECT d.id FROM {devices} d WHERE d.value = {event}.device), "
+            f"url_ref_id = (SELECT d.id FROM {urls} d WHERE d.value_hash = MD5({event}.url)), "
+            f"referrer_ref_id = (SELECT d.id FROM {urls} d WHERE d.value_hash = MD5({event}.referrer))",
+        )
+
+
+def restore_strings(apps, schema_editor):
+    qn = schema_editor.quote_name
+    event = qn(apps.get_model("analytics", "Event")._meta.db_table)
+    names = qn(apps.get_model("analytics", "EventName")._meta.db_table)
+    devices = qn(apps.get_model("analytics", "DeviceName")._meta.db_table)
+    urls = qn(apps.get_model("analytics", "Url")._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        update_in_batches(
+            cursor,
+            event,
+            f"UPDATE {event} SET "
+            f"event = (SELECT d.value FROM {names} d WHERE d.id = {event}.event_ref_id), "
+            f"device = COALESCE((SELECT d.value FROM {devices} d WHERE d.id = {event}.device_ref_id), ''), "
+            f"url = COALESCE((SELECT d.value FROM {urls} d WHERE d.id = {event}.url_ref_id), ''), "
+            f"referrer = COALESCE((SELECT d.value FROM {urls} d WHERE d.id = {event}.referrer_ref_id), '')",
+        )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('analytics', '0010_event_dimensions'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_dimensions, restore_strings),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_clientapp_collect_rate'),
+        ('analytics', '0011_backfill_event_dimensions'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='event',
+            name='analytics_e_app_id_bbd706_idx',
+        ),
+        # A state-only default, so unapplying the RemoveField below can re-add
+        # the NOT NULL column before 0011 fills it back in
+        migrations.AlterField(
+            model_name='event',
+            name='event',
+            field=models.CharField(db_index=True, default='', max_length=255),
+        ),
+        migrations.RemoveField(
+            model_name='event',
+            name='device',
+        ),
+        migrations.RemoveField(
+            model_name='event',
+            name='event',
+        ),
+        migrations.RemoveField(
+            model_name='event',
+            name='referrer',
+        ),
+        migrations.RemoveField(
+            model_name='event',
+            name='url',
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='event_ref',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='analytics.eventname'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['app', 'event_ref', 'timestamp'], name='analytics_event_name_idx'),
+        ),
+    ]
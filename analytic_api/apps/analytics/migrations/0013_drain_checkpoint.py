@@ -0,0 +1,20 @@
+# Generated by Django 5.0.7 on 2026-10-18 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0012_event_dimension_refs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DrainCheckpoint',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('event_ids', models.JSONField(default=list)),
+            ],
+        ),
+    ]
@@ -1,23 +1,226 @@
-from django.db import models
+import hashlib
+from django.db import connection, models
+from django.db.models.fields.json import KeyTextTransform
 from apps.accounts.models import ClientApp
 
+# Metadata keys copied into their own indexed (generated) columns so filters on
+# them are index lookups. Adding a key here needs a new migration.
+INDEXED_METADATA_KEYS = ("browser", "os")
+
+
+def filter_metadata(qs, key, value):
+	# Hot keys hit their generated column index; other keys use JSON containment,
+	# which PostgreSQL serves from the GIN index on metadata.
+	if key in INDEXED_METADATA_KEYS:
+		return qs.filter(**{f"meta_{key}": value})
+	if connection.vendor == "postgresql":
+		return qs.filter(metadata__contains={key: value})
+	return qs.filter(**{f"metadata__{key}": value})
+
+
+class EventName(models.Model):
+	# Dimension tables for Event's repetitive strings: each distinct value is
+	# stored once and events point at it (see dictionary.py). Rows are only
+	# ever inserted, so an id never changes meaning. 4-byte keys keep the
+	# event rows and the (app, event, timestamp) index small.
+	id = models.AutoField(primary_key=True)
+	value = models.CharField(max_length=255, unique=True)
+
+
+class DeviceName(models.Model):
+	id = models.AutoField(primary_key=True)
+	value = models.CharField(max_length=50, unique=True)
+
+
+class Url(models.Model):
+	# Shared by Event.url and Event.referrer; most referrers are pages of the same
+	# site. Unique by the md5 of the value: a btree on the value itself would be
+	# as large as the column and can exceed PostgreSQL's index row size.
+	id = models.AutoField(primary_key=True)
+	value = models.URLField(max_length=1000)
+	value_hash = models.CharField(max_length=32, unique=True)
+
+	@staticmethod
+	def hash(value):
+		# Same digest as SQL md5(value), which migration 0011's backfill uses
+		return hashlib.md5(value.encode()).hexdigest()
+
+
+def _decoded(field):
+	# The string behind a dictionary-encoded column; read-only, since interning
+	# a new string may insert a row (see Event.set_dimensions)
+	def get(self):
+		row = getattr(self, field)
+		return row.value if row is not None else ""
+
+	return property(get)
+
 
 class Event(models.Model):
 	app = models.ForeignKey(ClientApp, on_delete=models.CASCADE, related_name="events")
-	event = models.CharField(max_length=255, db_index=True)
-	url = models.URLField(max_length=1000, blank=True)
-	referrer = models.URLField(max_length=1000, blank=True)
-	device = models.CharField(max_length=50, blank=True)
+	# event, url, referrer and device are stored as ids into the dimension
+	# tables and read as strings through the properties below; set them with
+	# dictionary.encode_items or set_dimensions
+	event_ref = models.ForeignKey(EventName, on_delete=models.PROTECT, related_name="+", db_index=False)
+	url_ref = models.ForeignKey(Url, null=True, on_delete=models.PROTECT, related_name="+", db_index=False)
+	referrer_ref = models.ForeignKey(Url, null=True, on_delete=models.PROTECT, related_name="+", db_index=False)
+	device_ref = models.ForeignKey(DeviceName, null=True, on_delete=models.PROTECT, related_name="+", db_index=False)
 	ip_address = models.GenericIPAddressField(null=True, blank=True)
 	timestamp = models.DateTimeField(db_index=True)
 	metadata = models.JSONField(default=dict, blank=True)
 	user_id = models.CharField(max_length=255, blank=True, db_index=True)
+	# Optional client-supplied idempotency key; retries carrying it are stored once
+	event_id = models.CharField(max_length=64, blank=True, default="")
 	created_at = models.DateTimeField(auto_now_add=True)
+	meta_browser = models.GeneratedField(
+		expression=KeyTextTransform("browser", "metadata"),
+		output_field=models.CharField(max_length=255, null=True),
+		db_persist=True,
+	)
+	meta_os = models.GeneratedField(
+		expression=KeyTextTransform("os", "metadata"),
+		output_field=models.CharField(max_length=255, null=True),
+		db_persist=True,
+	)
+
+	event = _decoded("event_ref")
+	url = _decoded("url_ref")
+	referrer = _decoded("referrer_ref")
+	device = _decoded("device_ref")
 
 	class Meta:
 		indexes = [
-			models.Index(fields=["app", "event", "timestamp"]),
+			models.Index(fields=["app", "event_ref", "timestamp"], name="analytics_event_name_idx"),
 			models.Index(fields=["app", "user_id"]),
+			models.Index(fields=["app", "meta_browser", "timestamp"], name="analytics_event_browser_idx"),
+			models.Index(fields=["app", "meta_os", "timestamp"], name="analytics_event_os_idx"),
+		]
+		constraints = [
+			# Backstop for the ingest dedup filter. Unique indexes on the partitioned
+			# PostgreSQL table must contain the partition key, hence timestamp, so
+			# it only rejects retries that resend the original timestamp. Events
+			# stamped by the server get a new one per attempt; for those, two
+			# concurrent attempts can both be stored (sequential ones are caught by
+			# the event_id lookup in dedup.drop_stored).
+			models.UniqueConstraint(
+				fields=["app", "event_id", "timestamp"],
+				condition=~models.Q(event_id=""),
+				name="uniq_event_idempotency",
+			),
+		]
+
+	def set_dimensions(self, **values):
+		# Points event/url/referrer/device at the rows of the given strings,
+		# inserting rows for new ones in the caller's transaction
+		from . import dictionary
+
+		for field, value in values.items():
+			ref, table = dictionary.FIELDS[field]
+			setattr(self, ref, table.row(value) if value else None)
+		return self
+
+
+class EventRollup(models.Model):
+	HOUR = "hour"
+	DAY = "day"
+	GRANULARITY_CHOICES = [(HOUR, "Hour"), (DAY, "Day")]
+
+	app = models.ForeignKey(ClientApp, on_delete=models.CASCADE, related_name="event_rollups")
+	event = models.CharField(max_length=255)
+	granularity = models.CharField(max_length=8, choices=GRANULARITY_CHOICES)
+	bucket = models.DateTimeField()
+	device = models.CharField(max_length=50, blank=True)
+	count = models.BigIntegerField(default=0)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(
+				fields=["app", "event", "granularity", "bucket", "device"],
+				name="uniq_event_rollup",
+			),
+		]
+
+
+class EventRollupUser(models.Model):
+	# Distinct users seen per (app, event, day); the per-bucket unique-user set
+	app = models.ForeignKey(ClientApp, on_delete=models.CASCADE, related_name="event_rollup_users")
+	event = models.CharField(max_length=255)
+	bucket = models.DateTimeField()
+	user_id = models.CharField(max_length=255)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["app", "event", "bucket", "user_id"], name="uniq_event_rollup_user"),
+		]
+
+
+class EventUserSketch(models.Model):
+	# Serialized HyperLogLog of user_ids per (app, event, granularity, bucket)
+	app = models.ForeignKey(ClientApp, on_delete=models.CASCADE, related_name="event_user_sketches")
+	event = models.CharField(max_length=255)
+	granularity = models.CharField(max_length=8, choices=EventRollup.GRANULARITY_CHOICES)
+	bucket = models.DateTimeField()
+	sketch = models.BinaryField()
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(
+				fields=["app", "event", "granularity", "bucket"],
+				name="uniq_event_user_sketch",
+			),
+		]
+
+
+class EventTopSketch(models.Model):
+	# Heavy-hitter sketches (topk.TopSketch) of url, referrer, browser and os
+	# values per (app, event, UTC day), packed into one blob; backs /top
+	app = models.ForeignKey(ClientApp, on_delete=models.CASCADE, related_name="event_top_sketches")
+	event = models.CharField(max_length=255)
+	bucket = models.DateTimeField()
+	sketches = models.BinaryField()
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["app", "event", "bucket"], name="uniq_event_top_sketch"),
+		]
+
+
+class UserProfile(models.Model):
+	# Running per-user summary maintained at ingest; backs /user-stats
+	app = models.ForeignKey(ClientApp, on_delete=models.CASCADE, related_name="user_profiles")
+	user_id = models.CharField(max_length=255)
+	total_events = models.BigIntegerField(default=0)
+	first_seen = models.DateTimeField()
+	last_seen = models.DateTimeField()
+	last_device = models.CharField(max_length=50, blank=True)
+	browser = models.CharField(max_length=255, null=True, blank=True)
+	os = models.CharField(max_length=255, null=True, blank=True)
+	ip_address = models.GenericIPAddressField(null=True, blank=True)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["app", "user_id"], name="uniq_user_profile"),
+		]
+
+
+class UserActivity(models.Model):
+	# Days a user was active as a bitmap: bit i (little-endian) is the UTC day
+	# week_start + i, where week_start is the Monday of their first active week.
+	# Users of one cohort share the same origin, which keeps /retention vectorized.
+	app = models.ForeignKey(ClientApp, on_delete=models.CASCADE, related_name="user_activity")
+	user_id = models.CharField(max_length=255)
+	week_start = models.DateField()
+	days = models.BinaryField(default=b"")
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["app", "user_id"], name="uniq_user_activity"),
 		]
+		indexes = [models.Index(fields=["app", "week_start"])]
 
 
+class DrainCheckpoint(models.Model):
+	# Ids of events whose deferred aggregates drain_events has committed but whose
+	# queue records may not be acknowledged yet; replays of them are skipped
+	name = models.CharField(max_length=64, primary_key=True)
+	event_ids = models.JSONField(default=list)
@@ -0,0 +1,161 @@
+from datetime import date, datetime, timezone as dt_timezone
+from django.db import connection, transaction
+
+# Monthly RANGE partitions of analytics_event on PostgreSQL. Partitions are
+# named <table>_pYYYYMM; rows outside every partition land in <table>_default
+# until their month's partition is created (see create_partition).
+EVENT_TABLE = "analytics_event"
+
+
+def month_start(day):
+	return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+	index = day.year * 12 + day.month - 1 + months
+	return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month, table=EVENT_TABLE):
+	return f"{table}_p{month:%Y%m}"
+
+
+def _bound(month):
+	return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc).isoformat()
+
+
+def is_partitioned(table=EVENT_TABLE, conn=connection):
+	if conn.vendor != "postgresql":
+		return False
+	with conn.cursor() as cursor:
+		cursor.execute(
+			"SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+			[table],
+		)
+		return cursor.fetchone() is not None
+
+
+def _insert_columns(cursor, table):
+	# Every column but the generated ones, which are recomputed on insert
+	cursor.execute(
+		"SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass AND attnum > 0 "
+		"AND NOT attisdropped AND attgenerated = '' ORDER BY attnum",
+		[table],
+	)
+	return [row[0] for row in cursor.fetchall()]
+
+
+def create_partition(cursor, month, table=EVENT_TABLE):
+	# Rows for a month without a partition land in the DEFAULT partition, and
+	# PostgreSQL refuses to create that month's partition while they are there.
+	# So the default partition is detached, the month created, its rows moved
+	# over and the default attached again. Run it in a transaction: writers
+	# wait on the table lock meanwhile instead of finding no partition.
+	qn = connection.ops.quote_name
+	name, default = partition_name(month, table), f"{table}_default"
+	lo, hi = _bound(month), _bound(add_months(month, 1))
+	cursor.execute("SELECT to_regclass(%s), to_regclass(%s)", [name, default])
+	exists, has_default = cursor.fetchone()
+	if exists:
+		return
+	stray = False
+	if has_default:
+		cursor.execute(f'SELECT 1 FROM {qn(default)} WHERE "timestamp" >= %s AND "timestamp" < %s LIMIT 1', [lo, hi])
+		stray = cursor.fetchone() is not None
+	if stray:
+		cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(default)}")
+	cursor.execute(
+		f"CREATE TABLE IF NOT EXISTS {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)",
+		[lo, hi],
+	)
+	if stray:
+		columns = ", ".join(qn(column) for column in _insert_columns(cursor, table))
+		cursor.execute(
+			f'WITH moved AS (DELETE FROM {qn(default)} WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+			f"INSERT INTO {qn(table)} ({columns}) SELECT {columns} FROM moved",
+			[lo, hi],
+		)
+		cursor.execute(f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(default)} DEFAULT")
+
+
+def ensure_partitions(start, months_ahead, table=EVENT_TABLE, conn=connection):
+	# Creates monthly partitions from `start`'s month through `months_ahead`
+	# months past the current one. Returns the partition names it ensured.
+	first = month_start(start)
+	last = add_months(month_start(datetime.now(dt_timezone.utc).date()), months_ahead)
+	names = []
+	month = first
+	while month <= last:
+		with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+			create_partition(cursor, month, table)
+		names.append(partition_name(month, table))
+		month = add_months(month, 1)
+	return names
+
+
+def list_partitions(table=EVENT_TABLE, conn=connection):
+	# [(name, month)] for the monthly partitions, oldest first
+	with conn.cursor() as cursor:
+		cursor.execute(
+			"SELECT c.relname FROM pg_inherits i "
+			"JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+			"WHERE p.relname = %s",
+			[table],
+		)
+		names = [row[0] for row in cursor.fetchall()]
+	prefix = f"{table}_p"
+	parts = []
+	for name in names:
+		suffix = name[len(prefix):]
+		if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+			parts.append((name, date(int(suffix[:4]), int(suffix[4:]), 1)))
+	return sorted(parts, key=lambda part: part[1])
+
+
+def drop_partition(name, table=EVENT_TABLE, conn=connection):
+	qn = connection.ops.quote_name
+	with conn.cursor() as cursor:
+		cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}")
+		cursor.execute(f"DROP TABLE {qn(name)}")
+
+
+def convert_to_partitioned(cursor, table=EVENT_TABLE, months_ahead=3):
+	# Rebuilds `table` as a RANGE (timestamp) partitioned table, keeping its
+	# columns, indexes and foreign keys. The primary key becomes (id, timestamp)
+	# because unique constraints on a partitioned table must include the key;
+	# the id default moves to a plain sequence as identity columns are not
+	# supported on partitioned tables before PostgreSQL 17.
+	legacy = f"{table}_unpartitioned"
+	cursor.execute(
+		"SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+		[table, f"{table}_pkey"],
+	)
+	index_defs = [row[0] for row in cursor.fetchall()]
+	cursor.execute(
+		"SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+		[table],
+	)
+	foreign_keys = cursor.fetchall()
+	cursor.execute(f'SELECT MIN("timestamp"), MAX(id) FROM {table}')
+	oldest, max_id = cursor.fetchone()
+
+	cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+	cursor.execute(f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")')
+	cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+	first = month_start(oldest.date()) if oldest else month_start(datetime.now(dt_timezone.utc).date())
+	month = first
+	last = add_months(month_start(datetime.now(dt_timezone.utc).date()), months_ahead)
+	while month <= last:
+		create_partition(cursor, month, table)
+		month = add_months(month, 1)
+	cursor.execute(f"INSERT INTO {table} SELECT * FROM {legacy}")
+	# Dropping the old table frees its index, constraint and sequence names
+	cursor.execute(f"DROP TABLE {legacy}")
+	cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, "timestamp")')
+	cursor.execute(f"CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id START WITH {(max_id or 0) + 1}")
+	cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')")
+	# Definitions were read before the rename, so they already target `table`
+	for index_def in index_defs:
+		cursor.execute(index_def)
+	for name, definition in foreign_keys:
+		cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
@@ -0,0 +1,145 @@
+from itertools import groupby
+from django.conf import settings
+from django.db import connection, transaction
+from . import dictionary
+from .models import Event, UserProfile
+
+PROFILE_FIELDS = ["total_events", "first_seen", "last_seen", "last_device", "browser", "os", "ip_address"]
+LATEST_FIELDS = ["last_device", "browser", "os", "ip_address"]
+
+
+def profiles_enabled():
+	return getattr(settings, "ANALYTICS_USE_USER_PROFILES", True)
+
+
+def _text(value):
+	return None if value is None else str(value)[:255]
+
+
+def fold(app_id, user_id, rows):
+	# rows: (timestamp, device, metadata, ip_address) in ingest order
+	profile = None
+	for ts, device, metadata, ip_address in rows:
+		if profile is None:
+			profile = UserProfile(app_id=app_id, user_id=user_id, total_events=0, first_seen=ts, last_seen=ts)
+		profile.total_events += 1
+		profile.first_seen = min(profile.first_seen, ts)
+		if ts >= profile.last_seen:
+			md = metadata or {}
+			profile.last_seen = ts
+			profile.last_device = device or ""
+			profile.browser = _text(md.get("browser"))
+			profile.os = _text(md.get("os"))
+			profile.ip_address = ip_address
+	return profile
+
+
+def _upsert_sql():
+	qn = connection.ops.quote_name
+	table = qn(UserProfile._meta.db_table)
+	least, greatest = ("LEAST", "GREATEST") if connection.vendor == "postgresql" else ("MIN", "MAX")
+	newer = f"excluded.last_seen >= {table}.last_seen"
+	latest = ", ".join(
+		f"{field} = CASE WHEN {newer} THEN excluded.{field} ELSE {table}.{field} END" for field in LATEST_FIELDS
+	)
+	return (
+		f"INSERT INTO {table} (app_id, user_id, {', '.join(PROFILE_FIELDS)}) "
+		f"VALUES ({', '.join(['%s'] * (len(PROFILE_FIELDS) + 2))}) "
+		f"ON CONFLICT (app_id, user_id) DO UPDATE SET "
+		f"total_events = {table}.total_events + excluded.total_events, "
+		f"first_seen = {least}({table}.first_seen, excluded.first_seen), "
+		f"{latest}, "
+		f"last_seen = {greatest}({table}.last_seen, excluded.last_seen)"
+	)
+
+
+def merge_profiles(profiles):
+	if connection.vendor not in ("sqlite", "postgresql"):
+		for delta in profiles:
+			with transaction.atomic():
+				current = UserProfile.objects.select_for_update().filter(app_id=delta.app_id, user_id=delta.user_id).first()
+				if current is None:
+					delta.save()
+					continue
+				current.total_events += delta.total_events
+				current.first_seen = min(current.first_seen, delta.first_seen)
+				if delta.last_seen >= current.last_seen:
+					for field in ["last_seen", *LATEST_FIELDS]:
+						setattr(current, field, getattr(delta, field))
+				current.save()
+		return
+	ops = connection.ops
+	params = [
+		(
+			p.app_id,
+			p.user_id,
+			p.total_events,
+			ops.adapt_datetimefield_value(p.first_seen),
+			ops.adapt_datetimefield_value(p.last_seen),
+			p.last_device,
+			p.browser,
+			p.os,
+			ops.adapt_ipaddressfield_value(p.ip_address),
+		)
+		for p in profiles
+	]
+	with connection.cursor() as cursor:
+		cursor.executemany(_upsert_sql(), params)
+
+
+def apply_events(events):
+	# Profiles come out in (app, user_id) order, which is also the order the
+	# upsert locks their rows in, so concurrent batches cannot deadlock
+	if not profiles_enabled():
+		return
+	rows = sorted(
+		((e.app_id, e.user_id, i, e) for i, e in enumerate(events) if e.user_id),
+		key=lambda row: row[:3],
+	)
+	profiles = [
+		fold(app_id, user_id, ((e.timestamp, e.device, e.metadata, e.ip_address) for *_, e in group))
+		for (app_id, user_id), group in groupby(rows, key=lambda row: row[:2])
+	]
+	if profiles:
+		merge_profiles(profiles)
+
+
+def rebuild(app_ids=None, batch_size=2000):
+	# Recomputes profiles from raw events in one ordered pass, so memory stays
+	# bounded by batch_size regardless of table size.
+	events = Event.objects.exclude(user_id="")
+	profiles = UserProfile.objects.all()
+	if app_ids is not None:
+		events = events.filter(app_id__in=app_ids)
+		profiles = profiles.filter(app_id__in=app_ids)
+	rows = events.order_by("app_id", "user_id", "timestamp", "id").values_list(
+		"app_id", "user_id", "timestamp", dictionary.column("device"), "metadata", "ip_address"
+	)
+	written = 0
+	with transaction.atomic():
+		profiles.delete()
+		batch = []
+		for (app_id, user_id), group in groupby(rows.iterator(chunk_size=5000), key=lambda row: row[:2]):
+			batch.append(fold(app_id, user_id, (row[2:] for row in group)))
+			if len(batch) >= batch_size:
+				UserProfile.objects.bulk_create(batch)
+				written += len(batch)
+				batch = []
+		UserProfile.objects.bulk_create(batch)
+		written += len(batch)
+	return written
+
+
+def user_stats(app_ids, user_id):
+	# One indexed lookup on (app, user_id); owners with several apps get the
+	# totals summed and the most recent app's latest details.
+	profiles = list(UserProfile.objects.filter(app_id__in=app_ids, user_id=user_id))
+	if not profiles:
+		return {"userId": user_id, "totalEvents": 0, "deviceDetails": {}, "ipAddress": None}
+	latest = max(profiles, key=lambda p: p.last_seen)
+	return {
+		"userId": user_id,
+		"totalEvents": sum(p.total_events for p in profiles),
+		"deviceDetails": {"browser": latest.browser, "os": latest.os},
+		"ipAddress": latest.ip_address,
+	}
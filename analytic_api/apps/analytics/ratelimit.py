@@ -0,0 +1,117 @@
+import math
+import threading
+import time
+from contextlib import nullcontext
+from functools import lru_cache
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+# Token buckets keyed by throttle scope + identity. A rate of N/period allows
+# bursts of N requests and refills at N per period. Each key holds only the
+# current token count and the time it was computed.
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# KEYS[1] bucket hash; ARGV: capacity, tokens per millisecond, cost.
+# Uses the Redis clock so every worker agrees on time. Returns
+# {allowed (0/1), milliseconds until `cost` tokens are available}.
+TOKEN_BUCKET_LUA = """
+redis.replicate_commands()
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+	tokens = capacity
+	ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+	tokens = tokens - cost
+	allowed = 1
+else
+	wait = math.ceil((cost - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate) + 1000)
+return {allowed, wait}
+"""
+
+
+def parse_rate(rate):
+	# "100/second" -> (100, 1); same notation as DRF throttle rates
+	if rate is None:
+		return None
+	num, _, period = rate.partition("/")
+	return int(num), PERIODS[period[0]]
+
+
+class RedisTokenBucket:
+	def __init__(self, url):
+		import redis
+
+		self.url = url
+		self.script = redis.Redis.from_url(url).register_script(TOKEN_BUCKET_LUA)
+		self._async = None
+
+	def hit(self, key, capacity, per_second, cost=1):
+		allowed, wait_ms = self.script(keys=[key], args=[capacity, per_second / 1000, cost])
+		return bool(allowed), wait_ms / 1000
+
+	def _async_script(self):
+		# redis.asyncio connections belong to the loop that opened them
+		import asyncio
+		import redis.asyncio
+
+		loop = asyncio.get_running_loop()
+		if self._async is None or self._async[0] is not loop:
+			self._async = (loop, redis.asyncio.Redis.from_url(self.url).register_script(TOKEN_BUCKET_LUA))
+		return self._async[1]
+
+	async def ahit(self, key, capacity, per_second, cost=1):
+		allowed, wait_ms = await self._async_script()(keys=[key], args=[capacity, per_second / 1000, cost])
+		return bool(allowed), wait_ms / 1000
+
+
+class CacheTokenBucket:
+	# Same algorithm over the Django cache for deployments without Redis. With
+	# the locmem default every process limits on its own (guarded by a lock);
+	# with a shared non-Redis cache the read-modify-write is not atomic, so
+	# concurrent hits may occasionally both pass.
+	def __init__(self):
+		self.local = isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache)
+		self.lock = threading.Lock() if self.local else nullcontext()
+
+	def hit(self, key, capacity, per_second, cost=1):
+		with self.lock:
+			now = time.time()
+			tokens, ts = cache.get(key) or (capacity, now)
+			tokens = min(capacity, tokens + max(0.0, now - ts) * per_second)
+			if tokens >= cost:
+				tokens -= cost
+				allowed, wait = True, 0.0
+			else:
+				allowed, wait = False, (cost - tokens) / per_second
+			cache.set(key, (tokens, now), timeout=math.ceil(capacity / per_second) + 1)
+		return allowed, wait
+
+	async def ahit(self, key, capacity, per_second, cost=1):
+		# The in-process cache never blocks, so skip the thread hop
+		if self.local:
+			return self.hit(key, capacity, per_second, cost)
+		return await sync_to_async(self.hit)(key, capacity, per_second, cost)
+
+
+@lru_cache(maxsize=1)
+def get_limiter():
+	if settings.REDIS_URL:
+		return RedisTokenBucket(settings.REDIS_URL)
+	return CacheTokenBucket()
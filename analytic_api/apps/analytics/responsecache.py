@@ -0,0 +1,100 @@
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from .metrics import observe_cache
+
+# Cached analytics responses are stored under a key built from the request
+# parameters. Each entry remembers the version tokens of the data scopes it was
+# computed from (per (app, event) for summaries, per (app, user_id) for user
+# stats, per app for retention cohorts); ingestion replaces those tokens, so an
+# entry is fresh only while its versions match and its TTL has not passed. Stale
+# entries are still served while exactly one worker (holding a short cache lock)
+# recomputes them.
+
+VERSION_PREFIX = "analytics-version:"
+LOCK_PREFIX = "analytics-lock:"
+
+
+def event_scope(app_id, event):
+	return f"{app_id}:event:{event}"
+
+
+def user_scope(app_id, user_id):
+	return f"{app_id}:user:{user_id}"
+
+
+def activity_scope(app_id):
+	return f"{app_id}:activity"
+
+
+def bump_versions(scopes):
+	# Versions expire a while after the last entry that could be keyed on them;
+	# a missing version only turns the next lookup into a miss
+	scopes = set(scopes)
+	if scopes:
+		ttl, stale_ttl, _ = _settings()
+		token = uuid.uuid4().hex
+		cache.set_many({VERSION_PREFIX + scope: token for scope in scopes}, timeout=2 * (ttl + stale_ttl))
+
+
+def _settings():
+	return (
+		getattr(settings, "ANALYTICS_CACHE_TTL", 60),
+		getattr(settings, "ANALYTICS_CACHE_STALE_TTL", 300),
+		getattr(settings, "ANALYTICS_CACHE_LOCK_TTL", 30),
+	)
+
+
+def _wait_for(key, versions, lock_key, timeout):
+	# Another worker is computing and there is nothing stale to serve: poll
+	# briefly for its result instead of issuing the same query.
+	deadline = time.monotonic() + timeout
+	delay = 0.01
+	while time.monotonic() < deadline:
+		time.sleep(delay)
+		entry = cache.get(key)
+		if entry is not None and entry["versions"] == versions:
+			return entry
+		if cache.get(lock_key) is None:
+			return None
+		delay = min(delay * 2, 0.2)
+	return None
+
+
+def get_or_compute(key, scopes, compute):
+	# Returns (value, state) where state is "hit", "stale" or "miss".
+	value, state = _get_or_compute(key, scopes, compute)
+	observe_cache(key, state)
+	return value, state
+
+
+def _get_or_compute(key, scopes, compute):
+	ttl, stale_ttl, lock_ttl = _settings()
+	version_keys = [VERSION_PREFIX + scope for scope in sorted(scopes)]
+	found = cache.get_many([key, *version_keys])
+	versions = [found.get(vk) for vk in version_keys]
+	entry = found.get(key)
+	now = time.time()
+	if entry is not None and entry["versions"] == versions and now < entry["fresh_until"]:
+		return entry["value"], "hit"
+
+	lock_key = LOCK_PREFIX + key
+	locked = cache.add(lock_key, 1, timeout=lock_ttl)
+	if not locked:
+		if entry is not None:
+			return entry["value"], "stale"
+		entry = _wait_for(key, versions, lock_key, getattr(settings, "ANALYTICS_CACHE_WAIT", 2.0))
+		if entry is not None:
+			return entry["value"], "hit"
+	try:
+		value = compute()
+		cache.set(
+			key,
+			{"value": value, "versions": versions, "fresh_until": time.time() + ttl},
+			timeout=ttl + stale_ttl,
+		)
+	finally:
+		if locked:
+			cache.delete(lock_key)
+	return value, "miss"
@@ -0,0 +1,70 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from apps.accounts.models import ClientApp
+from . import partitions, responsecache, rollups
+from .models import Event, EventRollup, EventRollupUser, EventTopSketch, EventUserSketch
+
+# Aggregates pruned with the events, so a pruned range reads as empty everywhere
+AGGREGATE_MODELS = (EventRollup, EventRollupUser, EventUserSketch, EventTopSketch)
+
+
+def app_cutoffs(now=None):
+	# {app_id: cutoff} for every app; None means keep everything. Cutoffs fall on
+	# UTC midnight, so every hourly/daily aggregate bucket is either kept or
+	# pruned whole along with its events.
+	now = now or timezone.now()
+	default = getattr(settings, "EVENT_RETENTION_DAYS", None)
+	cutoffs = {}
+	for app_id, days in ClientApp.objects.values_list("id", "retention_days"):
+		days = days or default
+		cutoffs[app_id] = rollups.truncate(now - timedelta(days=days), EventRollup.DAY) if days else None
+	return cutoffs
+
+
+def droppable_partitions(cutoffs):
+	# Monthly partitions that end before every app's cutoff hold nothing worth keeping
+	if not cutoffs or None in cutoffs.values():
+		return []
+	oldest_cutoff = min(cutoffs.values())
+	return [
+		name
+		for name, month in partitions.list_partitions()
+		if partitions.add_months(month, 1) <= oldest_cutoff.date()
+	]
+
+
+def delete_in_batches(qs, batch_size):
+	# Deletes by primary-key chunks so each statement holds locks briefly
+	deleted = 0
+	while True:
+		ids = list(qs.values_list("pk", flat=True)[:batch_size])
+		if not ids:
+			return deleted
+		deleted += qs.model.objects.filter(pk__in=ids).delete()[0]
+		if len(ids) < batch_size:
+			return deleted
+
+
+def prune(batch_size=5000, now=None, dry_run=False):
+	cutoffs = app_cutoffs(now)
+	report = {"dropped_partitions": [], "deleted_events": 0, "deleted_aggregates": 0}
+	if partitions.is_partitioned():
+		report["dropped_partitions"] = droppable_partitions(cutoffs)
+		if not dry_run:
+			for name in report["dropped_partitions"]:
+				partitions.drop_partition(name)
+	for app_id, cutoff in cutoffs.items():
+		if cutoff is None:
+			continue
+		events = Event.objects.filter(app_id=app_id, timestamp__lt=cutoff)
+		aggregates = [model.objects.filter(app_id=app_id, bucket__lt=cutoff) for model in AGGREGATE_MODELS]
+		if dry_run:
+			report["deleted_events"] += events.count()
+			report["deleted_aggregates"] += sum(qs.count() for qs in aggregates)
+			continue
+		names = set(aggregates[0].values_list("event", flat=True).distinct())
+		report["deleted_events"] += delete_in_batches(events, batch_size)
+		report["deleted_aggregates"] += sum(delete_in_batches(qs, batch_size) for qs in aggregates)
+		responsecache.bump_versions(responsecache.event_scope(app_id, name) for name in names)
+	return report
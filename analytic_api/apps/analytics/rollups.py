@@ -0,0 +1,291 @@
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from . import dictionary
+from .dateranges import filter_range, is_aligned
+from .hll import HyperLogLog
+from .models import Event, EventRollup, EventRollupUser, EventTopSketch, EventUserSketch
+from .topk import DIMENSIONS, TopSketch, dimension_value, pack_sketches, unpack_sketches
+
+GRANULARITIES = {
+	EventRollup.HOUR: (timedelta(hours=1), TruncHour),
+	EventRollup.DAY: (timedelta(days=1), TruncDay),
+}
+
+
+def rollups_enabled():
+	return getattr(settings, "ANALYTICS_USE_ROLLUPS", True)
+
+
+def top_sketches_enabled():
+	return getattr(settings, "ANALYTICS_USE_TOP_SKETCHES", True)
+
+
+def granularity_for(lo, hi):
+	# Coarsest rollup whose (UTC) buckets tile [lo, hi) exactly, or None
+	for granularity in (EventRollup.DAY, EventRollup.HOUR):
+		step = GRANULARITIES[granularity][0]
+		if is_aligned(lo, step) and is_aligned(hi, step):
+			return granularity
+	return None
+
+
+def truncate(ts, granularity):
+	ts = ts.astimezone(dt_timezone.utc)
+	if granularity == EventRollup.HOUR:
+		return ts.replace(minute=0, second=0, microsecond=0)
+	return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def day_start(day):
+	return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def _increment_counts(counts):
+	# One INSERT .. ON CONFLICT DO UPDATE statement for the whole batch; both
+	# SQLite and PostgreSQL support adding to the existing row.
+	# Rows are upserted in key order, so concurrent batches lock them in the same
+	# order and cannot deadlock on each other
+	counts = sorted(counts.items())
+	if connection.vendor not in ("sqlite", "postgresql"):
+		for (app_id, event, granularity, bucket, device), n in counts:
+			with transaction.atomic():
+				row, _ = EventRollup.objects.select_for_update().get_or_create(
+					app_id=app_id, event=event, granularity=granularity, bucket=bucket, device=device
+				)
+				EventRollup.objects.filter(pk=row.pk).update(count=F("count") + n)
+		return
+	qn = connection.ops.quote_name
+	table = qn(EventRollup._meta.db_table)
+	sql = (
+		f"INSERT INTO {table} (app_id, event, granularity, bucket, device, count) "
+		f"VALUES (%s, %s, %s, %s, %s, %s) "
+		f"ON CONFLICT (app_id, event, granularity, bucket, device) "
+		f"DO UPDATE SET count = {table}.count + excluded.count"
+	)
+	params = [
+		(app_id, event, granularity, connection.ops.adapt_datetimefield_value(bucket), device, n)
+		for (app_id, event, granularity, bucket, device), n in counts
+	]
+	with connection.cursor() as cursor:
+		cursor.executemany(sql, params)
+
+
+def _locked_rows(model, fields, keys, **defaults):
+	# {key: row} for `keys` (tuples of `fields` values), locked for the rest of the
+	# transaction. Missing rows are inserted first with ON CONFLICT DO NOTHING, so
+	# two batches that both start a bucket update the same row instead of one of
+	# them failing on the unique constraint. Keys are inserted and locked in
+	# sorted order, so concurrent batches cannot deadlock.
+	keys = sorted(keys)
+	if not keys:
+		return {}
+	model.objects.bulk_create([model(**dict(zip(fields, key)), **defaults) for key in keys], ignore_conflicts=True)
+	condition = Q()
+	for key in keys:
+		condition |= Q(**dict(zip(fields, key)))
+	rows = model.objects.select_for_update().filter(condition).order_by(*fields)
+	return {tuple(getattr(row, field) for field in fields): row for row in rows}
+
+
+def _merge_sketches(sketch_users):
+	# HLL merges are idempotent, so a replayed batch does not inflate the estimate
+	fields = ["app_id", "event", "granularity", "bucket"]
+	rows = _locked_rows(EventUserSketch, fields, sketch_users, sketch=HyperLogLog().to_bytes())
+	for key, row in rows.items():
+		sketch = HyperLogLog.from_bytes(row.sketch)
+		sketch.update(sketch_users[key])
+		row.sketch = sketch.to_bytes()
+	EventUserSketch.objects.bulk_update(rows.values(), ["sketch"])
+
+
+def _merge_top_sketches(top_values):
+	# Same read-modify-write as the HyperLogLog sketches; daily buckets only, as
+	# hour-aligned ranges are small enough to count exactly. Each blob is
+	# rewritten once per batch, not once per event.
+	fields = ["app_id", "event", "bucket"]
+	rows = _locked_rows(EventTopSketch, fields, top_values, sketches=pack_sketches({}))
+	for key, row in rows.items():
+		sketches = unpack_sketches(row.sketches)
+		for dimension, counts in top_values[key].items():
+			sketches.setdefault(dimension, TopSketch()).update(counts)
+		row.sketches = pack_sketches(sketches)
+	EventTopSketch.objects.bulk_update(rows.values(), ["sketches"])
+
+
+def _top_values(rows):
+	# rows: (app_id, event, timestamp, url, referrer, metadata)
+	# -> {(app_id, event, day): {dimension: {value: count}}}
+	top_values = defaultdict(lambda: defaultdict(Counter))
+	for app_id, event, ts, url, referrer, metadata in rows:
+		per_dimension = top_values[(app_id, event, truncate(ts, EventRollup.DAY))]
+		for dimension in DIMENSIONS:
+			value = dimension_value(dimension, url, referrer, metadata)
+			if value:
+				per_dimension[dimension][value] += 1
+	return top_values
+
+
+def apply_events(events):
+	if not events or not rollups_enabled():
+		return
+	counts = Counter()
+	users = set()
+	sketch_users = defaultdict(set)
+	for e in events:
+		for granularity in GRANULARITIES:
+			bucket = truncate(e.timestamp, granularity)
+			counts[(e.app_id, e.event, granularity, bucket, e.device or "")] += 1
+			if e.user_id:
+				sketch_users[(e.app_id, e.event, granularity, bucket)].add(e.user_id)
+		if e.user_id:
+			users.add((e.app_id, e.event, truncate(e.timestamp, EventRollup.DAY), e.user_id))
+	_increment_counts(counts)
+	# Daily user sets give exact unique users for day-aligned ranges up to
+	# ANALYTICS_APPROX_UNIQUE_THRESHOLD events (and approx=false at any size); the
+	# sketches below give the estimate past it, where counting the sets is too slow
+	if users:
+		EventRollupUser.objects.bulk_create(
+			[EventRollupUser(app_id=a, event=ev, bucket=b, user_id=u) for a, ev, b, u in sorted(users)],
+			ignore_conflicts=True,
+		)
+	_merge_sketches(sketch_users)
+	if top_sketches_enabled():
+		_merge_top_sketches(_top_values((e.app_id, e.event, e.timestamp, e.url, e.referrer, e.metadata) for e in events))
+
+
+def rebuild(start_day, end_day, app_ids=None):
+	# Recompute rollups for whole UTC days [start_day, end_day] from raw events,
+	# one day at a time. Meant for backfills and repairs of closed ranges: events
+	# ingested for those days while it runs may be counted twice or not at all.
+	day = start_day
+	while day <= end_day:
+		lo = day_start(day)
+		hi = lo + timedelta(days=1)
+		events = Event.objects.filter(timestamp__gte=lo, timestamp__lt=hi)
+		rollups = EventRollup.objects.filter(bucket__gte=lo, bucket__lt=hi)
+		users = EventRollupUser.objects.filter(bucket__gte=lo, bucket__lt=hi)
+		sketches = EventUserSketch.objects.filter(bucket__gte=lo, bucket__lt=hi)
+		top_sketches = EventTopSketch.objects.filter(bucket__gte=lo, bucket__lt=hi)
+		if app_ids is not None:
+			events = events.filter(app_id__in=app_ids)
+			rollups = rollups.filter(app_id__in=app_ids)
+			users = users.filter(app_id__in=app_ids)
+			sketches = sketches.filter(app_id__in=app_ids)
+			top_sketches = top_sketches.filter(app_id__in=app_ids)
+		with transaction.atomic():
+			rollups.delete()
+			users.delete()
+			sketches.delete()
+			top_sketches.delete()
+			for granularity, (_, trunc) in GRANULARITIES.items():
+				rows = (
+					events.annotate(b=trunc("timestamp", tzinfo=dt_timezone.utc))
+					.values("app_id", "b", **dictionary.decoded("event", "device"))
+					.annotate(c=Count("id"))
+					.order_by()
+				)
+				EventRollup.objects.bulk_create(
+					[
+						EventRollup(
+							app_id=r["app_id"], event=r["event"], granularity=granularity,
+							bucket=r["b"], device=r["device"] or "", count=r["c"],
+						)
+						for r in rows.iterator()
+					],
+					batch_size=1000,
+				)
+			user_rows = (
+				events.exclude(user_id="")
+				.values("app_id", "user_id", **dictionary.decoded("event"))
+				.distinct()
+				.order_by()
+			)
+			EventRollupUser.objects.bulk_create(
+				[
+					EventRollupUser(app_id=r["app_id"], event=r["event"], bucket=lo, user_id=r["user_id"])
+					for r in user_rows.iterator()
+				],
+				batch_size=1000,
+			)
+			built = defaultdict(HyperLogLog)
+			user_events = events.exclude(user_id="").values_list(
+				"app_id", dictionary.column("event"), "timestamp", "user_id"
+			)
+			for app_id, event, ts, user_id in user_events.iterator(chunk_size=5000):
+				for granularity in GRANULARITIES:
+					built[(app_id, event, granularity, truncate(ts, granularity))].add(user_id)
+			EventUserSketch.objects.bulk_create(
+				[
+					EventUserSketch(app_id=a, event=ev, granularity=g, bucket=b, sketch=sk.to_bytes())
+					for (a, ev, g, b), sk in built.items()
+				],
+				batch_size=500,
+			)
+			if top_sketches_enabled():
+				rows = (
+					events.values_list(
+						*map(dictionary.column, ("app_id", "event", "timestamp", "url", "referrer", "metadata"))
+					)
+					.iterator(chunk_size=5000)
+				)
+				EventTopSketch.objects.bulk_create(
+					[
+						EventTopSketch(
+							app_id=a, event=ev, bucket=b,
+							sketches=pack_sketches({d: TopSketch().update(counts) for d, counts in values.items()}),
+						)
+						for (a, ev, b), values in _top_values(rows).items()
+					],
+					batch_size=500,
+				)
+		day += timedelta(days=1)
+
+
+def approx_unique_users(app_ids, event, granularity, lo=None, hi=None):
+	sketches = filter_range(
+		EventUserSketch.objects.filter(app_id__in=app_ids, event=event, granularity=granularity),
+		lo,
+		hi,
+		field="bucket",
+	)
+	return HyperLogLog.merged(sketches.values_list("sketch", flat=True).iterator())
+
+
+def summarize(app_ids, event, lo=None, hi=None, approx=None):
+	# Returns None when [lo, hi) does not line up with rollup buckets.
+	# approx=None picks the HyperLogLog estimate once the range holds more than
+	# ANALYTICS_APPROX_UNIQUE_THRESHOLD events; True/False force either mode.
+	from .summary import distinct_users_subquery, grouped_summary
+
+	granularity = granularity_for(lo, hi)
+	if granularity is None:
+		return None
+	rollups = filter_range(
+		EventRollup.objects.filter(app_id__in=app_ids, event=event, granularity=granularity),
+		lo,
+		hi,
+		field="bucket",
+	)
+	if granularity == EventRollup.DAY:
+		users = filter_range(EventRollupUser.objects.filter(app_id__in=app_ids, event=event), lo, hi, field="bucket")
+	else:
+		# Distinct user sets are only kept per day; hour-aligned ranges count from raw events
+		users = filter_range(dictionary.filter_value(Event.objects.filter(app_id__in=app_ids), "event", event), lo, hi)
+	rows = rollups.values("device").annotate(c=Sum("count"))
+	if approx is False:
+		# Exact mode folds the distinct count into the grouped query
+		return grouped_summary(rows.annotate(u=distinct_users_subquery(users)).order_by())
+	resp = grouped_summary({**row, "u": 0} for row in rows.order_by())
+	if approx is None and resp["count"] <= getattr(settings, "ANALYTICS_APPROX_UNIQUE_THRESHOLD", 1_000_000):
+		resp["uniqueUsers"] = users.exclude(user_id="").values("user_id").distinct().count()
+	else:
+		sketch = approx_unique_users(app_ids, event, granularity, lo, hi)
+		estimate = sketch.estimate()
+		resp["uniqueUsers"] = round(estimate)
+		resp["uniqueUsersApprox"] = True
+		resp["uniqueUsersStdError"] = round(estimate * sketch.relative_error)
+	return resp
@@ -1,8 +1,41 @@
 from rest_framework import serializers
+from .dateranges import get_zone
+from .export import decode_cursor
 from .models import Event
+from .topk import DEFAULT_CAPACITY, DIMENSIONS
+
+FUNNEL_MAX_STEPS = 10
+RETENTION_MAX_WEEKS = 52
+# A paged export is read before its headers are sent (see export.read_page)
+EXPORT_MAX_LIMIT = 10000
+
+
+class TimeZoneField(serializers.CharField):
+	# IANA zone name, validated and returned as a ZoneInfo
+	def to_internal_value(self, data):
+		try:
+			return get_zone(super().to_internal_value(data))
+		except ValueError as exc:
+			raise serializers.ValidationError(str(exc))
+
+
+class CursorField(serializers.CharField):
+	# Opaque keyset cursor handed out by a previous page, decoded to (timestamp, id)
+	def to_internal_value(self, data):
+		try:
+			return decode_cursor(super().to_internal_value(data))
+		except ValueError as exc:
+			raise serializers.ValidationError(str(exc))
 
 
 class EventSerializer(serializers.ModelSerializer):
+	# Dictionary-encoded on the model (see dictionary.py); declared here so the
+	# API keeps reading and writing them as plain strings
+	event = serializers.CharField(max_length=255)
+	url = serializers.URLField(max_length=1000, required=False, allow_blank=True)
+	referrer = serializers.URLField(max_length=1000, required=False, allow_blank=True)
+	device = serializers.CharField(max_length=50, required=False, allow_blank=True)
+
 	class Meta:
 		model = Event
 		fields = [
@@ -15,6 +48,7 @@ class EventSerializer(serializers.ModelSerializer):
 			"timestamp",
 			"metadata",
 			"user_id",
+			"event_id",
 		]
 		read_only_fields = ["id"]
 
@@ -24,6 +58,74 @@ class EventSummaryQuerySerializer(serializers.Serializer):
 	startDate = serializers.DateField(required=False)
 	endDate = serializers.DateField(required=False)
 	app_id = serializers.IntegerField(required=False)
+	approx = serializers.BooleanField(required=False, allow_null=True)
+	tz = TimeZoneField(required=False)
+
+
+class TimeseriesQuerySerializer(EventSummaryQuerySerializer):
+	interval = serializers.ChoiceField(choices=["minute", "hour", "day", "week"], default="day")
+
+	def validate(self, attrs):
+		start_date, end_date = attrs.get("startDate"), attrs.get("endDate")
+		if attrs["interval"] == "minute" and not (start_date and end_date):
+			raise serializers.ValidationError("startDate and endDate are required for minute buckets.")
+		if start_date and end_date and start_date > end_date:
+			raise serializers.ValidationError("startDate must not be after endDate.")
+		return attrs
+
+
+class EventExportQuerySerializer(serializers.Serializer):
+	# Not "format": DRF reserves that query parameter for renderer selection
+	output = serializers.ChoiceField(choices=["ndjson", "csv"], default="ndjson")
+	event = serializers.CharField(required=False)
+	startDate = serializers.DateField(required=False)
+	endDate = serializers.DateField(required=False)
+	app_id = serializers.IntegerField(required=False)
+	tz = TimeZoneField(required=False)
+	cursor = CursorField(required=False)
+	limit = serializers.IntegerField(required=False, min_value=1, max_value=EXPORT_MAX_LIMIT)
+
+
+class EventListQuerySerializer(serializers.Serializer):
+	app_id = serializers.IntegerField(required=False)
+	event = serializers.CharField(required=False)
+	device = serializers.CharField(required=False, allow_blank=True)
+	user_id = serializers.CharField(required=False)
+	cursor = CursorField(required=False)
+	limit = serializers.IntegerField(required=False, min_value=1, max_value=1000, default=100)
+
+
+class TopQuerySerializer(EventSummaryQuerySerializer):
+	dimension = serializers.ChoiceField(choices=list(DIMENSIONS))
+	limit = serializers.IntegerField(required=False, min_value=1, max_value=DEFAULT_CAPACITY, default=10)
+
+
+class FunnelQuerySerializer(serializers.Serializer):
+	steps = serializers.CharField(help_text="Comma-separated event names in funnel order")
+	window = serializers.IntegerField(required=False, min_value=1, max_value=366 * 86400, default=86400)
+	startDate = serializers.DateField(required=False)
+	endDate = serializers.DateField(required=False)
+	app_id = serializers.IntegerField(required=False)
+	tz = TimeZoneField(required=False)
+
+	def validate_steps(self, value):
+		steps = [step.strip() for step in value.split(",")]
+		if len(steps) < 2 or len(steps) > FUNNEL_MAX_STEPS or not all(steps):
+			raise serializers.ValidationError(f"Expected 2 to {FUNNEL_MAX_STEPS} comma-separated event names.")
+		return steps
+
+
+class RetentionQuerySerializer(serializers.Serializer):
+	startDate = serializers.DateField(required=False)
+	endDate = serializers.DateField(required=False)
+	weeks = serializers.IntegerField(required=False, min_value=1, max_value=RETENTION_MAX_WEEKS, default=12)
+	app_id = serializers.IntegerField(required=False)
+
+	def validate(self, attrs):
+		start_date, end_date = attrs.get("startDate"), attrs.get("endDate")
+		if start_date and end_date and start_date > end_date:
+			raise serializers.ValidationError("startDate must not be after endDate.")
+		return attrs
 
 
 class UserStatsQuerySerializer(serializers.Serializer):
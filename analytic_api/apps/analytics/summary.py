@@ -0,0 +1,75 @@
+from django.db.models import Count, IntegerField, Subquery
+from apps.accounts.models import ClientApp
+from . import dictionary, profiles, rollups
+from .dateranges import date_range, filter_range
+from .models import Event
+
+
+def owner_app_ids(user, app_id=None):
+	# Resolved once per request so the aggregate queries filter on app_id IN (...)
+	# instead of joining ClientApp to check the owner.
+	app_ids = list(ClientApp.objects.filter(owner=user).values_list("id", flat=True))
+	if app_id:
+		return [app_id] if app_id in app_ids else []
+	return app_ids
+
+
+def distinct_users_subquery(qs):
+	# Scalar COUNT(DISTINCT user_id) over a single-event queryset, usable as an
+	# annotation so the device GROUP BY returns the overall unique count in the
+	# same statement. Grouping by the (constant) event keeps it one row.
+	event = "event_ref" if qs.model is Event else "event"
+	return Subquery(
+		qs.exclude(user_id="").order_by().values(event).annotate(n=Count("user_id", distinct=True)).values("n")[:1],
+		output_field=IntegerField(),
+	)
+
+
+def grouped_summary(rows):
+	device_data = {}
+	unique_users = 0
+	for row in rows:
+		key = row["device"] or "unknown"
+		device_data[key] = device_data.get(key, 0) + row["c"]
+		unique_users = row["u"] or 0
+	return {"count": sum(device_data.values()), "uniqueUsers": unique_users, "deviceData": device_data}
+
+
+def summarize_events(app_ids, event, lo=None, hi=None):
+	qs = filter_range(dictionary.filter_value(Event.objects.filter(app_id__in=app_ids), "event", event), lo, hi)
+	rows = qs.values(**dictionary.decoded("device")).annotate(c=Count("id"), u=distinct_users_subquery(qs)).order_by()
+	return grouped_summary(rows)
+
+
+def event_summary(app_ids, event, start_date=None, end_date=None, approx=None, tz=None):
+	if not app_ids:
+		return {"count": 0, "uniqueUsers": 0, "deviceData": {}}
+	lo, hi = date_range(start_date, end_date, tz)
+	if rollups.rollups_enabled():
+		summary = rollups.summarize(app_ids, event, lo, hi, approx=approx)
+		if summary is not None:
+			return summary
+	return summarize_events(app_ids, event, lo, hi)
+
+
+def user_stats(app_ids, user_id):
+	if profiles.profiles_enabled():
+		return profiles.user_stats(app_ids, user_id)
+	qs = Event.objects.filter(app_id__in=app_ids, user_id=user_id)
+	total = qs.count()
+	latest = qs.order_by("-timestamp").first()
+	device_details = {}
+	ip_address = None
+	if latest:
+		md = latest.metadata or {}
+		device_details = {
+			"browser": md.get("browser"),
+			"os": md.get("os"),
+		}
+		ip_address = latest.ip_address
+	return {
+		"userId": user_id,
+		"totalEvents": total,
+		"deviceDetails": device_details,
+		"ipAddress": ip_address,
+	}
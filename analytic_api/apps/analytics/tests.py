@@ -1,7 +1,18 @@
+import json
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 import pytest
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management import call_command
+from django.db import connection
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from apps.accounts.models import ClientApp
+from apps.analytics.models import Event, EventRollup, EventRollupUser, UserActivity, UserProfile
+from apps.analytics.hll import HyperLogLog
+from apps.analytics import dictionary, partitions, responsecache
+from apps.analytics.queue import get_aggregate_queue, get_ingest_queue
+from apps.analytics.summary import event_summary, owner_app_ids, user_stats
 from django.utils import timezone
 
 
@@ -39,3 +50,992 @@ def test_collect_and_summary_flow():
 	assert user_stats.json()["totalEvents"] >= 1
 
 
+@pytest.mark.django_db
+def test_collect_batch_reports_per_item_errors():
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	collect = APIClient()
+	now = timezone.now().isoformat()
+	resp = collect.post(
+		"/api/analytics/collect/batch",
+		{
+			"events": [
+				{"event": "page_view", "device": "desktop", "timestamp": now, "user_id": "u1"},
+				{"event": "page_view", "device": "mobile", "user_id": "u2"},
+				{"device": "mobile"},
+				{"event": "page_view", "timestamp": "not-a-date"},
+			]
+		},
+		format="json",
+		HTTP_X_API_KEY=app.api_key,
+	)
+	assert resp.status_code == 201
+	body = resp.json()
+	assert body["accepted"] == 2
+	assert body["rejected"] == 2
+	assert [e["index"] for e in body["errors"]] == [2, 3]
+	assert Event.objects.filter(app=app, event_ref__value="page_view").count() == 2
+
+	empty = collect.post("/api/analytics/collect/batch", [], format="json", HTTP_X_API_KEY=app.api_key)
+	assert empty.status_code == 400
+
+
+@pytest.mark.django_db
+def test_queue_mode_defers_writes_to_drainer(settings, tmp_path):
+	settings.INGEST_MODE = "queue"
+	settings.REDIS_URL = None
+	settings.INGEST_SPOOL_DIR = tmp_path
+	get_ingest_queue.cache_clear()
+	try:
+		get_ingest_queue().settle_seconds = 0
+		owner = User.objects.create_user(username="owner", password="p1")
+		app = ClientApp.objects.create(owner=owner, name="site1")
+		collect = APIClient()
+		resp = collect.post(
+			"/api/analytics/collect",
+			{"event": "signup", "device": "mobile", "user_id": "u1"},
+			format="json",
+			HTTP_X_API_KEY=app.api_key,
+		)
+		assert resp.status_code == 202
+		batch = collect.post(
+			"/api/analytics/collect/batch",
+			[{"event": "signup", "user_id": "u2"}, {"event": "signup", "user_id": "u3"}],
+			format="json",
+			HTTP_X_API_KEY=app.api_key,
+		)
+		assert batch.status_code == 202
+		assert Event.objects.count() == 0
+		assert get_ingest_queue().depth() == 3
+
+		call_command("drain_events", "--once")
+		assert Event.objects.filter(app=app, event_ref__value="signup").count() == 3
+		assert get_ingest_queue().depth() == 0
+	finally:
+		get_ingest_queue.cache_clear()
+
+
+@pytest.mark.django_db
+def test_deferred_aggregates_are_applied_by_drainer(settings, tmp_path, monkeypatch, django_capture_on_commit_callbacks):
+	from apps.analytics.ingest import drain_aggregates
+	from apps.analytics.models import DrainCheckpoint
+
+	def crash(count):
+		raise RuntimeError("killed before the ack")
+
+	settings.INGEST_AGGREGATES = "deferred"
+	settings.REDIS_URL = None
+	settings.INGEST_SPOOL_DIR = tmp_path
+	get_aggregate_queue.cache_clear()
+	try:
+		get_aggregate_queue().settle_seconds = 0
+		owner = User.objects.create_user(username="owner", password="p1")
+		app = ClientApp.objects.create(owner=owner, name="site1")
+		events = [
+			{"event": "checkout", "device": "mobile", "user_id": "a", "timestamp": "2024-03-01T10:00:00Z"},
+			{"event": "checkout", "device": "mobile", "user_id": "b", "timestamp": "2024-03-01T11:00:00Z"},
+		]
+		with django_capture_on_commit_callbacks(execute=True):
+			resp = APIClient().post("/api/analytics/collect/batch", events, format="json", HTTP_X_API_KEY=app.api_key)
+		assert resp.status_code == 201
+		assert Event.objects.filter(app=app).count() == 2
+		assert not EventRollup.objects.exists()
+		assert get_aggregate_queue().depth() == 2
+		assert not UserProfile.objects.exists()
+		assert not UserActivity.objects.exists()
+
+		# The records come back after a crash between the commit and the ack;
+		# the checkpoint keeps them from being counted twice
+		monkeypatch.setattr(get_aggregate_queue(), "ack", crash)
+		with pytest.raises(RuntimeError):
+			drain_aggregates(get_aggregate_queue(), 100)
+		assert EventRollup.objects.get(granularity=EventRollup.DAY).count == 2
+		get_aggregate_queue.cache_clear()
+		get_aggregate_queue().settle_seconds = 0
+		assert get_aggregate_queue().depth() == 2
+
+		call_command("drain_events", "--once")
+		assert get_aggregate_queue().depth() == 0
+		assert EventRollup.objects.get(granularity=EventRollup.DAY).count == 2
+		assert DrainCheckpoint.objects.get().event_ids == []
+		client = APIClient()
+		client.login(username="owner", password="p1")
+		params = {"event": "checkout", "startDate": "2024-03-01", "endDate": "2024-03-01"}
+		expected = {"event": "checkout", "count": 2, "uniqueUsers": 2, "deviceData": {"mobile": 2}}
+		assert client.get("/api/analytics/event-summary", params).json() == expected
+		assert client.get("/api/analytics/user-stats", {"userId": "a"}).json()["totalEvents"] == 1
+		assert UserActivity.objects.filter(app=app).count() == 2
+	finally:
+		get_aggregate_queue.cache_clear()
+		dictionary.clear_caches()
+
+
+@pytest.mark.django_db
+def test_repeated_event_ids_are_stored_once(settings, monkeypatch):
+	from types import SimpleNamespace
+	from apps.analytics import dedup
+
+	settings.REDIS_URL = None
+	dedup.get_dedup_filter.cache_clear()
+	try:
+		owner = User.objects.create_user(username="owner", password="p1")
+		app = ClientApp.objects.create(owner=owner, name="site1")
+		other = ClientApp.objects.create(owner=owner, name="site2")
+		collect = APIClient()
+		event = {"event": "purchase", "user_id": "u1", "event_id": "evt-1", "timestamp": "2024-03-01T10:00:00Z"}
+		for _ in range(2):
+			resp = collect.post("/api/analytics/collect", event, format="json", HTTP_X_API_KEY=app.api_key)
+			assert resp.status_code == 201
+		# The header stands in for event_id; ids are scoped per app
+		for _ in range(2):
+			collect.post(
+				"/api/analytics/collect",
+				{"event": "purchase"},
+				format="json",
+				HTTP_X_API_KEY=other.api_key,
+				HTTP_IDEMPOTENCY_KEY="evt-1",
+			)
+		batch = collect.post(
+			"/api/analytics/collect/batch",
+			[event, {**event, "event_id": "evt-2"}, {**event, "event_id": "evt-2"}, {"event": "purchase"}],
+			format="json",
+			HTTP_X_API_KEY=app.api_key,
+		)
+		assert batch.status_code == 201 and batch.json()["accepted"] == 4
+		assert sorted(Event.objects.filter(app=app).values_list("event_id", flat=True)) == ["", "evt-1", "evt-2"]
+		assert Event.objects.filter(app=other, event_id="evt-1").count() == 1
+		assert sum(EventRollup.objects.filter(app=app, granularity=EventRollup.DAY).values_list("count", flat=True)) == 3
+
+		# A retry the filter has forgotten is still caught by the database check
+		dedup.get_dedup_filter.cache_clear()
+		settings.INGEST_DEDUP_FILTER = False
+		collect.post("/api/analytics/collect", event, format="json", HTTP_X_API_KEY=app.api_key)
+		assert Event.objects.filter(app=app).count() == 3
+
+		# Keys are remembered for the current and the previous window
+		clock = SimpleNamespace(time=lambda: 0.0)
+		monkeypatch.setattr(dedup, "time", clock)
+		bloom = dedup.LocalRotatingBloom(window=60, capacity=1000, error_rate=0.01)
+		assert bloom.check_and_add(["a", "b"]) == [False, False]
+		assert bloom.check_and_add(["a", "c"]) == [True, False]
+		clock.time = lambda: 90.0
+		assert bloom.check_and_add(["b"]) == [True]
+		clock.time = lambda: 150.0
+		assert bloom.check_and_add(["a", "b"]) == [False, True]
+		clock.time = lambda: 400.0
+		assert bloom.check_and_add(["b"]) == [False]
+	finally:
+		dedup.get_dedup_filter.cache_clear()
+
+
+@pytest.mark.django_db
+def test_summary_reads_rollups_and_rebuild_matches_ingest():
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	collect = APIClient()
+	events = [
+		{"event": "checkout", "device": "mobile", "user_id": "a", "timestamp": "2024-03-01T10:00:00Z"},
+		{"event": "checkout", "device": "mobile", "user_id": "a", "timestamp": "2024-03-01T23:59:59Z"},
+		{"event": "checkout", "device": "desktop", "user_id": "b", "timestamp": "2024-03-02T00:00:00Z"},
+		{"event": "checkout", "device": "", "timestamp": "2024-03-03T08:00:00Z"},
+	]
+	resp = collect.post("/api/analytics/collect/batch", events, format="json", HTTP_X_API_KEY=app.api_key)
+	assert resp.status_code == 201
+	assert EventRollup.objects.filter(granularity=EventRollup.DAY).count() == 3
+
+	client = APIClient()
+	client.login(username="owner", password="p1")
+	params = {"event": "checkout", "startDate": "2024-03-01", "endDate": "2024-03-02"}
+	expected = {"event": "checkout", "count": 3, "uniqueUsers": 2, "deviceData": {"mobile": 2, "desktop": 1}}
+	assert client.get("/api/analytics/event-summary", params).json() == expected
+
+	EventRollup.objects.all().delete()
+	EventRollupUser.objects.all().delete()
+	call_command("rollup_events")
+	cache.clear()
+	client.login(username="owner", password="p1")
+	assert client.get("/api/analytics/event-summary", params).json() == expected
+	full = client.get("/api/analytics/event-summary", {"event": "checkout"}).json()
+	assert full["count"] == 4
+	assert full["deviceData"]["unknown"] == 1
+
+
+def test_hyperloglog_estimate_merge_and_serialization():
+	a = HyperLogLog().update(f"user-{i}" for i in range(20000))
+	b = HyperLogLog().update(f"user-{i}" for i in range(10000, 30000))
+	assert abs(a.estimate() - 20000) / 20000 < 4 * a.relative_error
+	restored = HyperLogLog.from_bytes(a.to_bytes())
+	assert restored.registers == a.registers
+	merged = restored.merge(b)
+	assert abs(merged.estimate() - 30000) / 30000 < 4 * a.relative_error
+	assert len(HyperLogLog().update(["x", "y", "x"])) == 2
+
+
+@pytest.mark.django_db
+def test_summary_approx_unique_users():
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	events = [
+		{"event": "view", "user_id": f"u{i % 40}", "timestamp": f"2024-05-0{1 + i % 3}T12:00:00Z"}
+		for i in range(120)
+	]
+	resp = APIClient().post("/api/analytics/collect/batch", events, format="json", HTTP_X_API_KEY=app.api_key)
+	assert resp.status_code == 201
+
+	client = APIClient()
+	client.login(username="owner", password="p1")
+	exact = client.get("/api/analytics/event-summary", {"event": "view"}).json()
+	assert exact["uniqueUsers"] == 40
+	assert "uniqueUsersApprox" not in exact
+	approx = client.get("/api/analytics/event-summary", {"event": "view", "approx": "true"}).json()
+	assert approx["uniqueUsersApprox"] is True
+	assert abs(approx["uniqueUsers"] - 40) <= 2
+	assert approx["count"] == 120
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("use_rollups", [False, True])
+def test_event_summary_is_one_grouped_query(
+	settings, django_assert_num_queries, django_capture_on_commit_callbacks, use_rollups
+):
+	settings.ANALYTICS_USE_ROLLUPS = True
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	events = [
+		{"event": "play", "device": device, "user_id": user, "timestamp": "2024-06-01T09:00:00Z"}
+		for device, user in [("tv", "a"), ("tv", "b"), ("mobile", "a"), ("", "")]
+	]
+	try:
+		# Committing the ingest caches the event name ids, as it does outside tests
+		with django_capture_on_commit_callbacks(execute=True):
+			APIClient().post("/api/analytics/collect/batch", events, format="json", HTTP_X_API_KEY=app.api_key)
+		settings.ANALYTICS_USE_ROLLUPS = use_rollups
+		# one query for the owner's app ids, one for the grouped aggregate
+		with django_assert_num_queries(2):
+			summary = event_summary(owner_app_ids(owner), "play", approx=False)
+	finally:
+		dictionary.clear_caches()
+	assert summary == {"count": 4, "uniqueUsers": 2, "deviceData": {"tv": 2, "mobile": 1, "unknown": 1}}
+
+
+@pytest.mark.django_db
+def test_summary_date_range_honours_timezone():
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	events = [
+		{"event": "open", "device": "mobile", "user_id": "a", "timestamp": "2024-03-01T23:30:00Z"},
+		{"event": "open", "device": "mobile", "user_id": "b", "timestamp": "2024-03-02T12:00:00Z"},
+	]
+	APIClient().post("/api/analytics/collect/batch", events, format="json", HTTP_X_API_KEY=app.api_key)
+	client = APIClient()
+	client.login(username="owner", password="p1")
+
+	def count(day, tz=None):
+		params = {"event": "open", "startDate": day, "endDate": day}
+		if tz:
+			params["tz"] = tz
+		return client.get("/api/analytics/event-summary", params).json()["count"]
+
+	assert count("2024-03-01") == 1
+	assert count("2024-03-02") == 1
+	# hour-aligned offset is served from hourly rollups, half-hour offset from raw events
+	assert count("2024-03-01", "America/New_York") == 1
+	assert count("2024-03-02", "America/New_York") == 1
+	assert count("2024-03-02", "Asia/Kolkata") == 2
+	bad = client.get("/api/analytics/event-summary", {"event": "open", "tz": "Mars/Olympus"})
+	assert bad.status_code == 400
+
+
+@pytest.mark.django_db
+def test_timeseries_buckets_match_between_rollups_and_raw(settings):
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	events = [
+		{"event": "click", "device": "mobile", "user_id": "a", "timestamp": "2024-04-01T01:15:00Z"},
+		{"event": "click", "device": "desktop", "user_id": "b", "timestamp": "2024-04-01T01:45:00Z"},
+		{"event": "click", "device": "mobile", "user_id": "a", "timestamp": "2024-04-01T05:00:00Z"},
+		{"event": "click", "device": "mobile", "user_id": "c", "timestamp": "2024-04-02T10:00:00Z"},
+	]
+	APIClient().post("/api/analytics/collect/batch", events, format="json", HTTP_X_API_KEY=app.api_key)
+	client = APIClient()
+	client.login(username="owner", password="p1")
+
+	def fetch(**params):
+		params = {"event": "click", "startDate": "2024-03-31", "endDate": "2024-04-02", **params}
+		resp = client.get("/api/analytics/timeseries", params)
+		assert resp.status_code == 200
+		return json.loads(b"".join(resp.streaming_content))["series"]
+
+	hourly = fetch(interval="hour")
+	assert [b["count"] for b in hourly] == [2, 1, 1]
+	assert hourly[0] == {
+		"bucket": "2024-04-01T01:00:00+00:00",
+		"count": 2,
+		"uniqueUsers": 2,
+		"deviceData": {"mobile": 1, "desktop": 1},
+	}
+	daily_ny = fetch(interval="day", tz="America/New_York")
+	assert [(b["bucket"], b["count"], b["uniqueUsers"]) for b in daily_ny] == [
+		("2024-03-31T00:00:00-04:00", 2, 2),
+		("2024-04-01T00:00:00-04:00", 1, 1),
+		("2024-04-02T00:00:00-04:00", 1, 1),
+	]
+	settings.ANALYTICS_USE_ROLLUPS = False
+	assert fetch(interval="hour") == hourly
+	assert fetch(interval="day", tz="America/New_York") == daily_ny
+	assert client.get("/api/analytics/timeseries", {"event": "click", "interval": "minute"}).status_code == 400
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="partitioning needs PostgreSQL")
+def test_partition_for_a_month_with_rows_in_the_default_partition():
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	# Past the partitions the migration created, so the row lands in the default one
+	month = partitions.add_months(partitions.month_start(timezone.now().date()), 12)
+	Event(app=app, timestamp=datetime(month.year, month.month, 15, tzinfo=dt_timezone.utc)).set_dimensions(event="late").save()
+	with connection.cursor() as cursor:
+		cursor.execute('SELECT COUNT(*) FROM "analytics_event_default"')
+		assert cursor.fetchone()[0] == 1
+	names = partitions.ensure_partitions(month, 12)
+	assert names == [partitions.partition_name(month)]
+	with connection.cursor() as cursor:
+		cursor.execute('SELECT COUNT(*) FROM "analytics_event_default"')
+		assert cursor.fetchone()[0] == 0
+		cursor.execute(f'SELECT COUNT(*) FROM "{names[0]}"')
+		assert cursor.fetchone()[0] == 1
+	assert (names[0], month) in partitions.list_partitions()
+	assert Event.objects.filter(app=app).get().event == "late"
+
+
+@pytest.mark.django_db
+def test_prune_events_applies_per_app_retention(settings):
+	settings.EVENT_RETENTION_DAYS = None
+	owner = User.objects.create_user(username="owner", password="p1")
+	short = ClientApp.objects.create(owner=owner, name="short", retention_days=30)
+	forever = ClientApp.objects.create(owner=owner, name="forever")
+	old = (timezone.now() - timedelta(days=45)).isoformat()
+	recent = timezone.now().isoformat()
+	for app in (short, forever):
+		APIClient().post(
+			"/api/analytics/collect/batch",
+			[{"event": "e", "user_id": "u", "timestamp": ts} for ts in (old, old, recent)],
+			format="json",
+			HTTP_X_API_KEY=app.api_key,
+		)
+	call_command("prune_events", "--batch-size", "1")
+	assert Event.objects.filter(app=short).count() == 1
+	assert Event.objects.filter(app=forever).count() == 3
+	assert EventRollupUser.objects.filter(app=short).count() == 1
+
+	# The aggregates of the pruned range go with its events
+	client = APIClient()
+	client.login(username="owner", password="p1")
+	day = (timezone.now() - timedelta(days=45)).date().isoformat()
+	pruned = {"event": "e", "startDate": day, "endDate": day}
+	empty = {"event": "e", "count": 0, "uniqueUsers": 0, "deviceData": {}}
+	assert client.get("/api/analytics/event-summary", {**pruned, "app_id": short.id}).json() == empty
+	resp = client.get("/api/analytics/event-summary", {**pruned, "app_id": short.id, "approx": "true"}).json()
+	assert (resp["count"], resp["uniqueUsers"]) == (0, 0)
+	assert client.get("/api/analytics/event-summary", {**pruned, "app_id": forever.id}).json()["count"] == 2
+def test_response_cache_single_flight_and_stale_while_revalidate(settings):
+	cache.clear()
+	calls = []
+
+	def compute():
+		calls.append(1)
+		return {}
+
+	scopes = [responsecache.event_scope(1, "e")]
+	assert responsecache.get_or_compute("k", scopes, compute) == ({}, "miss")
+	# an empty result is a cache hit, not a miss
+	assert responsecache.get_or_compute("k", scopes, compute) == ({}, "hit")
+	assert len(calls) == 1
+
+	responsecache.bump_versions(scopes)
+	cache.add(responsecache.LOCK_PREFIX + "k", 1)
+	# another worker holds the recompute lock: serve the stale entry
+	assert responsecache.get_or_compute("k", scopes, compute) == ({}, "stale")
+	assert len(calls) == 1
+	cache.delete(responsecache.LOCK_PREFIX + "k")
+	assert responsecache.get_or_compute("k", scopes, compute) == ({}, "miss")
+	assert len(calls) == 2
+
+
+@pytest.mark.django_db
+def test_ingest_invalidates_cached_summary_and_user_stats():
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	client = APIClient()
+	client.login(username="owner", password="p1")
+	collect = APIClient()
+	for expected in (1, 2):
+		collect.post(
+			"/api/analytics/collect",
+			{"event": "tap", "user_id": "u1", "metadata": {"browser": f"b{expected}"}},
+			format="json",
+			HTTP_X_API_KEY=app.api_key,
+		)
+		assert client.get("/api/analytics/event-summary", {"event": "tap"}).json()["count"] == expected
+		stats = client.get("/api/analytics/user-stats", {"userId": "u1"}).json()
+		assert stats["totalEvents"] == expected
+
+
+@pytest.mark.django_db
+def test_user_profiles_match_raw_stats_and_backfill(settings, django_assert_num_queries):
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	other = ClientApp.objects.create(owner=owner, name="site2")
+	collect = APIClient()
+	collect.post(
+		"/api/analytics/collect/batch",
+		[
+			{"event": "a", "user_id": "u1", "device": "mobile", "ip_address": "1.1.1.1",
+			 "metadata": {"browser": "Chrome", "os": "Android"}, "timestamp": "2024-01-02T00:00:00Z"},
+			{"event": "b", "user_id": "u1", "device": "desktop", "ip_address": "2.2.2.2",
+			 "metadata": {"browser": "Firefox", "os": "Linux"}, "timestamp": "2024-01-01T00:00:00Z"},
+		],
+		format="json",
+		HTTP_X_API_KEY=app.api_key,
+	)
+	collect.post(
+		"/api/analytics/collect",
+		{"event": "c", "user_id": "u1", "device": "tablet", "ip_address": "3.3.3.3",
+		 "metadata": {"browser": "Safari", "os": "iOS"}, "timestamp": "2024-01-03T00:00:00Z"},
+		format="json",
+		HTTP_X_API_KEY=other.api_key,
+	)
+	profile = UserProfile.objects.get(app=app, user_id="u1")
+	assert profile.total_events == 2
+	assert profile.browser == "Chrome"
+	assert profile.first_seen.isoformat() == "2024-01-01T00:00:00+00:00"
+
+	app_ids = owner_app_ids(owner)
+	with django_assert_num_queries(1):
+		fast = user_stats(app_ids, "u1")
+	settings.ANALYTICS_USE_USER_PROFILES = False
+	assert user_stats(app_ids, "u1") == fast == {
+		"userId": "u1",
+		"totalEvents": 3,
+		"deviceDetails": {"browser": "Safari", "os": "iOS"},
+		"ipAddress": "3.3.3.3",
+	}
+	UserProfile.objects.all().delete()
+	call_command("backfill_user_profiles")
+	settings.ANALYTICS_USE_USER_PROFILES = True
+	assert user_stats(app_ids, "u1") == fast
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_columnar_export_is_incremental_and_matches_summary(tmp_path, fmt):
+	pytest.importorskip("pyarrow")
+	from apps.analytics import columnar
+
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	collect = APIClient()
+	first = [
+		{"event": "buy", "device": "mobile", "user_id": "a", "timestamp": "2024-02-01T10:00:00Z"},
+		{"event": "buy", "device": "", "user_id": "", "timestamp": "2024-02-02T10:00:00Z"},
+	]
+	collect.post("/api/analytics/collect/batch", first, format="json", HTTP_X_API_KEY=app.api_key)
+	assert columnar.export_events(tmp_path, fmt=fmt) == 0
+	assert columnar.export_events(tmp_path, fmt=fmt, chunk_size=1, lag_seconds=0) == 2
+	collect.post(
+		"/api/analytics/collect/batch",
+		[{"event": "buy", "device": "mobile", "user_id": "b", "timestamp": "2024-02-02T11:00:00Z", "metadata": {"k": 1}}],
+		format="json",
+		HTTP_X_API_KEY=app.api_key,
+	)
+	assert columnar.export_events(tmp_path, fmt=fmt, lag_seconds=0) == 1
+	assert columnar.export_events(tmp_path, fmt=fmt, lag_seconds=0) == 0
+	assert (tmp_path / f"app_id={app.id}" / "date=2024-02-02").is_dir()
+
+	app_ids = [app.id]
+	for start, end in [(None, None), (date(2024, 2, 2), date(2024, 2, 2))]:
+		offline = columnar.event_summary(tmp_path, app_ids, "buy", start, end, fmt=fmt)
+		assert offline == event_summary(app_ids, "buy", start, end, approx=False)
+
+
+@pytest.mark.django_db
+def test_event_export_streams_keyset_pages():
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	stranger = ClientApp.objects.create(owner=User.objects.create_user(username="x", password="p"), name="other")
+	batch = [{"event": "e", "user_id": f"u{i}", "timestamp": "2024-01-01T00:00:00Z"} for i in range(5)]
+	APIClient().post("/api/analytics/collect/batch", batch, format="json", HTTP_X_API_KEY=app.api_key)
+	APIClient().post("/api/analytics/collect/batch", batch, format="json", HTTP_X_API_KEY=stranger.api_key)
+	client = APIClient()
+	client.login(username="owner", password="p1")
+
+	seen, cursor = [], None
+	while True:
+		params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+		resp = client.get("/api/analytics/events/export", params)
+		assert resp.status_code == 200
+		seen += [json.loads(line)["user_id"] for line in b"".join(resp.streaming_content).splitlines()]
+		cursor = resp.get("X-Next-Cursor")
+		if not cursor:
+			break
+	assert seen == [f"u{i}" for i in range(5)]
+
+	csv_resp = client.get("/api/analytics/events/export", {"output": "csv"})
+	lines = b"".join(csv_resp.streaming_content).decode().splitlines()
+	assert lines[0].startswith("id,app_id,event")
+	assert len(lines) == 6
+	assert client.get("/api/analytics/events/export", {"cursor": "!!"}).status_code == 400
+	assert client.get("/api/analytics/events/export", {"limit": 10001}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_exports_stream_through_async_iterators_under_asgi():
+	from asgiref.sync import async_to_sync
+	from django.test import AsyncClient
+
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	batch = [{"event": "e", "user_id": f"u{i}", "timestamp": "2024-01-01T00:00:00Z"} for i in range(3)]
+	APIClient().post("/api/analytics/collect/batch", batch, format="json", HTTP_X_API_KEY=app.api_key)
+	client = AsyncClient()
+	client.force_login(owner)
+
+	async def fetch(path, params):
+		resp = await client.get(path, params)
+		assert resp.status_code == 200 and resp.is_async
+		return b"".join([chunk async for chunk in resp.streaming_content])
+
+	lines = async_to_sync(fetch)("/api/analytics/events/export", {}).splitlines()
+	assert [json.loads(line)["user_id"] for line in lines] == ["u0", "u1", "u2"]
+	series = json.loads(async_to_sync(fetch)("/api/analytics/timeseries", {"event": "e"}))
+	assert series["series"][0]["count"] == 3
+
+
+@pytest.mark.django_db
+def test_event_list_filters_metadata_and_pages_newest_first():
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	batch = [
+		{
+			"event": "view",
+			"user_id": f"u{i}",
+			"timestamp": f"2024-01-01T00:0{i}:00Z",
+			"metadata": {"browser": "Chrome" if i % 2 else "Firefox", "plan": "pro" if i < 3 else "free"},
+		}
+		for i in range(6)
+	]
+	APIClient().post("/api/analytics/collect/batch", batch, format="json", HTTP_X_API_KEY=app.api_key)
+	assert Event.objects.filter(meta_browser="Chrome").count() == 3
+	client = APIClient()
+	client.login(username="owner", password="p1")
+
+	seen, cursor = [], None
+	while True:
+		params = {"limit": 2, "metadata.browser": "Chrome", **({"cursor": cursor} if cursor else {})}
+		resp = client.get("/api/analytics/events", params)
+		assert resp.status_code == 200
+		seen += [row["user_id"] for row in resp.data["results"]]
+		cursor = resp.data["next"]
+		if not cursor:
+			break
+	assert seen == ["u5", "u3", "u1"]
+
+	resp = client.get("/api/analytics/events", {"metadata.plan": "pro", "user_id": "u2"})
+	assert [row["user_id"] for row in resp.data["results"]] == ["u2"]
+	assert client.get("/api/analytics/events", {"limit": 5000}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_event_strings_are_stored_in_dimension_tables():
+	from apps.analytics.models import DeviceName, EventName, Url
+
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	batch = [
+		{"event": "view", "url": "https://example.com/a", "referrer": "https://example.com/", "device": "mobile"},
+		{"event": "view", "url": "https://example.com/", "device": "", "timestamp": "2024-01-01T00:00:00Z"},
+	]
+	APIClient().post("/api/analytics/collect/batch", batch, format="json", HTTP_X_API_KEY=app.api_key)
+	# One row per distinct string; url and referrer share the Url table
+	assert (EventName.objects.count(), Url.objects.count(), DeviceName.objects.count()) == (1, 2, 1)
+	old = Event.objects.get(app=app, timestamp="2024-01-01T00:00:00Z")
+	assert (old.event, old.url, old.referrer, old.device, old.device_ref_id) == ("view", "https://example.com/", "", "", None)
+
+	client = APIClient()
+	client.login(username="owner", password="p1")
+	rows = client.get("/api/analytics/events", {"device": "mobile"}).data["results"]
+	assert [(r["event"], r["url"], r["referrer"], r["device"]) for r in rows] == [
+		("view", "https://example.com/a", "https://example.com/", "mobile")
+	]
+	assert client.get("/api/analytics/events", {"event": "missing"}).data["results"] == []
+	exported = [json.loads(line) for line in b"".join(client.get("/api/analytics/events/export").streaming_content).splitlines()]
+	assert [r["device"] for r in exported] == ["", "mobile"]
+	assert client.get("/api/analytics/event-summary", {"event": "view"}).json()["deviceData"] == {"mobile": 1, "unknown": 1}
+
+	# set_dimensions interns through the same tables
+	Event(app=app, timestamp=timezone.now()).set_dimensions(event="view", device="tablet").save()
+	assert (EventName.objects.count(), DeviceName.objects.count()) == (1, 2)
+
+
+FAST_PATH_ACCEPTED = [
+	{"event": "view", "timestamp": "2024-01-01T00:00:00Z"},
+	{"event": "  view ", "timestamp": "2024-01-01T10:00:00+05:30", "user_id": "u1", "device": ""},
+	{"event": "view", "timestamp": "2024-01-01 10:00", "url": "https://example.com/a?b=1", "referrer": ""},
+	{"event": "view", "timestamp": "2024-01-01T00:00:00.123456", "ip_address": "2001:db8::0:1"},
+	{"event": 42, "timestamp": 1700000000, "metadata": {"browser": "Chrome", "nested": [1, {"a": None}]}},
+	{"event": "view", "ip_address": "", "metadata": [], "unknown": "ignored"},
+	{"event": "view", "ip_address": "10.0.0.1", "id": 99},
+]
+FAST_PATH_REJECTED = [
+	{},
+	{"event": ""},
+	{"event": "   "},
+	{"event": None},
+	{"event": True},
+	{"event": ["view"]},
+	{"event": "x" * 256},
+	{"event": "view\x00"},
+	{"event": "view", "timestamp": "yesterday"},
+	{"event": "view", "timestamp": "2024-13-01T00:00:00Z"},
+	{"event": "view", "url": "not a url"},
+	{"event": "view", "url": "https://example.com/" + "a" * 1000},
+	{"event": "view", "referrer": None},
+	{"event": "view", "device": "d" * 51},
+	{"event": "view", "ip_address": "300.1.1.1"},
+	{"event": "view", "ip_address": "fe80::zz"},
+	{"event": "view", "ip_address": 12},
+	{"event": "view", "metadata": None},
+	{"event": "view", "user_id": {"id": 1}},
+]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("payload", FAST_PATH_ACCEPTED + FAST_PATH_REJECTED)
+def test_fast_event_validator_matches_serializer(payload):
+	from rest_framework.exceptions import ValidationError
+	from apps.analytics.ingest import prepare_event, validate_with_serializer
+	from apps.analytics.validation import EventValidator
+
+	validator = EventValidator()
+	# Run twice so the memoized results are checked as well
+	results = [validator.validate(dict(payload), "127.0.0.1") for _ in range(2)]
+	try:
+		expected = validate_with_serializer(dict(payload), "127.0.0.1")
+	except ValidationError as exc:
+		assert results == [None, None]
+		with pytest.raises(ValidationError) as fast_exc:
+			prepare_event(dict(payload), "127.0.0.1")
+		assert fast_exc.value.detail == exc.detail
+		return
+	assert payload in FAST_PATH_ACCEPTED
+	expected = dict(expected)
+	for result in results:
+		if not isinstance(payload.get("timestamp"), str):
+			# Both default to now()
+			assert abs(result.pop("timestamp") - expected["timestamp"]).total_seconds() < 5
+			result["timestamp"] = expected["timestamp"]
+		assert result == expected
+
+
+@pytest.mark.django_db
+def test_beacon_accepts_pixel_and_send_beacon_bodies():
+	from django.test import Client
+	from apps.analytics.beacon import PIXEL
+
+	app = ClientApp.objects.create(owner=User.objects.create_user(username="owner", password="p1"), name="site1")
+	client = Client(enforce_csrf_checks=True)
+	resp = client.get(
+		"/api/analytics/beacon",
+		{"key": app.api_key, "event": "view", "user_id": "u1", "metadata": '{"browser": "Safari"}'},
+		HTTP_REFERER="https://example.com/pricing",
+	)
+	assert resp.status_code == 200
+	assert resp["Content-Type"] == "image/gif" and resp.content == PIXEL
+	# Served before the session/CSRF middleware
+	assert "Set-Cookie" not in resp and not hasattr(resp.wsgi_request, "session")
+
+	body = f"key={app.api_key}&event=unload&user_id=u1"
+	assert client.post("/api/analytics/beacon", body, content_type="text/plain").status_code == 204
+	events = json.dumps({"key": app.api_key, "event": "scroll", "timestamp": "2024-01-01T00:00:00Z"})
+	assert client.post("/api/analytics/beacon", events, content_type="text/plain").status_code == 204
+	# fetch() with a JSON content type is preflighted; CORS answers both requests
+	origin = {"HTTP_ORIGIN": "https://example.com"}
+	preflight = client.options("/api/analytics/beacon", HTTP_ACCESS_CONTROL_REQUEST_METHOD="POST", **origin)
+	assert preflight.status_code == 200 and preflight["Access-Control-Allow-Origin"] == "*"
+	clicked = json.dumps([{"event": "click"}])
+	resp = client.post(f"/api/analytics/beacon?key={app.api_key}", clicked, content_type="application/json", **origin)
+	assert resp.status_code == 204 and resp["Access-Control-Allow-Origin"] == "*"
+
+	stored = {e.event: e for e in Event.objects.filter(app=app)}
+	assert set(stored) == {"view", "unload", "scroll", "click"}
+	assert stored["view"].url == "https://example.com/pricing" and stored["view"].meta_browser == "Safari"
+	assert client.get("/api/analytics/beacon", {"key": "nope", "event": "x"}).status_code == 403
+	assert client.get("/api/analytics/beacon", {"key": app.api_key}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_async_collect_view_matches_drf_view(settings, tmp_path):
+	from asgiref.sync import async_to_sync
+	from django.test import AsyncClient, AsyncRequestFactory
+	from apps.analytics.asyncviews import collect_event
+
+	app = ClientApp.objects.create(owner=User.objects.create_user(username="owner", password="p1"), name="site1")
+	factory = AsyncRequestFactory()
+
+	def post(payload, key=app.api_key):
+		request = factory.post("/api/analytics/collect", payload, content_type="application/json", headers={"X-API-KEY": key})
+		return async_to_sync(collect_event)(request)
+
+	resp = post({"event": "signup", "user_id": "u1", "timestamp": "2024-01-01T00:00:00Z"})
+	assert resp.status_code == 201
+	assert Event.objects.get(app=app).user_id == "u1"
+	assert post({"event": "x"}, key="nope").status_code == 403
+	bad = {"event": "x", "url": "not a url"}
+	drf = APIClient().post("/api/analytics/collect", bad, format="json", HTTP_X_API_KEY=app.api_key)
+	resp = post(bad)
+	assert resp.status_code == drf.status_code == 400
+	assert json.loads(resp.content) == drf.json()
+
+	# Under ASGI the middleware answers collect itself, with CORS headers only
+	settings.COLLECT_ASYNC = True
+	settings.CORS_ALLOW_ALL_ORIGINS = True
+	settings.MIDDLEWARE = [m for m in settings.MIDDLEWARE if "whitenoise" not in m]  # SERVE_STATIC=false
+	resp = async_to_sync(AsyncClient().post)(
+		"/api/analytics/collect",
+		{"event": "view"},
+		content_type="application/json",
+		headers={"X-API-KEY": app.api_key, "Origin": "https://example.com"},
+	)
+	assert resp.status_code == 201
+	assert resp["Access-Control-Allow-Origin"] == "*"
+	assert "X-Frame-Options" not in resp
+
+	settings.INGEST_MODE = "queue"
+	settings.REDIS_URL = None
+	settings.INGEST_SPOOL_DIR = tmp_path
+	get_ingest_queue.cache_clear()
+	try:
+		assert post({"event": "signup", "user_id": "u2"}).status_code == 202
+		assert get_ingest_queue().depth() == 1
+	finally:
+		get_ingest_queue.cache_clear()
+
+
+@pytest.mark.django_db
+def test_collect_token_bucket_uses_per_app_rate():
+	from apps.analytics.ratelimit import CacheTokenBucket
+
+	bucket = CacheTokenBucket()
+	assert [bucket.hit("ratelimit:test:k", 2, 1.0)[0] for _ in range(3)] == [True, True, False]
+	assert 0 < bucket.hit("ratelimit:test:k", 2, 1.0)[1] <= 1
+
+	owner = User.objects.create_user(username="owner", password="p1")
+	limited = ClientApp.objects.create(owner=owner, name="limited", collect_rate="2/minute")
+	default = ClientApp.objects.create(owner=owner, name="default")
+	client = APIClient()
+	statuses = [
+		client.post("/api/analytics/collect", {"event": "e"}, format="json", HTTP_X_API_KEY=limited.api_key).status_code
+		for _ in range(3)
+	]
+	assert statuses == [201, 201, 429]
+	resp = client.post("/api/analytics/collect", {"event": "e"}, format="json", HTTP_X_API_KEY=default.api_key)
+	assert resp.status_code == 201
+	# Beacons share the app's bucket
+	assert client.get("/api/analytics/beacon", {"key": limited.api_key, "event": "e"}).status_code == 429
+
+	app = ClientApp(owner=owner, name="bad", collect_rate="fast")
+	with pytest.raises(DjangoValidationError):
+		app.full_clean()
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint_reports_latency_queries_cache_and_ingest(settings, caplog):
+	from prometheus_client import REGISTRY
+
+	def sample(name, **labels):
+		return REGISTRY.get_sample_value(name, labels) or 0
+
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	route = {"method": "POST", "route": "api/analytics/collect", "status": "201"}
+	before = {
+		"latency": sample("analytics_http_request_duration_seconds_count", **route),
+		"ingest": sample("analytics_ingested_events_total", app_id=str(app.id), mode="stored"),
+		"miss": sample("analytics_response_cache_total", cache="event-summary", state="miss"),
+		"hit": sample("analytics_response_cache_total", cache="event-summary", state="hit"),
+	}
+	client = APIClient()
+	client.post("/api/analytics/collect", {"event": "signup"}, format="json", HTTP_X_API_KEY=app.api_key)
+	client.force_authenticate(owner)
+	for _ in range(2):
+		assert client.get("/api/analytics/event-summary", {"event": "signup"}).status_code == 200
+
+	assert sample("analytics_http_request_duration_seconds_count", **route) == before["latency"] + 1
+	assert sample("analytics_ingested_events_total", app_id=str(app.id), mode="stored") == before["ingest"] + 1
+	assert sample("analytics_response_cache_total", cache="event-summary", state="miss") == before["miss"] + 1
+	assert sample("analytics_response_cache_total", cache="event-summary", state="hit") == before["hit"] + 1
+	assert sample("analytics_http_request_db_queries_sum", route="api/analytics/collect") > 0
+
+	settings.METRICS_TOKEN = ""
+	assert APIClient().get("/metrics").status_code == 404
+	settings.METRICS_TOKEN = "secret"
+	assert APIClient().get("/metrics").status_code == 401
+	resp = APIClient().get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+	assert resp.status_code == 200
+	assert b'analytics_http_request_duration_seconds_bucket{le="0.005",method="POST",route="api/analytics/collect"' in resp.content
+
+	# Opt-in slow-request log with the request's SQL
+	settings.SLOW_REQUEST_MS = 0
+	with caplog.at_level("WARNING", logger="apps.analytics.slow_requests"):
+		APIClient().post("/api/analytics/collect", {"event": "signup"}, format="json", HTTP_X_API_KEY=app.api_key)
+	assert "slow request POST /api/analytics/collect" in caplog.text
+	assert "INSERT INTO" in caplog.text
+
+
+@pytest.mark.django_db
+def test_funnel_counts_ordered_steps_within_window():
+	from datetime import datetime, timezone as dt_timezone
+	from apps.analytics.funnel import sql_depth_counts, stream_depths
+
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	other = ClientApp.objects.create(owner=owner, name="site2")
+	t0 = datetime(2024, 3, 1, 12, tzinfo=dt_timezone.utc)
+
+	def add(user, event, minutes, target=app):
+		Event(app=target, user_id=user, timestamp=t0 + timedelta(minutes=minutes)).set_dimensions(event=event).save()
+
+	# u1 completes; u2 buys before logging in; u3 is too slow from its only signup;
+	# u4 restarts with a later signup that fits the window; u5 only signs up
+	for user, steps in {
+		"u1": [("signup", 0), ("login", 5), ("purchase", 30)],
+		"u2": [("signup", 0), ("purchase", 1), ("login", 2)],
+		"u3": [("signup", 0), ("login", 10), ("purchase", 120)],
+		"u4": [("signup", 0), ("login", 70), ("signup", 90), ("login", 95), ("purchase", 100)],
+		"u5": [("signup", 0), ("click", 1)],
+	}.items():
+		for event, minutes in steps:
+			add(user, event, minutes)
+	# Same user_id in another app is another user
+	add("u1", "signup", 0, other)
+	add("", "signup", 0)
+
+	steps = ["signup", "login", "purchase"]
+	window = timedelta(hours=1)
+	expected = {3: 2, 2: 2, 1: 2}
+	depths = {}
+	for depth in stream_depths([app.id, other.id], steps, window):
+		depths[depth] = depths.get(depth, 0) + 1
+	assert depths == expected
+	assert sql_depth_counts([app.id, other.id], steps, window) == expected
+
+	client = APIClient()
+	client.force_authenticate(owner)
+	resp = client.get("/api/analytics/funnel", {"steps": "signup,login,purchase", "window": 3600})
+	assert resp.status_code == 200
+	assert [(s["event"], s["users"]) for s in resp.json()["steps"]] == [("signup", 6), ("login", 4), ("purchase", 2)]
+	assert resp.json()["steps"][2]["stepConversion"] == 0.5
+	resp = client.get("/api/analytics/funnel", {"steps": "signup,login", "app_id": app.id, "startDate": "2024-03-02"})
+	assert [s["users"] for s in resp.json()["steps"]] == [0, 0]
+	assert client.get("/api/analytics/funnel", {"steps": "signup"}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_retention_cohorts_from_activity_bitmaps():
+	from datetime import datetime, timezone as dt_timezone
+	from apps.analytics import cohorts
+	from apps.analytics.ingest import store_events
+
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	monday = date(2024, 1, 1)
+
+	def at(day, offset_days, hour=12):
+		return datetime.combine(day + timedelta(days=offset_days), datetime.min.time(), tzinfo=dt_timezone.utc).replace(hour=hour)
+
+	def ingest(user, *days):
+		store_events(app, [{"event": "view", "user_id": user, "timestamp": at(monday, d)} for d in days])
+
+	# Week 0 cohort: a (back in weeks 1 and 3), b (week 2), c (never back)
+	ingest("a", 0, 2, 8, 22)
+	ingest("b", 3, 15)
+	ingest("c", 6, 6)
+	# Week 1 cohort: d (back in week 2)
+	ingest("d", 9, 14)
+	# A late event moves d's first week back to week 0
+	ingest("d", 1)
+	ingest("e", 7)
+	activity = UserActivity.objects.get(app=app, user_id="d")
+	assert activity.week_start == monday
+	assert cohorts.has_days(activity.week_start, bytes(activity.days), {monday + timedelta(days=d) for d in (1, 9, 14)})
+
+	def matrix():
+		return cohorts.retention([app.id], monday, monday + timedelta(weeks=1), 4, today=monday + timedelta(weeks=3))
+
+	expected = [
+		{"week": "2024-01-01", "users": 4, "retention": [4, 2, 2, 1], "rates": [1.0, 0.5, 0.5, 0.25]},
+		{"week": "2024-01-08", "users": 1, "retention": [1, 0, 0], "rates": [1.0, 0.0, 0.0]},
+	]
+	assert matrix() == expected
+	assert cohorts.rebuild() == 5
+	assert matrix() == expected
+
+	client = APIClient()
+	client.force_authenticate(owner)
+	resp = client.get("/api/analytics/retention", {"startDate": "2024-01-03", "endDate": "2024-01-08", "weeks": 2})
+	assert resp.status_code == 200
+	assert [(c["week"], c["retention"]) for c in resp.json()["cohorts"]] == [("2024-01-01", [4, 2]), ("2024-01-08", [1, 0])]
+	# New active days invalidate the cached matrix
+	ingest("e", 8)
+	resp = client.get("/api/analytics/retention", {"startDate": "2024-01-03", "endDate": "2024-01-08", "weeks": 2})
+	assert resp.json()["cohorts"][1]["retention"] == [1, 0]
+	ingest("e", 14)
+	resp = client.get("/api/analytics/retention", {"startDate": "2024-01-03", "endDate": "2024-01-08", "weeks": 2})
+	assert resp.json()["cohorts"][1]["retention"] == [1, 1]
+
+
+@pytest.mark.django_db
+def test_top_values_exact_and_from_sketches():
+	from datetime import datetime, timezone as dt_timezone
+	from apps.analytics.ingest import store_events
+	from apps.analytics.topk import TopSketch, merged_sketch, normalize_url, pack_sketches
+
+	assert normalize_url("HTTPS://Example.com:443/pricing?utm_source=x#plans") == "https://example.com/pricing"
+	assert normalize_url("http://example.com:8080") == "http://example.com:8080/"
+	assert normalize_url("/docs?q=1") == "/docs"
+
+	# Merged sketches keep the heavy hitters, with counts within their error bound
+	a = TopSketch(capacity=20).update({f"/p{i}": 1000 // (i + 1) for i in range(200)})
+	b = TopSketch(capacity=20).update({f"/p{i}": 500 // (i + 1) for i in range(200)})
+	merged = merged_sketch([pack_sketches({"url": a}), pack_sketches({"url": b, "os": TopSketch()})], "url")
+	top = merged.top(3)
+	assert [value for value, _, _ in top] == ["/p0", "/p1", "/p2"]
+	for value, count, error in top:
+		i = int(value[2:])
+		assert count - error <= 1000 // (i + 1) + 500 // (i + 1) <= count
+
+	owner = User.objects.create_user(username="owner", password="p1")
+	app = ClientApp.objects.create(owner=owner, name="site1")
+	ts = datetime(2024, 3, 1, 12, tzinfo=dt_timezone.utc)
+	pages = {"/pricing": 30, "/docs": 20, "/blog": 5}
+	store_events(app, [
+		{"event": "view", "url": f"https://example.com{path}?ref={i}", "timestamp": ts, "metadata": {"browser": "Chrome" if i % 3 else "Firefox"}}
+		for path, n in pages.items()
+		for i in range(n)
+	])
+
+	client = APIClient()
+	client.force_authenticate(owner)
+	params = {"event": "view", "dimension": "url", "limit": 2, "startDate": "2024-03-01", "endDate": "2024-03-01"}
+	exact = client.get("/api/analytics/top", params).json()
+	assert exact["approx"] is False and exact["total"] == 55
+	assert exact["items"] == [
+		{"value": "https://example.com/pricing", "count": 30},
+		{"value": "https://example.com/docs", "count": 20},
+	]
+	approx = client.get("/api/analytics/top", {**params, "approx": "true"}).json()
+	assert approx["approx"] is True and approx["total"] == 55
+	assert [(i["value"], i["count"]) for i in approx["items"]] == [(i["value"], i["count"]) for i in exact["items"]]
+	browsers = client.get("/api/analytics/top", {"event": "view", "dimension": "browser", "approx": "true"}).json()
+	assert [i["value"] for i in browsers["items"]] == ["Chrome", "Firefox"]
+	assert client.get("/api/analytics/top", {"event": "view", "dimension": "ip_address"}).status_code == 400
@@ -1,21 +1,73 @@
-from rest_framework.throttling import SimpleRateThrottle
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+from .ratelimit import get_limiter, parse_rate
 
 
-class CollectThrottle(SimpleRateThrottle):
-	scope = "collect"
+class TokenBucketThrottle(BaseThrottle):
+	# Rates use the DRF notation from DEFAULT_THROTTLE_RATES[scope]; state is
+	# one token bucket per key (Redis Lua script, or the cache without Redis)
+	scope = None
+
+	def __init__(self):
+		self._wait = None
+
+	def get_rate(self, request):
+		return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
 
 	def get_cache_key(self, request, view):
-		api_key = request.headers.get("X-API-KEY")
-		if not api_key:
+		raise NotImplementedError
+
+	def _bucket(self, request, view):
+		parsed = parse_rate(self.get_rate(request))
+		key = self.get_cache_key(request, view) if parsed else None
+		if key is None:
 			return None
-		return self.cache_format % {"scope": self.scope, "ident": api_key}
+		num, duration = parsed
+		return f"ratelimit:{self.scope}:{key}", num, num / duration
 
+	def allow_request(self, request, view):
+		bucket = self._bucket(request, view)
+		if bucket is None:
+			return True
+		allowed, self._wait = get_limiter().hit(*bucket)
+		return allowed
 
-class AnalyticsThrottle(SimpleRateThrottle):
-	scope = "analytics"
+	async def aallow_request(self, request, view=None):
+		bucket = self._bucket(request, view)
+		if bucket is None:
+			return True
+		allowed, self._wait = await get_limiter().ahit(*bucket)
+		return allowed
+
+	def wait(self):
+		return self._wait
+
+
+class CollectThrottle(TokenBucketThrottle):
+	scope = "collect"
+
+	def get_rate(self, request):
+		# ClientApp.collect_rate overrides the default per app
+		app = getattr(request, "client_app", None)
+		if app is not None and app.collect_rate:
+			return app.collect_rate
+		return super().get_rate(request)
+
+	def get_api_key(self, request):
+		return request.headers.get("X-API-KEY")
 
 	def get_cache_key(self, request, view):
-		ident = self.get_ident(request)
-		return self.cache_format % {"scope": self.scope, "ident": ident}
+		return self.get_api_key(request) or None
+
 
+class BeaconThrottle(CollectThrottle):
+	# Same rate and bucket as collect; beacons carry the key in their payload
+	def get_api_key(self, request):
+		return getattr(request, "beacon_api_key", None)
 
+
+class AnalyticsThrottle(TokenBucketThrottle):
+	scope = "analytics"
+
+	def get_cache_key(self, request, view):
+		return self.get_ident(request)
@@ -0,0 +1,122 @@
+import json
+from datetime import timedelta
+from itertools import groupby
+from django.db.models import Count, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from . import dictionary, rollups
+from .dateranges import filter_range
+from .hll import HyperLogLog
+from .models import Event, EventRollup, EventRollupUser, EventUserSketch
+
+INTERVALS = {
+	"minute": timedelta(minutes=1),
+	"hour": timedelta(hours=1),
+	"day": timedelta(days=1),
+	"week": timedelta(weeks=1),
+}
+
+
+def truncate_local(ts, interval, tz):
+	local = ts.astimezone(tz)
+	if interval == "minute":
+		return local.replace(second=0, microsecond=0)
+	if interval == "hour":
+		return local.replace(minute=0, second=0, microsecond=0)
+	local = local.replace(hour=0, minute=0, second=0, microsecond=0)
+	if interval == "week":
+		local -= timedelta(days=local.weekday())
+	return local
+
+
+def _offsets(tz, lo, hi):
+	return {tz.utcoffset(dt) for dt in (lo, hi, timezone.now()) if dt is not None}
+
+
+def source_granularity(interval, lo, hi, tz):
+	# Rollup granularity whose buckets nest inside the requested local buckets,
+	# or None to aggregate raw events. Hourly rollups nest in any zone whose
+	# offset is a whole number of hours; daily ones only when the offset is zero.
+	if interval == "minute" or not rollups.rollups_enabled():
+		return None
+	granularity = rollups.granularity_for(lo, hi)
+	if granularity is None:
+		return None
+	offsets = _offsets(tz, lo, hi)
+	if interval in ("day", "week") and granularity == EventRollup.DAY and offsets == {timedelta(0)}:
+		return EventRollup.DAY
+	if all(offset % timedelta(hours=1) == timedelta(0) for offset in offsets):
+		return EventRollup.HOUR
+	return None
+
+
+def _count_rows(app_ids, event, interval, lo, hi, tz, granularity):
+	if granularity:
+		qs = filter_range(
+			EventRollup.objects.filter(app_id__in=app_ids, event=event, granularity=granularity), lo, hi, field="bucket"
+		)
+		return qs.annotate(b=Trunc("bucket", interval, tzinfo=tz)).values("b", "device").annotate(c=Sum("count")).order_by("b")
+	qs = filter_range(dictionary.filter_value(Event.objects.filter(app_id__in=app_ids), "event", event), lo, hi)
+	return (
+		qs.annotate(b=Trunc("timestamp", interval, tzinfo=tz))
+		.values("b", **dictionary.decoded("device"))
+		.annotate(c=Count("id"))
+		.order_by("b")
+	)
+
+
+def _unique_rows(app_ids, event, interval, lo, hi, tz, granularity, approx):
+	if granularity and approx:
+		sketches = filter_range(
+			EventUserSketch.objects.filter(app_id__in=app_ids, event=event, granularity=granularity),
+			lo,
+			hi,
+			field="bucket",
+		).order_by("bucket")
+		rows = sketches.values_list("bucket", "sketch").iterator()
+		for b, group in groupby(rows, key=lambda row: truncate_local(row[0], interval, tz)):
+			yield b, round(HyperLogLog.merged(sketch for _, sketch in group).estimate())
+		return
+	if granularity == EventRollup.DAY:
+		qs = filter_range(EventRollupUser.objects.filter(app_id__in=app_ids, event=event), lo, hi, field="bucket")
+		field = "bucket"
+	else:
+		qs = filter_range(dictionary.filter_value(Event.objects.filter(app_id__in=app_ids), "event", event), lo, hi)
+		qs = qs.exclude(user_id="")
+		field = "timestamp"
+	rows = qs.annotate(b=Trunc(field, interval, tzinfo=tz)).values("b").annotate(u=Count("user_id", distinct=True)).order_by("b")
+	for row in rows.iterator():
+		yield row["b"], row["u"]
+
+
+def series(app_ids, event, interval, lo=None, hi=None, tz=None, approx=False):
+	# Yields one dict per non-empty bucket in ascending order. Counts and unique
+	# users come from two grouped queries that are merge-joined on the bucket.
+	tz = tz or timezone.get_current_timezone()
+	granularity = source_granularity(interval, lo, hi, tz)
+	counts = _count_rows(app_ids, event, interval, lo, hi, tz, granularity).iterator()
+	uniques = _unique_rows(app_ids, event, interval, lo, hi, tz, granularity, approx)
+	pending = next(uniques, None)
+	for b, rows in groupby(counts, key=lambda row: row["b"]):
+		device_data = {}
+		for row in rows:
+			key = row["device"] or "unknown"
+			device_data[key] = device_data.get(key, 0) + row["c"]
+		while pending is not None and pending[0] < b:
+			pending = next(uniques, None)
+		unique_users = pending[1] if pending is not None and pending[0] == b else 0
+		yield {
+			"bucket": b.astimezone(tz).isoformat(),
+			"count": sum(device_data.values()),
+			"uniqueUsers": unique_users,
+			"deviceData": device_data,
+		}
+
+
+def stream_json(header, items):
+	# {"...header", "series": [item, ...]} written incrementally
+	head = json.dumps(header)
+	yield head[:-1] + (', "series": [' if header else '"series": [')
+	for index, item in enumerate(items):
+		yield ("," if index else "") + json.dumps(item)
+	yield "]}"
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import struct
+import zlib
+from collections import defaultdict
+from urllib.parse import urlsplit
+import numpy as np
+
+DEFAULT_CAPACITY = 100
+DEFAULT_WIDTH = 512
+DEFAULT_DEPTH = 4
+# Dimensions with a heavy-hitter sketch per rollup bucket
+DIMENSIONS = ("url", "referrer", "browser", "os")
+MAX_VALUE_LENGTH = 1000
+
+
+def normalize_url(url):
+	# Scheme and host lowercased, default ports, query string and fragment
+	# dropped, so /pricing?utm_source=x and /pricing count as one page
+	if not url:
+		return ""
+	try:
+		parts = urlsplit(url.strip())
+		port = parts.port
+	except ValueError:
+		return url[:MAX_VALUE_LENGTH]
+	if not parts.netloc:
+		return parts.path[:MAX_VALUE_LENGTH]
+	scheme = parts.scheme.lower()
+	host = (parts.hostname or "").lower()
+	if port and (scheme, port) not in (("http", 80), ("https", 443)):
+		host = f"{host}:{port}"
+	return f"{scheme}://{host}{parts.path or '/'}"[:MAX_VALUE_LENGTH]
+
+
+def dimension_value(dimension, url="", referrer="", metadata=None):
+	if dimension == "url":
+		return normalize_url(url)
+	if dimension == "referrer":
+		return normalize_url(referrer)
+	value = (metadata or {}).get(dimension)
+	return "" if value is None else str(value)[:MAX_VALUE_LENGTH]
+
+
+class CountMinSketch:
+	# width x depth counters; estimates never undercount and overcount by at most
+	# e/width of the total with probability 1 - e^-depth (about 0.5% of the
+	# total, 98% of the time, at the defaults). Merges by adding the tables.
+
+	def __init__(self, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH, table=None):
+		self.width = width
+		self.depth = depth
+		self.table = np.array(table, dtype="<u8") if table is not None else np.zeros(width * depth, dtype="<u8")
+		if len(self.table) != width * depth:
+			raise ValueError("table size does not match width and depth")
+
+	def _cells(self, item):
+		h = int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), "big")
+		h1, h2 = h >> 32, (h & 0xFFFFFFFF) | 1
+		return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+	def add(self, item, count=1):
+		for cell in self._cells(item):
+			self.table[cell] += count
+
+	def estimate(self, item):
+		return int(min(self.table[cell] for cell in self._cells(item)))
+
+	def merge(self, other):
+		if (other.width, other.depth) != (self.width, self.depth):
+			raise ValueError("cannot merge sketches with different dimensions")
+		self.table += other.table
+		return self
+
+
+class SpaceSaving:
+	# Keeps `capacity` counters of [count, error]; any item with more than
+	# total/capacity occurrences is guaranteed to be among them, and its count
+	# overestimates the true one by at most `error`. Merging follows the
+	# mergeable-summaries rule: an item missing from a full summary may have had
+	# up to that summary's smallest count there.
+
+	def __init__(self, capacity=DEFAULT_CAPACITY, counters=None):
+		self.capacity = capacity
+		self.counters = counters if counters is not None else {}
+
+	def add(self, item, count=1):
+		counters = self.counters
+		if item in counters:
+			counters[item][0] += count
+		elif len(counters) < self.capacity:
+			counters[item] = [count, 0]
+		else:
+			victim = min(counters, key=lambda key: counters[key][0])
+			floor = counters.pop(victim)[0]
+			counters[item] = [floor + count, floor]
+
+	def floor(self):
+		if len(self.counters) < self.capacity:
+			return 0
+		return min(count for count, _ in self.counters.values())
+
+	def merge(self, other):
+		return self.merge_all([self, other], self.capacity)
+
+	@classmethod
+	def merge_all(cls, summaries, capacity=DEFAULT_CAPACITY):
+		counts = defaultdict(lambda: [0, 0])
+		# Floors of the summaries each item was found in, to charge it the rest
+		found_floor = defaultdict(int)
+		total_floor = 0
+		for summary in summaries:
+			floor = summary.floor()
+			total_floor += floor
+			for item, (count, error) in summary.counters.items():
+				counter = counts[item]
+				counter[0] += count
+				counter[1] += error
+				found_floor[item] += floor
+		for item, counter in counts.items():
+			missing = total_floor - found_floor[item]
+			counter[0] += missing
+			counter[1] += missing
+		kept = sorted(counts.items(), key=lambda kv: kv[1][0], reverse=True)[:capacity]
+		return cls(capacity, {item: counter for item, counter in kept})
+
+
+class TopSketch:
+	# Space-Saving picks the candidates; the Count-Min table caps their counts,
+	# which tightens the Space-Saving overestimates after many merges.
+
+	def __init__(self, capacity=DEFAULT_CAPACITY, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH):
+		self.summary = SpaceSaving(capacity)
+		self.cms = CountMinSketch(width, depth)
+
+	def add(self, item, count=1):
+		self.summary.add(item, count)
+		self.cms.add(item, count)
+
+	def update(self, counts):
+		# counts: {item: count}, largest first so a batch evicts its rare items
+		for item, count in sorted(counts.items(), key=lambda kv: kv[1], reverse=True):
+			self.add(item, count)
+		return self
+
+	def merge(self, other):
+		self.summary = self.summary.merge(other.summary)
+		self.cms.merge(other.cms)
+		return self
+
+	def top(self, n):
+		# [(item, count, error)], error being the most the count may overstate
+		items = []
+		for item, (count, error) in self.summary.counters.items():
+			estimate = min(count, self.cms.estimate(item))
+			items.append((item, estimate, max(0, estimate - (count - error))))
+		items.sort(key=lambda row: (-row[1], row[0]))
+		return items[:n]
+
+	def _raw(self):
+		header = json.dumps(
+			[self.summary.capacity, self.cms.width, self.cms.depth, [[k, c, e] for k, (c, e) in self.summary.counters.items()]],
+			separators=(",", ":"),
+		).encode()
+		return struct.pack(">I", len(header)) + header + self.cms.table.tobytes()
+
+	@classmethod
+	def _from_raw(cls, raw):
+		(size,) = struct.unpack(">I", raw[:4])
+		capacity, width, depth, counters = json.loads(raw[4:4 + size])
+		sketch = cls(capacity, width, depth)
+		sketch.summary.counters = {k: [c, e] for k, c, e in counters}
+		sketch.cms = CountMinSketch(width, depth, np.frombuffer(raw[4 + size:], dtype="<u8"))
+		return sketch
+
+	def to_bytes(self):
+		return zlib.compress(self._raw())
+
+	@classmethod
+	def from_bytes(cls, data):
+		return cls._from_raw(zlib.decompress(bytes(data)))
+
+
+def pack_sketches(sketches):
+	# {dimension: TopSketch} -> one compressed blob, so a bucket is a single row
+	parts = []
+	for dimension, sketch in sketches.items():
+		name, raw = dimension.encode(), sketch._raw()
+		parts.append(struct.pack(">HI", len(name), len(raw)) + name + raw)
+	return zlib.compress(b"".join(parts))
+
+
+def unpack_sketches(data, dimensions=None):
+	raw = zlib.decompress(bytes(data))
+	sketches = {}
+	offset = 0
+	while offset < len(raw):
+		name_size, size = struct.unpack_from(">HI", raw, offset)
+		offset += 6
+		name = raw[offset:offset + name_size].decode()
+		offset += name_size
+		if dimensions is None or name in dimensions:
+			sketches[name] = TopSketch._from_raw(raw[offset:offset + size])
+		offset += size
+	return sketches
+
+
+def merged_sketch(blobs, dimension, capacity=DEFAULT_CAPACITY):
+	# One dimension's sketch merged across pack_sketches blobs: Count-Min tables
+	# are summed as they stream in, the Space-Saving summaries merged in one pass
+	merged = TopSketch(capacity)
+	summaries = []
+	for blob in blobs:
+		for sketch in unpack_sketches(blob, (dimension,)).values():
+			if not summaries:
+				merged.cms = CountMinSketch(sketch.cms.width, sketch.cms.depth, sketch.cms.table)
+			else:
+				merged.cms.merge(sketch.cms)
+			summaries.append(sketch.summary)
+	if summaries:
+		merged.summary = SpaceSaving.merge_all(summaries, capacity)
+	return merged
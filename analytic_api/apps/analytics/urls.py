@@ -1,10 +1,23 @@
+from django.conf import settings
 from django.urls import path
-from .views import CollectEventView, EventSummaryView, UserStatsView
+from .asyncviews import collect_event
+from .beacon import beacon
+from .views import CollectEventView, CollectBatchView, EventSummaryView, UserStatsView, TimeseriesView, EventExportView, EventListView, FunnelView, RetentionView, TopValuesView
 
 urlpatterns = [
-	path("collect", CollectEventView.as_view()),
+	# The async view only pays off under ASGI; under WSGI each call would start an event loop
+	path("collect", collect_event if settings.COLLECT_ASYNC else CollectEventView.as_view()),
+	path("collect/batch", CollectBatchView.as_view()),
+	# Normally answered by IngestMiddleware before URL resolution
+	path("beacon", beacon),
 	path("event-summary", EventSummaryView.as_view()),
 	path("user-stats", UserStatsView.as_view()),
+	path("timeseries", TimeseriesView.as_view()),
+	path("events", EventListView.as_view()),
+	path("events/export", EventExportView.as_view()),
+	path("top", TopValuesView.as_view()),
+	path("funnel", FunnelView.as_view()),
+	path("retention", RetentionView.as_view()),
 ]
 
 
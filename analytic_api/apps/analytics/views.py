@@ -1,17 +1,58 @@
-from datetime import datetime, timedelta
-from django.db.models import Count
-from django.utils.dateparse import parse_datetime
-from django.core.cache import cache
+from datetime import timedelta
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
-from .models import Event
-from .serializers import EventSerializer, EventSummaryQuerySerializer, UserStatsQuerySerializer
+from . import breakdown, cohorts, dictionary, export, funnel, responsecache, timeseries
+from .dateranges import date_range, filter_range
+from .models import Event, filter_metadata
+from .serializers import (
+	EventExportQuerySerializer,
+	EventListQuerySerializer,
+	EventSerializer,
+	EventSummaryQuerySerializer,
+	FunnelQuerySerializer,
+	RetentionQuerySerializer,
+	TimeseriesQuerySerializer,
+	TopQuerySerializer,
+	UserStatsQuerySerializer,
+)
 from .auth import ApiKeyAuthentication
+from .ingest import apply_idempotency_key, get_batch_limit, ingest_events, prepare_batch, prepare_event
 from .permissions import HasApiKey
+from .summary import event_summary, owner_app_ids, user_stats
 from .throttles import CollectThrottle, AnalyticsThrottle
 
+# Chunks pulled per hop into the sync thread when streaming under ASGI
+ASGI_STREAM_BLOCK = 256
+
+
+def _next_block(chunks):
+	block = list(islice(chunks, ASGI_STREAM_BLOCK))
+	return "".join(block) if block else None
+
+
+async def _astream(chunks):
+	# The generators query the database, so they keep running in the sync thread
+	chunks = iter(chunks)
+	while (block := await sync_to_async(_next_block)(chunks)) is not None:
+		yield block
+
+
+def streaming_response(request, chunks, **kwargs):
+	# Under ASGI, Django reads a sync iterator with sync_to_async(list), which
+	# buffers the whole body before sending it. An async iterator keeps the
+	# response streaming, for one thread hop per ASGI_STREAM_BLOCK chunks.
+	if isinstance(request._request, ASGIRequest):
+		chunks = _astream(chunks)
+	return StreamingHttpResponse(chunks, **kwargs)
+
 
 class CollectEventView(APIView):
 	authentication_classes = [ApiKeyAuthentication]
@@ -26,35 +67,78 @@ class CollectEventView(APIView):
 				type=OpenApiTypes.STR,
 				location=OpenApiParameter.HEADER,
 				description="API key generated via /api/auth/register.",
-			)
+			),
+			OpenApiParameter(
+				name="Idempotency-Key",
+				required=False,
+				type=OpenApiTypes.STR,
+				location=OpenApiParameter.HEADER,
+				description=(
+					"Used as the event_id when the body has none; retries with the same key are stored once. "
+					"Send a timestamp too so that concurrent retries are also caught."
+				),
+			),
 		],
 		request=EventSerializer,
-		responses={201: {"type": "object", "properties": {"detail": {"type": "string"}}}},
-		description="Collect an analytics event. Requires X-API-KEY header.",
+		responses={
+			201: {"type": "object", "properties": {"detail": {"type": "string"}}},
+			202: {"type": "object", "properties": {"detail": {"type": "string"}}},
+		},
+		description="Collect an analytics event. Requires X-API-KEY header. Returns 202 when INGEST_MODE=queue.",
 	)
 	def post(self, request):
-		data = request.data.copy()
-		# Default timestamp to now if not provided
-		if "timestamp" in data and isinstance(data["timestamp"], str):
-			# Ensure ISO string to datetime
-			try:
-				ts = parse_datetime(data["timestamp"])
-				if ts is None:
-					return Response({"detail": "Invalid timestamp."}, status=status.HTTP_400_BAD_REQUEST)
-				data["timestamp"] = ts
-			except Exception:
-				return Response({"detail": "Invalid timestamp."}, status=status.HTTP_400_BAD_REQUEST)
-		else:
-			data["timestamp"] = datetime.utcnow()
-		# capture IP if not provided
-		if not data.get("ip_address"):
-			data["ip_address"] = request.META.get("REMOTE_ADDR")
-		serializer = EventSerializer(data=data)
-		serializer.is_valid(raise_exception=True)
-		Event.objects.create(app=request.client_app, **serializer.validated_data)
+		validated = prepare_event(request.data, request.META.get("REMOTE_ADDR"))
+		apply_idempotency_key(validated, request.headers.get("Idempotency-Key"))
+		if ingest_events(request.client_app, [validated]):
+			return Response({"detail": "Event queued."}, status=status.HTTP_202_ACCEPTED)
 		return Response({"detail": "Event accepted."}, status=status.HTTP_201_CREATED)
 
 
+class CollectBatchView(APIView):
+	authentication_classes = [ApiKeyAuthentication]
+	permission_classes = [HasApiKey]
+	throttle_classes = [CollectThrottle]
+
+	@extend_schema(
+		parameters=[
+			OpenApiParameter(
+				name="X-API-KEY",
+				required=True,
+				type=OpenApiTypes.STR,
+				location=OpenApiParameter.HEADER,
+				description="API key generated via /api/auth/register.",
+			)
+		],
+		request=EventSerializer(many=True),
+		responses={201: OpenApiTypes.OBJECT, 202: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT},
+		description=(
+			"Collect a batch of analytics events in one request. Body is a JSON array of events "
+			"or an object with an `events` array. Valid events are stored with a single bulk insert; "
+			"invalid ones are reported by index. Events repeating an already accepted `event_id` are "
+			"counted as accepted but stored once."
+		),
+	)
+	def post(self, request):
+		items = request.data
+		if isinstance(items, dict):
+			items = items.get("events")
+		if not isinstance(items, list) or not items:
+			return Response({"detail": "Expected a non-empty list of events."}, status=status.HTTP_400_BAD_REQUEST)
+		limit = get_batch_limit()
+		if len(items) > limit:
+			return Response(
+				{"detail": f"Batch too large; at most {limit} events per request."},
+				status=status.HTTP_400_BAD_REQUEST,
+			)
+		valid, errors = prepare_batch(items, request.META.get("REMOTE_ADDR"))
+		resp = {"accepted": len(valid), "rejected": len(errors), "errors": errors}
+		if not valid:
+			return Response(resp, status=status.HTTP_400_BAD_REQUEST)
+		if ingest_events(request.client_app, valid):
+			return Response(resp, status=status.HTTP_202_ACCEPTED)
+		return Response(resp, status=status.HTTP_201_CREATED)
+
+
 class EventSummaryView(APIView):
 	permission_classes = [permissions.IsAuthenticated]
 	throttle_classes = [AnalyticsThrottle]
@@ -65,6 +149,19 @@ class EventSummaryView(APIView):
 			OpenApiParameter("startDate", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="Start date filter"),
 			OpenApiParameter("endDate", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="End date filter"),
 			OpenApiParameter("app_id", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Specific app id"),
+			OpenApiParameter(
+				"approx",
+				OpenApiTypes.BOOL,
+				OpenApiParameter.QUERY,
+				description="Estimate uniqueUsers with HyperLogLog (adds uniqueUsersApprox and uniqueUsersStdError). "
+				"Defaults to exact below ANALYTICS_APPROX_UNIQUE_THRESHOLD events.",
+			),
+			OpenApiParameter(
+				"tz",
+				OpenApiTypes.STR,
+				OpenApiParameter.QUERY,
+				description="IANA timezone the start/end dates are interpreted in (defaults to TIME_ZONE).",
+			),
 		],
 		responses={
 			200: OpenApiTypes.OBJECT,
@@ -78,33 +175,16 @@ class EventSummaryView(APIView):
 		start_date = query_serializer.validated_data.get("startDate")
 		end_date = query_serializer.validated_data.get("endDate")
 		app_id = query_serializer.validated_data.get("app_id")
+		approx = query_serializer.validated_data.get("approx")
+		tz = query_serializer.validated_data.get("tz")
 
-		# Cache key
-		cache_key = f"event-summary:{request.user.id}:{event}:{start_date}:{end_date}:{app_id}"
-		cached = cache.get(cache_key)
-		if cached:
-			return Response(cached)
-
-		qs = Event.objects.filter(event=event, app__owner=request.user)
-		if app_id:
-			qs = qs.filter(app_id=app_id)
-		if start_date:
-			qs = qs.filter(timestamp__date__gte=start_date)
-		if end_date:
-			qs = qs.filter(timestamp__date__lte=end_date)
-
-		count = qs.count()
-		unique_users = qs.exclude(user_id="").values("user_id").distinct().count()
-		device_counts = qs.values("device").annotate(c=Count("id"))
-		device_data = {row["device"] or "unknown": row["c"] for row in device_counts}
-
-		resp = {
-			"event": event,
-			"count": count,
-			"uniqueUsers": unique_users,
-			"deviceData": device_data,
-		}
-		cache.set(cache_key, resp, timeout=60)  # cache for 60s
+		app_ids = owner_app_ids(request.user, app_id)
+		cache_key = f"event-summary:{request.user.id}:{event}:{start_date}:{end_date}:{app_id}:{approx}:{tz}"
+		resp, _ = responsecache.get_or_compute(
+			cache_key,
+			[responsecache.event_scope(a, event) for a in app_ids],
+			lambda: {"event": event, **event_summary(app_ids, event, start_date, end_date, approx=approx, tz=tz)},
+		)
 		return Response(resp)
 
 
@@ -125,30 +205,278 @@ class UserStatsView(APIView):
 		query_serializer = UserStatsQuerySerializer(data=request.query_params)
 		query_serializer.is_valid(raise_exception=True)
 		user_id = query_serializer.validated_data["userId"]
-		cache_key = f"user-stats:{request.user.id}:{user_id}"
-		cached = cache.get(cache_key)
-		if cached:
-		 return Response(cached)
-
-		qs = Event.objects.filter(app__owner=request.user, user_id=user_id)
-		total = qs.count()
-		latest = qs.order_by("-timestamp").first()
-		device_details = {}
-		ip_address = None
-		if latest:
-			md = latest.metadata or {}
-			device_details = {
-				"browser": md.get("browser"),
-				"os": md.get("os"),
-			}
-			ip_address = latest.ip_address
-		resp = {
-			"userId": user_id,
-			"totalEvents": total,
-			"deviceDetails": device_details,
-			"ipAddress": ip_address,
-		}
-		cache.set(cache_key, resp, timeout=60)
+		app_ids = owner_app_ids(request.user)
+		resp, _ = responsecache.get_or_compute(
+			f"user-stats:{request.user.id}:{user_id}",
+			[responsecache.user_scope(a, user_id) for a in app_ids],
+			lambda: user_stats(app_ids, user_id),
+		)
 		return Response(resp)
 
 
+class TimeseriesView(APIView):
+	permission_classes = [permissions.IsAuthenticated]
+	throttle_classes = [AnalyticsThrottle]
+
+	@extend_schema(
+		parameters=[
+			OpenApiParameter("event", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Event name", required=True),
+			OpenApiParameter(
+				"interval",
+				OpenApiTypes.STR,
+				OpenApiParameter.QUERY,
+				description="Bucket size",
+				enum=["minute", "hour", "day", "week"],
+			),
+			OpenApiParameter("startDate", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="Start date filter"),
+			OpenApiParameter("endDate", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="End date filter"),
+			OpenApiParameter("app_id", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Specific app id"),
+			OpenApiParameter("approx", OpenApiTypes.BOOL, OpenApiParameter.QUERY, description="HyperLogLog unique users"),
+			OpenApiParameter("tz", OpenApiTypes.STR, OpenApiParameter.QUERY, description="IANA timezone for buckets"),
+		],
+		responses={
+			200: OpenApiTypes.OBJECT,
+		},
+		description="Stream per-bucket counts, unique users and device breakdowns for an event. Empty buckets are omitted.",
+	)
+	def get(self, request):
+		query_serializer = TimeseriesQuerySerializer(data=request.query_params)
+		query_serializer.is_valid(raise_exception=True)
+		data = query_serializer.validated_data
+		event = data["event"]
+		interval = data["interval"]
+		tz = data.get("tz") or timezone.get_current_timezone()
+		lo, hi = date_range(data.get("startDate"), data.get("endDate"), tz)
+		if lo and hi:
+			limit = getattr(settings, "TIMESERIES_MAX_BUCKETS", 50000)
+			if (hi - lo) / timeseries.INTERVALS[interval] > limit:
+				return Response(
+					{"detail": f"Range spans more than {limit} {interval} buckets."},
+					status=status.HTTP_400_BAD_REQUEST,
+				)
+		app_ids = owner_app_ids(request.user, data.get("app_id"))
+		items = timeseries.series(app_ids, event, interval, lo, hi, tz, approx=bool(data.get("approx")))
+		header = {"event": event, "interval": interval, "tz": str(tz)}
+		return streaming_response(request, timeseries.stream_json(header, items), content_type="application/json")
+
+
+class EventExportView(APIView):
+	permission_classes = [permissions.IsAuthenticated]
+	throttle_classes = [AnalyticsThrottle]
+
+	@extend_schema(
+		parameters=[
+			OpenApiParameter("output", OpenApiTypes.STR, OpenApiParameter.QUERY, enum=["ndjson", "csv"]),
+			OpenApiParameter("event", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Event name"),
+			OpenApiParameter("startDate", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="Start date filter"),
+			OpenApiParameter("endDate", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="End date filter"),
+			OpenApiParameter("app_id", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Specific app id"),
+			OpenApiParameter("tz", OpenApiTypes.STR, OpenApiParameter.QUERY, description="IANA timezone for dates"),
+			OpenApiParameter("cursor", OpenApiTypes.STR, OpenApiParameter.QUERY, description="X-Next-Cursor of the previous page"),
+			OpenApiParameter("limit", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Rows in this page (max 10000); omit to stream everything"),
+		],
+		responses={(200, "application/x-ndjson"): OpenApiTypes.STR, (200, "text/csv"): OpenApiTypes.STR},
+		description=(
+			"Stream raw events of the caller's apps ordered by (timestamp, id). With `limit`, the "
+			"X-Next-Cursor response header carries the keyset cursor for the next page."
+		),
+	)
+	def get(self, request):
+		query_serializer = EventExportQuerySerializer(data=request.query_params)
+		query_serializer.is_valid(raise_exception=True)
+		data = query_serializer.validated_data
+		qs = Event.objects.filter(app_id__in=owner_app_ids(request.user, data.get("app_id")))
+		if data.get("event"):
+			qs = dictionary.filter_value(qs, "event", data["event"])
+		qs = filter_range(qs, *date_range(data.get("startDate"), data.get("endDate"), data.get("tz")))
+		cursor, limit = data.get("cursor"), data.get("limit")
+		if limit:
+			rows, token = export.read_page(qs, cursor, limit)
+		else:
+			rows, token = export.iter_rows(qs, cursor=cursor), None
+		if data["output"] == "csv":
+			response = streaming_response(request, export.csv_lines(rows), content_type="text/csv")
+			response["Content-Disposition"] = 'attachment; filename="events.csv"'
+		else:
+			response = streaming_response(request, export.ndjson_lines(rows), content_type="application/x-ndjson")
+		if token:
+			response["X-Next-Cursor"] = token
+		return response
+
+
+class EventListView(APIView):
+	permission_classes = [permissions.IsAuthenticated]
+	throttle_classes = [AnalyticsThrottle]
+
+	@extend_schema(
+		parameters=[
+			OpenApiParameter("app_id", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Specific app id"),
+			OpenApiParameter("event", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Event name"),
+			OpenApiParameter("device", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Device"),
+			OpenApiParameter("user_id", OpenApiTypes.STR, OpenApiParameter.QUERY, description="User identifier"),
+			OpenApiParameter(
+				"metadata.<key>",
+				OpenApiTypes.STR,
+				OpenApiParameter.QUERY,
+				description="Match a metadata value, e.g. metadata.browser=Chrome",
+			),
+			OpenApiParameter("cursor", OpenApiTypes.STR, OpenApiParameter.QUERY, description="`next` of the previous page"),
+			OpenApiParameter("limit", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Page size (max 1000)"),
+		],
+		responses={200: OpenApiTypes.OBJECT},
+		description="List recent events of the caller's apps, newest first, with cursor pagination.",
+	)
+	def get(self, request):
+		query_serializer = EventListQuerySerializer(data=request.query_params)
+		query_serializer.is_valid(raise_exception=True)
+		data = query_serializer.validated_data
+		qs = Event.objects.filter(app_id__in=owner_app_ids(request.user, data.get("app_id")))
+		for field in ("event", "device"):
+			if field in data:
+				qs = dictionary.filter_value(qs, field, data[field])
+		if "user_id" in data:
+			qs = qs.filter(user_id=data["user_id"])
+		for param, value in request.query_params.items():
+			if param.startswith("metadata.") and len(param) > len("metadata."):
+				qs = filter_metadata(qs, param[len("metadata."):], value)
+		results, next_cursor = export.list_page(qs, data.get("cursor"), data["limit"])
+		return Response({"results": results, "next": next_cursor})
+
+
+class FunnelView(APIView):
+	permission_classes = [permissions.IsAuthenticated]
+	throttle_classes = [AnalyticsThrottle]
+
+	@extend_schema(
+		parameters=[
+			OpenApiParameter(
+				"steps",
+				OpenApiTypes.STR,
+				OpenApiParameter.QUERY,
+				required=True,
+				description="Comma-separated event names in order, e.g. signup_view,login_form_cta_click,purchase",
+			),
+			OpenApiParameter(
+				"window",
+				OpenApiTypes.INT,
+				OpenApiParameter.QUERY,
+				description="Seconds allowed from the first step to the last (default 86400)",
+			),
+			OpenApiParameter("startDate", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="Start date filter"),
+			OpenApiParameter("endDate", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="End date filter"),
+			OpenApiParameter("app_id", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Specific app id"),
+			OpenApiParameter("tz", OpenApiTypes.STR, OpenApiParameter.QUERY, description="IANA timezone for dates"),
+		],
+		responses={200: OpenApiTypes.OBJECT},
+		description=(
+			"Ordered conversion funnel over user_id: users counted at each step reached the previous "
+			"steps in order, within `window` seconds of their first step."
+		),
+	)
+	def get(self, request):
+		query_serializer = FunnelQuerySerializer(data=request.query_params)
+		query_serializer.is_valid(raise_exception=True)
+		data = query_serializer.validated_data
+		steps, window, tz = data["steps"], data["window"], data.get("tz")
+		start_date, end_date, app_id = data.get("startDate"), data.get("endDate"), data.get("app_id")
+		app_ids = owner_app_ids(request.user, app_id)
+		lo, hi = date_range(start_date, end_date, tz)
+		resp, _ = responsecache.get_or_compute(
+			f"funnel:{request.user.id}:{','.join(steps)}:{window}:{start_date}:{end_date}:{app_id}:{tz}",
+			[responsecache.event_scope(a, step) for a in app_ids for step in set(steps)],
+			lambda: {"window": window, "steps": funnel.funnel(app_ids, steps, timedelta(seconds=window), lo, hi)},
+		)
+		return Response(resp)
+
+
+class RetentionView(APIView):
+	permission_classes = [permissions.IsAuthenticated]
+	throttle_classes = [AnalyticsThrottle]
+
+	@extend_schema(
+		parameters=[
+			OpenApiParameter(
+				"startDate",
+				OpenApiTypes.DATE,
+				OpenApiParameter.QUERY,
+				description="First cohort: the week containing this date (default: `weeks` weeks before endDate)",
+			),
+			OpenApiParameter(
+				"endDate", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="Last cohort: the week containing this date (default today)"
+			),
+			OpenApiParameter("weeks", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Return weeks per cohort (default 12, max 52)"),
+			OpenApiParameter("app_id", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Specific app id"),
+		],
+		responses={200: OpenApiTypes.OBJECT},
+		description=(
+			"Weekly retention matrix: users grouped by the UTC week (Monday) they were first seen, "
+			"with how many of them were active in each following week."
+		),
+	)
+	def get(self, request):
+		query_serializer = RetentionQuerySerializer(data=request.query_params)
+		query_serializer.is_valid(raise_exception=True)
+		data = query_serializer.validated_data
+		weeks, app_id = data["weeks"], data.get("app_id")
+		current = cohorts.week_monday(timezone.now().date())
+		last_week = cohorts.week_monday(data["endDate"]) if data.get("endDate") else current
+		first_week = cohorts.week_monday(data["startDate"]) if data.get("startDate") else last_week - timedelta(weeks=weeks - 1)
+		app_ids = owner_app_ids(request.user, app_id)
+		resp, _ = responsecache.get_or_compute(
+			f"retention:{request.user.id}:{first_week}:{last_week}:{weeks}:{app_id}:{current}",
+			[responsecache.activity_scope(a) for a in app_ids],
+			lambda: {"weeks": weeks, "cohorts": cohorts.retention(app_ids, first_week, last_week, weeks)},
+		)
+		return Response(resp)
+
+
+class TopValuesView(APIView):
+	permission_classes = [permissions.IsAuthenticated]
+	throttle_classes = [AnalyticsThrottle]
+
+	@extend_schema(
+		parameters=[
+			OpenApiParameter("event", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Event name", required=True),
+			OpenApiParameter(
+				"dimension",
+				OpenApiTypes.STR,
+				OpenApiParameter.QUERY,
+				required=True,
+				enum=["url", "referrer", "browser", "os"],
+				description="Breakdown; url and referrer are compared without query string or fragment",
+			),
+			OpenApiParameter("limit", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Values to return (default 10, max 100)"),
+			OpenApiParameter("startDate", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="Start date filter"),
+			OpenApiParameter("endDate", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="End date filter"),
+			OpenApiParameter("app_id", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Specific app id"),
+			OpenApiParameter(
+				"approx",
+				OpenApiTypes.BOOL,
+				OpenApiParameter.QUERY,
+				description="Use the per-bucket heavy-hitter sketches (counts then carry an `error` bound). "
+				"Defaults to exact below ANALYTICS_TOP_EXACT_THRESHOLD events.",
+			),
+			OpenApiParameter("tz", OpenApiTypes.STR, OpenApiParameter.QUERY, description="IANA timezone for dates"),
+		],
+		responses={200: OpenApiTypes.OBJECT},
+		description="Most frequent URLs, referrers, browsers or operating systems for an event.",
+	)
+	def get(self, request):
+		query_serializer = TopQuerySerializer(data=request.query_params)
+		query_serializer.is_valid(raise_exception=True)
+		data = query_serializer.validated_data
+		event, dimension, limit = data["event"], data["dimension"], data["limit"]
+		start_date, end_date, app_id = data.get("startDate"), data.get("endDate"), data.get("app_id")
+		approx, tz = data.get("approx"), data.get("tz")
+		app_ids = owner_app_ids(request.user, app_id)
+		lo, hi = date_range(start_date, end_date, tz)
+		resp, _ = responsecache.get_or_compute(
+			f"top:{request.user.id}:{event}:{dimension}:{limit}:{start_date}:{end_date}:{app_id}:{approx}:{tz}",
+			[responsecache.event_scope(a, event) for a in app_ids],
+			lambda: {
+				"event": event,
+				"dimension": dimension,
+				**breakdown.top_values(app_ids, event, dimension, lo, hi, limit, approx=approx),
+			},
+		)
+		return Response(resp)
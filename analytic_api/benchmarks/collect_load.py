@@ -0,0 +1,204 @@
+# HTTP load test for POST /api/analytics/collect over keep-alive connections.
+# Either drives an already running server (--url, --api-key) or, with
+# --compare, starts gunicorn (WSGI, DRF view) and uvicorn (ASGI, async view)
+# one after the other on a throwaway SQLite database with INGEST_MODE=queue and
+# prints requests/s and latency percentiles for both.
+#
+#   python -m benchmarks.collect_load --compare --concurrency 200 --requests 20000
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.common import latency_stats, write_results  # noqa: E402
+
+PAYLOAD = {
+	"event": "page_view",
+	"url": "https://example.com/pricing",
+	"referrer": "https://google.com",
+	"device": "mobile",
+	"metadata": {"browser": "Chrome", "os": "Android"},
+	"user_id": "user789",
+}
+
+
+async def _read_response(reader):
+	status_line = await reader.readline()
+	if not status_line:
+		raise ConnectionResetError("connection closed")
+	length, chunked = 0, False
+	while True:
+		line = await reader.readline()
+		if line in (b"\r\n", b""):
+			break
+		name, _, value = line.decode().partition(":")
+		if name.lower() == "content-length":
+			length = int(value)
+		elif name.lower() == "transfer-encoding":
+			chunked = "chunked" in value.lower()
+	if chunked:
+		while True:
+			size = int((await reader.readline()).strip(), 16)
+			await reader.readexactly(size + 2)
+			if not size:
+				break
+	else:
+		await reader.readexactly(length)
+	return status_line
+
+
+async def _worker(host, port, path, headers, body, counter, latencies, errors, timeout):
+	request = (
+		f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+		f"Content-Length: {len(body)}\r\n{headers}Connection: keep-alive\r\n\r\n"
+	).encode() + body
+	try:
+		reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+	except (OSError, asyncio.TimeoutError) as exc:
+		errors.append(repr(exc))
+		return
+	try:
+		while counter[0] > 0:
+			counter[0] -= 1
+			started = time.perf_counter()
+			writer.write(request)
+			try:
+				status_line = await asyncio.wait_for(_read_response(reader), timeout)
+			except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as exc:
+				# Drop the connection; the remaining requests go to the others
+				errors.append(repr(exc))
+				return
+			latencies.append((time.perf_counter() - started) * 1000)
+			if status_line.split()[1:2] not in ([b"201"], [b"202"]):
+				errors.append(status_line.decode().strip())
+	finally:
+		writer.close()
+
+
+async def drive(url, api_key, concurrency, total, timeout=10):
+	parts = urlsplit(url)
+	body = json.dumps(PAYLOAD).encode()
+	headers = f"X-API-KEY: {api_key}\r\n"
+	counter, latencies, errors = [total], [], []
+	started = time.perf_counter()
+	await asyncio.gather(
+		*[
+			_worker(parts.hostname, parts.port or 80, parts.path, headers, body, counter, latencies, errors, timeout)
+			for _ in range(concurrency)
+		]
+	)
+	elapsed = time.perf_counter() - started
+	if errors:
+		print(f"first error: {errors[0]}", file=sys.stderr)
+	return {"errors": len(errors), **latency_stats(latencies, elapsed)}
+
+
+def _free_port():
+	with socket.socket() as sock:
+		sock.bind(("127.0.0.1", 0))
+		return sock.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=30):
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		try:
+			socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+			return
+		except OSError:
+			time.sleep(0.2)
+	raise RuntimeError(f"server on port {port} did not start")
+
+
+def prepare_env():
+	workdir = tempfile.mkdtemp()
+	env = dict(
+		os.environ,
+		DJANGO_SETTINGS_MODULE="analytic_api.settings",
+		DEBUG="false",
+		DB_VENDOR="sqlite",
+		SQLITE_PATH=os.path.join(workdir, "bench.sqlite3"),
+		INGEST_MODE="queue",
+		INGEST_SPOOL_DIR=os.path.join(workdir, "spool"),
+		COLLECT_THROTTLE_RATE="1000000/second",
+		SERVE_STATIC="false",
+	)
+	env.pop("REDIS_URL", None)
+	script = (
+		"import django; django.setup();"
+		"from django.core.management import call_command; call_command('migrate', verbosity=0);"
+		"from django.contrib.auth.models import User; from apps.accounts.models import ClientApp;"
+		"owner = User.objects.create_user(username='bench');"
+		"print(ClientApp.objects.create(owner=owner, name='bench').api_key)"
+	)
+	api_key = subprocess.check_output([sys.executable, "-c", script], cwd=ROOT, env=env, text=True).strip()
+	return env, api_key
+
+
+def servers(workers, threads):
+	return {
+		"wsgi_gunicorn": lambda port: [
+			sys.executable, "-m", "gunicorn", "analytic_api.wsgi:application", "--bind", f"127.0.0.1:{port}",
+			"--workers", str(workers), "--worker-class", "gthread", "--threads", str(threads), "--log-level", "warning",
+		],
+		"asgi_uvicorn": lambda port: [
+			sys.executable, "-m", "uvicorn", "analytic_api.asgi:application", "--host", "127.0.0.1", "--port", str(port),
+			"--workers", str(workers), "--no-access-log", "--log-level", "warning",
+		],
+	}
+
+
+def compare(args):
+	env, api_key = prepare_env()
+	results = {}
+	for label, command in servers(args.workers, args.threads).items():
+		port = _free_port()
+		mode_env = dict(env, COLLECT_ASYNC="true" if label.startswith("asgi") else "false")
+		proc = subprocess.Popen(command(port), cwd=ROOT, env=mode_env)
+		try:
+			_wait_for_port(port)
+			url = f"http://127.0.0.1:{port}/api/analytics/collect"
+			asyncio.run(drive(url, api_key, args.concurrency, min(args.requests, 500)))  # warm-up
+			results[label] = asyncio.run(drive(url, api_key, args.concurrency, args.requests))
+		finally:
+			proc.terminate()
+			proc.wait()
+	return results
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Load test the collect endpoint.")
+	parser.add_argument("--url", default="http://127.0.0.1:8000/api/analytics/collect")
+	parser.add_argument("--api-key")
+	parser.add_argument("--concurrency", type=int, default=100)
+	parser.add_argument("--requests", type=int, default=10000)
+	parser.add_argument("--compare", action="store_true", help="start and compare WSGI and ASGI servers")
+	parser.add_argument("--workers", type=int, default=1)
+	parser.add_argument("--threads", type=int, default=8)
+	parser.add_argument("--output", help="result JSON path (default benchmarks/results/)")
+	args = parser.parse_args()
+
+	if args.compare:
+		results = compare(args)
+	else:
+		if not args.api_key:
+			parser.error("--api-key is required unless --compare is given")
+		results = {"collect": asyncio.run(drive(args.url, args.api_key, args.concurrency, args.requests))}
+	for label, result in results.items():
+		print(f"{label}: " + ", ".join(f"{k}={v}" for k, v in result.items()))
+	params = {k: v for k, v in vars(args).items() if k != "api_key"}
+	print(f"results: {write_results('collect_load', results, params, args.output)}")
+
+
+if __name__ == "__main__":
+	main()
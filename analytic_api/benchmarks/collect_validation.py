@@ -0,0 +1,59 @@
+# Compares per-event validation cost of the EventSerializer path with the cached
+# EventValidator used by the collect endpoints. No database access is needed.
+#
+#   python -m benchmarks.collect_validation --events 20000
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def payloads(count):
+	rng = random.Random(42)
+	pages = [f"https://example.com/{name}" for name in ("", "pricing", "docs/start", "blog/post?id=3", "signup")]
+	browsers = ["Chrome", "Firefox", "Safari"]
+	return [
+		{
+			"event": rng.choice(["page_view", "signup", "login_form_cta_click"]),
+			"url": rng.choice(pages),
+			"referrer": "https://google.com",
+			"device": rng.choice(["mobile", "desktop"]),
+			"timestamp": f"2024-02-{rng.randrange(1, 29):02d}T12:{rng.randrange(60):02d}:56Z",
+			"metadata": {"browser": rng.choice(browsers), "os": "Android", "screenSize": "1080x1920"},
+			"user_id": f"user{rng.randrange(count)}",
+		}
+		for _ in range(count)
+	]
+
+
+def rate(fn, items):
+	started = time.perf_counter()
+	for item in items:
+		fn(item, "10.1.2.3")
+	return len(items) / (time.perf_counter() - started)
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Compare collect validation paths.")
+	parser.add_argument("--events", type=int, default=20000)
+	args = parser.parse_args()
+
+	os.environ.setdefault("DJANGO_SETTINGS_MODULE", "analytic_api.settings")
+	import django
+
+	django.setup()
+	from apps.analytics.ingest import prepare_event, validate_with_serializer
+
+	items = payloads(args.events)
+	slow = rate(validate_with_serializer, items)
+	fast = rate(prepare_event, items)
+	print(f"EventSerializer: {slow:,.0f} events/s")
+	print(f"EventValidator:  {fast:,.0f} events/s ({fast / slow:.1f}x)")
+
+
+if __name__ == "__main__":
+	main()
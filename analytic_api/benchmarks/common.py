@@ -0,0 +1,76 @@
+# Shared helpers for the benchmark scripts: Django setup against a throwaway
+# database, latency statistics and JSON result files.
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+sys.path.insert(0, str(ROOT))
+
+
+def setup_django(use_configured_db=False, sqlite_path=None, migrate=True):
+	os.environ.setdefault("DJANGO_SETTINGS_MODULE", "analytic_api.settings")
+	if not use_configured_db:
+		os.environ["DB_VENDOR"] = "sqlite"
+		os.environ["SQLITE_PATH"] = str(sqlite_path or Path(tempfile.mkdtemp()) / "bench.sqlite3")
+	import django
+
+	django.setup()
+	if migrate:
+		from django.core.management import call_command
+
+		call_command("migrate", verbosity=0)
+
+
+def percentile(samples, q):
+	ordered = sorted(samples)
+	return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def latency_stats(samples_ms, elapsed=None):
+	# samples in milliseconds; rps from wall time when given, else from the sum
+	if not samples_ms:
+		return {"count": 0}
+	total = elapsed if elapsed is not None else sum(samples_ms) / 1000
+	return {
+		"count": len(samples_ms),
+		"rps": round(len(samples_ms) / total, 1) if total else None,
+		"mean_ms": round(statistics.fmean(samples_ms), 3),
+		"p50_ms": round(percentile(samples_ms, 0.50), 3),
+		"p95_ms": round(percentile(samples_ms, 0.95), 3),
+		"p99_ms": round(percentile(samples_ms, 0.99), 3),
+		"max_ms": round(max(samples_ms), 3),
+	}
+
+
+def _git_revision():
+	try:
+		return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def write_results(name, results, params, output=None):
+	# One JSON document per run; compare runs with `python -m benchmarks.compare`
+	document = {
+		"benchmark": name,
+		"created_at": datetime.now(dt_timezone.utc).isoformat(),
+		"revision": _git_revision(),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"cpus": os.cpu_count(),
+		"params": params,
+		"results": results,
+	}
+	if output is None:
+		RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+		output = RESULTS_DIR / f"{name}-{datetime.now():%Y%m%d-%H%M%S}.json"
+	Path(output).write_text(json.dumps(document, indent=2, default=str))
+	return output
@@ -0,0 +1,58 @@
+# Compares two benchmark result files written by the same benchmark and flags
+# metrics that got worse by more than --threshold percent. Exits with status 1
+# when there is a regression, so it can gate CI.
+#
+#   python -m benchmarks.compare benchmarks/results/endpoints-A.json benchmarks/results/endpoints-B.json
+import argparse
+import json
+import sys
+
+# Metrics where a larger value is better; for the rest (latencies, durations) smaller is
+HIGHER_IS_BETTER = {"rps", "rows_per_second"}
+# Counters, and max latency which is too noisy to gate on
+IGNORED = {"count", "rows", "errors", "max_ms"}
+
+
+def compare(baseline, candidate, threshold):
+	# Returns [(case, metric, before, after, change %, regressed)]
+	rows = []
+	for case, before_metrics in baseline["results"].items():
+		after_metrics = candidate["results"].get(case)
+		if not isinstance(after_metrics, dict):
+			continue
+		for metric, before in before_metrics.items():
+			after = after_metrics.get(metric)
+			if metric in IGNORED or not isinstance(before, (int, float)) or not isinstance(after, (int, float)) or not before:
+				continue
+			change = (after - before) / before * 100
+			worse = -change if metric in HIGHER_IS_BETTER else change
+			rows.append((case, metric, before, after, change, worse > threshold))
+	return rows
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+	parser.add_argument("baseline")
+	parser.add_argument("candidate")
+	parser.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown in percent")
+	args = parser.parse_args()
+
+	with open(args.baseline) as fh:
+		baseline = json.load(fh)
+	with open(args.candidate) as fh:
+		candidate = json.load(fh)
+	if baseline["benchmark"] != candidate["benchmark"]:
+		parser.error(f"cannot compare {baseline['benchmark']} with {candidate['benchmark']}")
+
+	print(f"{baseline['benchmark']}: {baseline.get('revision')} -> {candidate.get('revision')}")
+	rows = compare(baseline, candidate, args.threshold)
+	for case, metric, before, after, change, regressed in rows:
+		flag = "  REGRESSION" if regressed else ""
+		print(f"{case:34} {metric:16} {before:>12} -> {after:<12} {change:+7.1f}%{flag}")
+	regressions = sum(1 for row in rows if row[-1])
+	print(f"{regressions} regression(s) beyond {args.threshold}%")
+	sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+	main()
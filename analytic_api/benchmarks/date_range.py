@@ -0,0 +1,87 @@
+# Compares the old `timestamp__date` filters with the half-open timestamp range
+# used by event-summary. Seeds a throwaway SQLite database (or the configured
+# database with --use-configured-db) and prints query plans and timings.
+#
+#   python -m benchmarks.date_range --rows 500000
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.common import setup_django  # noqa: E402
+
+
+def seed(rows, apps, days):
+	from django.contrib.auth.models import User
+	from apps.accounts.models import ClientApp
+	from apps.analytics.dictionary import encode_items
+	from apps.analytics.models import Event
+
+	owner, _ = User.objects.get_or_create(username="bench-owner")
+	client_apps = [ClientApp.objects.create(owner=owner, name=f"bench-{i}") for i in range(apps)]
+	names = ["page_view", "signup", "login_form_cta_click", "purchase", "scroll"]
+	devices = ["mobile", "desktop", "tablet"]
+	start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+	rng = random.Random(42)
+	batch = []
+	for i in range(rows):
+		batch.append(
+			{
+				"app": rng.choice(client_apps),
+				"event": rng.choice(names),
+				"device": rng.choice(devices),
+				"user_id": f"user-{rng.randrange(rows // 10 or 1)}",
+				"timestamp": start + timedelta(seconds=rng.randrange(days * 86400)),
+			}
+		)
+		if len(batch) == 10000:
+			Event.objects.bulk_create([Event(**item) for item in encode_items(batch)])
+			batch = []
+	Event.objects.bulk_create([Event(**item) for item in encode_items(batch)])
+	return owner, client_apps[0]
+
+
+def timed(fn, repeat):
+	samples = []
+	for _ in range(repeat):
+		started = time.perf_counter()
+		fn()
+		samples.append((time.perf_counter() - started) * 1000)
+	return statistics.median(samples)
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Compare date-cast and half-open range filters.")
+	parser.add_argument("--rows", type=int, default=200000)
+	parser.add_argument("--apps", type=int, default=5)
+	parser.add_argument("--days", type=int, default=365)
+	parser.add_argument("--repeat", type=int, default=5)
+	parser.add_argument("--use-configured-db", action="store_true")
+	args = parser.parse_args()
+
+	setup_django(args.use_configured_db)
+	from apps.analytics.dateranges import date_range, filter_range
+	from apps.analytics.dictionary import filter_value
+	from apps.analytics.models import Event
+
+	print(f"seeding {args.rows} events ...")
+	_, app = seed(args.rows, args.apps, args.days)
+	start, end = date(2024, 3, 1), date(2024, 3, 7)
+	base = filter_value(Event.objects.filter(app=app), "event", "page_view")
+	variants = {
+		"timestamp__date": base.filter(timestamp__date__gte=start, timestamp__date__lte=end),
+		"half-open range": filter_range(base, *date_range(start, end, dt_timezone.utc)),
+	}
+	for label, qs in variants.items():
+		print(f"\n== {label}")
+		print(qs.explain())
+		print(f"count={qs.count()} median={timed(qs.count, args.repeat):.2f}ms")
+
+
+if __name__ == "__main__":
+	main()
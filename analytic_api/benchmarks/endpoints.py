@@ -0,0 +1,112 @@
+# In-process micro-benchmarks of the collect, event-summary and user-stats
+# views through Django's test client (full middleware + DRF stack, no network).
+# Seeds its own dataset unless --reuse-db points at one from benchmarks.generate.
+# event-summary and user-stats are measured both recomputed on every call
+# ("cold") and served from the response cache ("cached").
+#
+#   python -m benchmarks.endpoints --rows 200000 --iterations 300
+#   python -m benchmarks.generate --rows 2000000 --sqlite-path /tmp/bench.sqlite3 --with-aggregates
+#   python -m benchmarks.endpoints --reuse-db /tmp/bench.sqlite3
+import argparse
+import os
+import random
+import time
+from datetime import date, timedelta
+
+from benchmarks.common import latency_stats, setup_django, write_results
+
+UNLIMITED = "1000000/second"
+
+
+def measure(call, iterations, warmup=10):
+	for _ in range(warmup):
+		call()
+	samples = []
+	for _ in range(iterations):
+		started = time.perf_counter()
+		response = call()
+		samples.append((time.perf_counter() - started) * 1000)
+		if response.status_code >= 400:
+			raise RuntimeError(f"{response.status_code}: {response.content[:200]!r}")
+	return latency_stats(samples)
+
+
+def run(iterations, days, seed=7):
+	from django.contrib.auth.models import User
+	from django.test import Client, override_settings
+	from apps.accounts.models import ClientApp
+	from benchmarks.generate import OWNER
+
+	rng = random.Random(seed)
+	owner = User.objects.get(username=OWNER)
+	app = ClientApp.objects.filter(owner=owner).order_by("id").first()
+	client = Client()
+	client.force_login(owner)
+
+	start = date(2024, 1, 1)
+	week = {"startDate": start + timedelta(days=days // 2), "endDate": start + timedelta(days=days // 2 + 6)}
+	users = [f"user-{rng.randrange(100)}" for _ in range(64)]
+	collect_body = {
+		"event": "page_view",
+		"url": "https://example.com/pricing",
+		"device": "mobile",
+		"metadata": {"browser": "Chrome", "os": "Android"},
+		"user_id": "bench-user",
+	}
+	cases = {
+		"collect": lambda: client.post(
+			"/api/analytics/collect", collect_body, content_type="application/json", HTTP_X_API_KEY=app.api_key
+		),
+		"collect_batch_50": lambda: client.post(
+			"/api/analytics/collect/batch", [collect_body] * 50, content_type="application/json", HTTP_X_API_KEY=app.api_key
+		),
+		"event_summary_all_time": lambda: client.get("/api/analytics/event-summary", {"event": "page_view"}),
+		"event_summary_week": lambda: client.get("/api/analytics/event-summary", {"event": "page_view", **week}),
+		"event_summary_week_approx": lambda: client.get(
+			"/api/analytics/event-summary", {"event": "page_view", "approx": "true", **week}
+		),
+		"user_stats": lambda: client.get("/api/analytics/user-stats", {"userId": rng.choice(users)}),
+	}
+	results = {}
+	for name, call in cases.items():
+		if name.startswith("collect"):
+			results[name] = measure(call, iterations)
+			continue
+		# A zero TTL makes every cached entry stale, so each call recomputes
+		with override_settings(ANALYTICS_CACHE_TTL=0):
+			results[f"{name}_cold"] = measure(call, max(1, iterations // 5), warmup=1)
+		results[f"{name}_cached"] = measure(call, iterations)
+	return results
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Micro-benchmark analytics views in-process.")
+	parser.add_argument("--rows", type=int, default=100000, help="events to seed when not reusing a database")
+	parser.add_argument("--apps", type=int, default=20)
+	parser.add_argument("--days", type=int, default=90)
+	parser.add_argument("--iterations", type=int, default=200)
+	parser.add_argument("--reuse-db", help="SQLite database seeded by benchmarks.generate")
+	parser.add_argument("--use-configured-db", action="store_true")
+	parser.add_argument("--output", help="result JSON path (default benchmarks/results/)")
+	args = parser.parse_args()
+
+	os.environ.setdefault("DEBUG", "false")
+	os.environ.setdefault("SERVE_STATIC", "false")
+	for name in ("COLLECT_THROTTLE_RATE", "ANALYTICS_THROTTLE_RATE", "USER_THROTTLE_RATE", "ANON_THROTTLE_RATE"):
+		os.environ[name] = UNLIMITED
+	setup_django(args.use_configured_db, args.reuse_db)
+	if not args.reuse_db and not args.use_configured_db:
+		from benchmarks.generate import build_aggregates, generate
+
+		print(f"seeding {args.rows} events ...")
+		generate(args.rows, args.apps, users=args.rows // 10, days=args.days)
+		build_aggregates(date(2024, 1, 1), args.days)
+
+	results = run(args.iterations, args.days)
+	for name, stats in results.items():
+		print(f"{name:32} " + "  ".join(f"{k}={v}" for k, v in stats.items()))
+	print(f"results: {write_results('endpoints', results, vars(args), args.output)}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,161 @@
+# Seeds realistic synthetic events: a few large apps and a long tail (Zipf),
+# skewed event names, power-law user activity, device-consistent browser/os
+# metadata and a daily traffic curve. With --sqlite-path the database is kept
+# so the other benchmarks can reuse it (--reuse-db).
+#
+#   python -m benchmarks.generate --rows 2000000 --apps 200 --sqlite-path /tmp/bench.sqlite3 --with-aggregates
+import argparse
+import random
+import time
+from itertools import accumulate
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from benchmarks.common import setup_django, write_results
+
+OWNER = "bench-owner"
+PASSWORD = "bench-password"
+EVENTS = [("page_view", 60), ("click", 18), ("scroll", 10), ("login", 5), ("signup", 3), ("add_to_cart", 3), ("purchase", 1)]
+DEVICES = {
+	"mobile": (55, [("Chrome", "Android"), ("Safari", "iOS"), ("Samsung Internet", "Android")]),
+	"desktop": (40, [("Chrome", "Windows"), ("Edge", "Windows"), ("Safari", "macOS"), ("Firefox", "Linux")]),
+	"tablet": (5, [("Safari", "iPadOS"), ("Chrome", "Android")]),
+}
+# Share of traffic per UTC hour: quiet nights, busy afternoons
+HOURS = [2, 1, 1, 1, 1, 2, 3, 5, 6, 7, 7, 7, 8, 8, 8, 7, 7, 6, 6, 5, 5, 4, 3, 2]
+PATHS = ["/", "/pricing", "/docs", "/blog", "/signup", "/login", "/cart", "/checkout", "/features", "/about"]
+REFERRERS = ["", "https://google.com/", "https://twitter.com/", "https://news.ycombinator.com/", "https://bing.com/"]
+ANONYMOUS_SHARE = 0.15
+ROW_FIELDS = [
+	"app", "event_ref", "url_ref", "referrer_ref", "device_ref", "ip_address", "timestamp", "metadata", "user_id", "event_id",
+	"created_at",
+]
+
+
+def zipf_weights(count, s=1.1):
+	return [1 / (rank ** s) for rank in range(1, count + 1)]
+
+
+def _picker(rng, population, weights):
+	cum_weights = list(accumulate(weights))
+	population = list(population)
+	return lambda: rng.choices(population, cum_weights=cum_weights)[0]
+
+
+def event_rows(rng, apps, users_per_app, start, days):
+	# Cumulative weights are computed once; rng.choices would redo it per call
+	names, name_weights = zip(*EVENTS)
+	devices = list(DEVICES)
+	pick_app = _picker(rng, apps, zipf_weights(len(apps)))
+	pick_name = _picker(rng, names, name_weights)
+	pick_device = _picker(rng, devices, [DEVICES[d][0] for d in devices])
+	pick_hour = _picker(rng, range(24), HOURS)
+	while True:
+		app = pick_app()
+		device = pick_device()
+		browser, os_name = rng.choice(DEVICES[device][1])
+		day = rng.randrange(days)
+		hour = pick_hour()
+		timestamp = start + timedelta(days=day, hours=hour, seconds=rng.randrange(3600), microseconds=rng.randrange(10**6))
+		# Power law: a small share of users produce most events
+		user = "" if rng.random() < ANONYMOUS_SHARE else f"user-{int(users_per_app * rng.random() ** 3)}"
+		path = PATHS[min(len(PATHS) - 1, int(len(PATHS) * rng.random() ** 2))]
+		yield {
+			"app_id": app.id,
+			"event": pick_name(),
+			"url": f"https://app{app.id}.example.com{path}",
+			"referrer": rng.choice(REFERRERS),
+			"device": device,
+			"ip_address": f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+			"timestamp": timestamp,
+			"metadata": {"browser": browser, "os": os_name, "screenSize": rng.choice(["1080x1920", "1920x1080", "1440x900"])},
+			"user_id": user,
+			"event_id": "",
+		}
+
+
+def generate(rows, apps=50, users=100000, days=90, seed=42, batch_size=20000, start=date(2024, 1, 1), progress=True):
+	# Returns (owner, apps); the owner logs in with PASSWORD
+	from django.contrib.auth.models import User
+	from apps.accounts.models import ClientApp
+	from apps.analytics import dictionary
+	from apps.analytics.models import Event
+
+	from django.db import connection, transaction
+	from django.utils import timezone
+
+	rng = random.Random(seed)
+	owner, created = User.objects.get_or_create(username=OWNER)
+	if created:
+		owner.set_password(PASSWORD)
+		owner.save()
+	client_apps = [ClientApp.objects.create(owner=owner, name=f"bench-{i}") for i in range(apps)]
+	start_at = datetime(start.year, start.month, start.day, tzinfo=dt_timezone.utc)
+	source = event_rows(rng, client_apps, max(1, users // apps), start_at, days)
+	# Plain executemany; per-object ORM overhead would dominate at millions of rows
+	fields = [Event._meta.get_field(name) for name in ROW_FIELDS]
+	qn = connection.ops.quote_name
+	sql = (
+		f"INSERT INTO {qn(Event._meta.db_table)} ({', '.join(qn(f.column) for f in fields)}) "
+		f"VALUES ({', '.join(['%s'] * len(fields))})"
+	)
+	written = 0
+	started = time.perf_counter()
+	while written < rows:
+		count = min(batch_size, rows - written)
+		now = timezone.now()
+		params = []
+		# Strings become dimension table ids, as at ingest
+		for row in dictionary.encode_items([next(source) for _ in range(count)]):
+			row["created_at"] = now
+			for field in fields:
+				if field.is_relation and field.name in row:
+					row[field.attname] = row[field.name].pk if row[field.name] else None
+			params.append([f.get_db_prep_save(row[f.attname], connection) for f in fields])
+		with transaction.atomic(), connection.cursor() as cursor:
+			cursor.executemany(sql, params)
+		written += count
+		if progress:
+			rate = written / (time.perf_counter() - started)
+			print(f"\r{written:,}/{rows:,} events ({rate:,.0f}/s)", end="", flush=True)
+	if progress:
+		print()
+	return owner, client_apps
+
+
+def build_aggregates(start, days):
+	# Ingestion maintains rollups and profiles; bulk seeding has to rebuild them
+	from apps.analytics import profiles, rollups
+
+	rollups.rebuild(start, start + timedelta(days=days - 1))
+	profiles.rebuild()
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Seed synthetic analytics events.")
+	parser.add_argument("--rows", type=int, default=1000000)
+	parser.add_argument("--apps", type=int, default=50)
+	parser.add_argument("--users", type=int, default=100000, help="distinct users across all apps")
+	parser.add_argument("--days", type=int, default=90)
+	parser.add_argument("--seed", type=int, default=42)
+	parser.add_argument("--batch-size", type=int, default=20000)
+	parser.add_argument("--with-aggregates", action="store_true", help="rebuild rollups and user profiles afterwards")
+	parser.add_argument("--sqlite-path", help="keep the SQLite database here instead of a temp dir")
+	parser.add_argument("--use-configured-db", action="store_true")
+	parser.add_argument("--output", help="result JSON path (default benchmarks/results/)")
+	args = parser.parse_args()
+
+	setup_django(args.use_configured_db, args.sqlite_path)
+	started = time.perf_counter()
+	generate(args.rows, args.apps, args.users, args.days, args.seed, args.batch_size)
+	seeded = time.perf_counter() - started
+	results = {"seed": {"rows": args.rows, "seconds": round(seeded, 2), "rows_per_second": round(args.rows / seeded, 1)}}
+	if args.with_aggregates:
+		started = time.perf_counter()
+		build_aggregates(date(2024, 1, 1), args.days)
+		results["aggregates"] = {"seconds": round(time.perf_counter() - started, 2)}
+	print(results)
+	print(f"results: {write_results('generate', results, vars(args), args.output)}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,20 @@
+# Picked up automatically by gunicorn from the working directory.
+# With PROMETHEUS_MULTIPROC_DIR set, each worker writes its metrics to files in
+# that directory and /metrics aggregates them across workers.
+import os
+import shutil
+
+
+def on_starting(server):
+	# Samples left by a previous run would be added to the new totals
+	path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+	if path:
+		shutil.rmtree(path, ignore_errors=True)
+		os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+	if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+		from prometheus_client import multiprocess
+
+		multiprocess.mark_process_dead(worker.pid)